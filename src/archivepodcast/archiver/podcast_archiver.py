@@ -8,23 +8,32 @@ import xml.etree.ElementTree as ET
 from typing import TYPE_CHECKING
 
 import aiohttp
+from anyio import Path as AsyncPath
 from pydantic import BaseModel
 
 from archivepodcast.constants import XML_ENCODING
 from archivepodcast.downloader import PodcastsDownloader
 from archivepodcast.downloader.constants import USER_AGENT
+from archivepodcast.downloader.feed_state import FeedState, get_podcast_config_hash, load_feed_state, save_feed_state
 from archivepodcast.downloader.helpers import tree_no_episodes
+from archivepodcast.downloader.hls import HLS_DIRECTORY_NAME, HLSBuilder
+from archivepodcast.downloader.renditions import RenditionBuilder, get_lite_feed_name
+from archivepodcast.downloader.scheduler import DownloadScheduler
+from archivepodcast.downloader.transcoder import TranscodePool
+from archivepodcast.downloader.waveforms import WaveformBuilder
 from archivepodcast.instances.health import health
+from archivepodcast.instances.manifest import asset_manifest
 from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.instances.profiler import event_times
 from archivepodcast.utils.logger import get_logger
-from archivepodcast.utils.s3 import s3_get, s3_put
+from archivepodcast.utils.s3 import S3_STATE_PREFIX, S3File, close_s3_client, get_s3_etag, s3_get, s3_put
 
 from .webpage_renderer import WebpageRenderer
 
 if TYPE_CHECKING:
     from archivepodcast.config import AppConfig, PodcastConfig  # pragma: no cover
+    from archivepodcast.downloader.episode_assets import EpisodeAssetBuilder
 else:
     AppConfig = object
     PodcastConfig = object
@@ -56,6 +65,24 @@ def _load_cached_feed(podcast: PodcastConfig, previous_feed: bytes) -> ET.Elemen
     return tree
 
 
+def _is_listed(key: str) -> bool:
+    """Check if a file belongs in the file list, the archiver's own state and the HLS segments of episodes don't."""
+    return not key.startswith(S3_STATE_PREFIX) and f"/{HLS_DIRECTORY_NAME}/" not in key
+
+
+async def _refresh_s3_file_cache(podcast: PodcastConfig, s3_bucket: str) -> None:
+    """List the podcast's feed prefix, its content comes from the manifest unless that is due a reconciliation."""
+    content_prefix = f"content/{podcast.name_one_word}/"
+    if asset_manifest.needs_reconcile(content_prefix):
+        await s3_file_cache.refresh_prefixes(s3_bucket, ["rss/", content_prefix])
+        asset_manifest.reconcile(content_prefix, s3_file_cache.get_prefix(content_prefix))
+        return
+
+    logger.debug("[%s] Loading content list from the manifest instead of s3", podcast.name_one_word)
+    s3_file_cache.load_prefix(content_prefix, asset_manifest.get_prefix_objects(content_prefix))
+    await s3_file_cache.refresh_prefixes(s3_bucket, ["rss/"])
+
+
 class APFileList(BaseModel):
     """Podcast file list response model."""
 
@@ -122,6 +149,12 @@ class PodcastArchiver:
         """Load the config from the config file."""
         self._app_config = app_config
         self.podcast_list = podcast_list
+        self._download_scheduler = DownloadScheduler.from_config(app_config.download)
+        self._transcode_pool = TranscodePool.from_config(app_config.download)
+        # Hashed as loaded, processing a feed fills in details like the podcast's new name
+        self._config_hashes = {
+            podcast.name_one_word: get_podcast_config_hash(podcast, app_config) for podcast in podcast_list
+        }
         self._make_folder_structure()
 
     # region Getters
@@ -147,7 +180,11 @@ class PodcastArchiver:
         # import aiomonitor  # ruff: ignore[commented-out-code]
         # with aiomonitor.start_monitor(event_loop):
         # Part 1: Update the file cache to know what files we have already downloaded
-        event_loop.run_until_complete(self.update_file_cache())
+        # In s3 mode each podcast lists its own prefixes when it starts instead, so none wait on the whole bucket
+        if self.s3:
+            event_loop.run_until_complete(asset_manifest.load_from_s3(self._app_config.s3.bucket))
+        else:
+            event_loop.run_until_complete(self.update_file_cache())
         event_times.set_event_time("grab_podcasts/Update file cache", time.time() - grab_podcasts_start_time)
 
         # Part 2: Download and process all podcasts
@@ -177,6 +214,9 @@ class PodcastArchiver:
 
         # Run Tasks
         event_loop.run_until_complete(asyncio.gather(*cleanup_tasks))
+        if self.s3:
+            event_loop.run_until_complete(asset_manifest.save_to_s3(self._app_config.s3.bucket))
+        event_loop.run_until_complete(close_s3_client())  # After everything else, since they may still use it
         event_loop.close()
         event_times.set_event_time("grab_podcasts/Post Scrape", time.time() - cleanup_start_time)
 
@@ -209,8 +249,23 @@ class PodcastArchiver:
 
         logger.info("[%s] Processing podcast to archive: %s", podcast.name_one_word, podcast.new_name)
 
+        s3_bucket = self._app_config.s3.bucket if self.s3 else None
+        if s3_bucket:
+            await _refresh_s3_file_cache(podcast, s3_bucket)
+
         previous_feed = await self._get_previous_feed(podcast)
-        tree = await self._download_live_podcast(podcast, aiohttp_session) if podcast.live else None
+
+        # A conditional fetch is only safe if there is a previous feed to serve in its place
+        feed_state = await load_feed_state(podcast.name_one_word, s3_bucket) if podcast.live else FeedState()
+        new_feed_state = feed_state.model_copy() if previous_feed else FeedState()
+
+        tree = (
+            await self._download_live_podcast(
+                podcast, aiohttp_session, previous_feed=previous_feed, feed_state=new_feed_state
+            )
+            if podcast.live
+            else None
+        )
 
         if not podcast.live:
             logger.info(
@@ -232,6 +287,14 @@ class PodcastArchiver:
             tree = _load_cached_feed(podcast, previous_feed)
 
         await self._process_podcast_tree(podcast, tree, previous_feed)
+        if tree is not None and podcast.lite_rendition:
+            await self._update_lite_feed(podcast, tree)
+        if tree is not None:
+            await self._build_webplayer_assets(podcast, tree)
+
+        if tree is not None and new_feed_state != feed_state:
+            await save_feed_state(podcast.name_one_word, new_feed_state, s3_bucket)
+
         logger.trace("Exiting _grab_podcast for %s", podcast.name_one_word)
 
     # region _grab helpers
@@ -289,17 +352,34 @@ class PodcastArchiver:
                 logger.exception("Unhandled s3 error trying to upload the file: %s", backup_filename)
 
     async def _download_live_podcast(
-        self, podcast: PodcastConfig, aiohttp_session: aiohttp.ClientSession
+        self,
+        podcast: PodcastConfig,
+        aiohttp_session: aiohttp.ClientSession,
+        previous_feed: bytes = b"",
+        feed_state: FeedState | None = None,
     ) -> ET.ElementTree[ET.Element] | None:
-        """Download live podcast and update health status."""
+        """Download live podcast and update health status.
+
+        If the upstream feed hasn't changed since the feed state, the previous feed is returned instead.
+        """
         podcasts_downloader = PodcastsDownloader(
             podcast=podcast,
             app_config=self._app_config,
             s3=self.s3,
             aiohttp_session=aiohttp_session,
+            download_scheduler=self._download_scheduler,
+            transcode_pool=self._transcode_pool,
+            feed_state=feed_state,
+            config_hash=self._config_hashes.get(podcast.name_one_word, ""),
         )
 
         tree = await podcasts_downloader.download_podcast()
+        if podcasts_downloader.feed_unchanged:
+            logger.debug("[%s] Upstream feed unchanged, using the previous feed", podcast.name_one_word)
+            tree = _load_cached_feed(podcast, previous_feed)
+            if tree is not None:
+                await podcasts_downloader.process_cached_feed(tree)
+
         if tree:
             last_fetched = int(time.time())
             health.update_podcast_status(podcast.name_one_word, rss_fetching_live=True, last_fetched=last_fetched)
@@ -338,33 +418,19 @@ class PodcastArchiver:
             }
         )
 
-        # Check the length of the feed in s3
+        # Compare the feed with the one in s3 by ETag, so an edit that keeps the size the same still gets uploaded
         local_changes_to_feed = self.podcast_rss[podcast.name_one_word] != previous_feed
         need_to_upload_to_s3 = False
+        feed_etag = ""
         if self.s3:
             logger.trace("S3 Check upload")
-            # So this only checks the size,
-            # the generated time of rss feeds shouldn't affect the size due to how the time is formatted
-            # see <pubDate> or <lastBuildDate> in an rss feed that has it
-            if not s3_file_cache.check_file_exists(
-                key="rss/" + podcast.name_one_word,
-                size=len(self.podcast_rss[podcast.name_one_word]),
-            ):
+            feed_etag = get_s3_etag(self.podcast_rss[podcast.name_one_word])
+            if not s3_file_cache.check_file_exists(key="rss/" + podcast.name_one_word, etag=feed_etag):
                 need_to_upload_to_s3 = True
 
         # Upload to s3 if we are in s3 mode
         if need_to_upload_to_s3:
-            try:
-                logger.trace("Uploading feed %s to s3...", podcast.name_one_word)
-                await s3_put(
-                    self._app_config.s3.bucket,
-                    "rss/" + podcast.name_one_word,
-                    self.podcast_rss[podcast.name_one_word],
-                    "application/rss+xml",
-                )
-                logger.debug("[%s] Uploaded feed to s3", podcast.name_one_word)
-            except Exception:
-                logger.exception("Unhandled s3 error trying to upload the file: %s", podcast.name_one_word)
+            await self._upload_feed_s3(podcast.name_one_word, feed_etag)
 
         msg = "no feed changes"
         if not self.s3 and local_changes_to_feed:
@@ -383,6 +449,65 @@ class PodcastArchiver:
         health.update_podcast_status(podcast.name_one_word, rss_available=True)
         logger.trace("Exiting _update_rss_feed")
 
+    async def _upload_feed_s3(self, feed_name: str, feed_etag: str) -> None:
+        """Upload a feed from memory to s3."""
+        try:
+            logger.trace("Uploading feed %s to s3...", feed_name)
+            await s3_put(
+                self._app_config.s3.bucket, "rss/" + feed_name, self.podcast_rss[feed_name], "application/rss+xml"
+            )
+            s3_file_cache.add_file(
+                S3File(key="rss/" + feed_name, size=len(self.podcast_rss[feed_name]), etag=feed_etag)
+            )
+            logger.debug("[%s] Uploaded feed to s3", feed_name)
+        except Exception:
+            logger.exception("Unhandled s3 error trying to upload the file: %s", feed_name)
+
+    async def _update_lite_feed(self, podcast: PodcastConfig, tree: ET.ElementTree[ET.Element]) -> None:
+        """Publish the lite feed, then build the missing renditions and publish it again if any were built.
+
+        Episodes point at the full size file until their rendition exists, so the lite feed is never held up.
+        """
+        renditions = RenditionBuilder(podcast, self._app_config, s3=self.s3, transcode_pool=self._transcode_pool)
+        await self._write_lite_feed(podcast, await renditions.get_lite_feed(tree))
+
+        start_time = time.time()
+        if await renditions.build(tree):
+            await self._write_lite_feed(podcast, await renditions.get_lite_feed(tree))
+        event_times.set_event_time(
+            f"grab_podcasts/Scrape/{podcast.name_one_word}/Lite renditions", time.time() - start_time
+        )
+
+    async def _build_webplayer_assets(self, podcast: PodcastConfig, tree: ET.ElementTree[ET.Element]) -> None:
+        """Build the waveforms and HLS playlists the webplayer uses for the episodes that don't have them yet."""
+        web_page_config = self._app_config.web_page
+        builders: list[tuple[str, type[EpisodeAssetBuilder]]] = []
+        if web_page_config.waveform_peaks:
+            builders.append(("Waveforms", WaveformBuilder))
+        if web_page_config.hls_playlists:
+            builders.append(("HLS playlists", HLSBuilder))
+
+        for event_name, builder in builders:
+            start_time = time.time()
+            await builder(podcast, self._app_config, s3=self.s3, transcode_pool=self._transcode_pool).build(tree)
+            event_times.set_event_time(
+                f"grab_podcasts/Scrape/{podcast.name_one_word}/{event_name}", time.time() - start_time
+            )
+
+    async def _write_lite_feed(self, podcast: PodcastConfig, lite_tree: ET.ElementTree[ET.Element]) -> None:
+        """Write the lite feed to memory and disk, uploading it if it changed in s3 mode."""
+        feed_name = get_lite_feed_name(podcast)
+        lite_feed = ET.tostring(lite_tree.getroot(), encoding=XML_ENCODING, method="xml", xml_declaration=True)
+        self.podcast_rss[feed_name] = lite_feed
+        await AsyncPath(get_app_paths().web_root / "rss" / feed_name).write_bytes(lite_feed)
+
+        if self.s3:
+            feed_etag = get_s3_etag(lite_feed)
+            if not s3_file_cache.check_file_exists(key="rss/" + feed_name, etag=feed_etag):
+                await self._upload_feed_s3(feed_name, feed_etag)
+
+        logger.debug("[%s] Hosted lite feed: %srss/%s", podcast.name_one_word, self._app_config.inet_path, feed_name)
+
     # region Housekeeping
     def _make_folder_structure(self) -> None:
         """Ensure that web_root folder structure exists."""
@@ -430,6 +555,7 @@ class PodcastArchiver:
             if self.s3
             else [str(path) for path in local_file_cache.get_all()]
         )
+        file_list = [file for file in file_list if _is_listed(file)]
 
         return APFileList(base_url=base_url.encoded_string(), files=file_list)
 
@@ -1,10 +1,11 @@
 """Module to render static webpages for ArchivePodcast."""
 
+import asyncio
 import json
 import mimetypes
 import time
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 import markdown
 from anyio import Path as AsyncPath
@@ -15,8 +16,8 @@ from archivepodcast.instances.health import health
 from archivepodcast.instances.path_cache import s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.instances.profiler import event_times
-from archivepodcast.utils.logger import get_logger
-from archivepodcast.utils.s3 import s3_delete, s3_put
+from archivepodcast.utils.logger import TRACE_LEVEL_NUM, get_logger
+from archivepodcast.utils.s3 import S3File, get_s3_etag, get_s3_prefix, s3_delete_many, s3_put
 
 from .webpages import Webpage, Webpages
 
@@ -35,6 +36,10 @@ logger = get_logger(__name__)
 mimetypes.knownfiles = []
 mimetypes.init()
 
+PAGE_WRITE_CONCURRENCY = 8  # Pages written and uploaded at once
+
+type PageWriteResult = Literal["written", "uploaded", "skipped", "failed"]
+
 TEMPLATE_ENV = Environment(loader=FileSystemLoader(str(APP_DIRECTORY / "templates")), autoescape=True)
 
 
@@ -181,60 +186,90 @@ class WebpageRenderer:
 
         event_times.set_event_time("grab_podcasts/Post Scrape/write_health_s3", time.time() - start_time)
 
+    async def _refresh_s3_file_cache(self, webpages: list[Webpage]) -> None:
+        """Refresh the s3 file cache for just the prefixes the pages are under, not the whole bucket."""
+        if not self._s3:
+            return
+
+        prefixes = {get_s3_prefix(Path(webpage.path).as_posix()) for webpage in webpages}
+        await s3_file_cache.refresh_prefixes(self._app_config.s3.bucket, prefixes)
+
     async def _write_webpages(self, webpages: list[Webpage], *, force_override: bool = False) -> None:
-        """Write files to disk, and to s3 if needed."""
-        app_paths = get_app_paths()
+        """Write files to disk, and to s3 if needed, PAGE_WRITE_CONCURRENCY pages at a time."""
         str_webpages = f"{(len(webpages))} pages to files"
         if len(webpages) == 1:
             str_webpages = f"{webpages[0].path} to file"
 
-        s3_pages_uploaded = []
-        s3_pages_skipped = []
+        await self._refresh_s3_file_cache(webpages)
 
-        for webpage in webpages:
-            webpage_path = Path(webpage.path)
-            directory_path = app_paths.web_root / webpage_path.parent
+        semaphore = asyncio.Semaphore(PAGE_WRITE_CONCURRENCY)
 
-            directory_path.mkdir(parents=True, exist_ok=True)
+        async def _write_webpage(webpage: Webpage) -> PageWriteResult:
+            async with semaphore:
+                return await self._write_webpage(webpage, force_override=force_override)
 
-            page_path_local = app_paths.web_root / webpage.path
-            logger.trace("Writing page locally: %s", page_path_local)
-            page_content_bytes = (
-                webpage.content.encode("utf-8") if isinstance(webpage.content, str) else webpage.content
-            )
-
-            with page_path_local.open("wb") as page:
-                page.write(page_content_bytes)
-
-            if self._s3:
-                s3_key = webpage_path.as_posix()
-                if not force_override and s3_file_cache.check_file_exists(s3_key, len(page_content_bytes)):
-                    logger.trace("Skipping upload to S3 for %s as it already exists with the same size.", s3_key)
-                    s3_pages_skipped.append(s3_key)
-                    continue
+        async with asyncio.TaskGroup() as task_group:
+            tasks = [task_group.create_task(_write_webpage(webpage)) for webpage in webpages]
 
-                s3_pages_uploaded.append(s3_key)
-                logger.trace("Writing page s3: %s", s3_key)
-
-                try:
-                    await s3_put(self._app_config.s3.bucket, s3_key, page_content_bytes, webpage.mime)
-                    logger.trace("Uploaded page to s3: %s", s3_key)
-                except Exception:
-                    logger.exception("Unhandled s3 error trying to upload the file: %s", s3_key)
+        results = {webpage.path: task.result() for webpage, task in zip(webpages, tasks, strict=True)}
+        s3_pages_uploaded = [path for path, result in results.items() if result == "uploaded"]
+        s3_pages_skipped = [path for path, result in results.items() if result == "skipped"]
+        failed_pages = [path for path, result in results.items() if result == "failed"]
 
         msg = f"Wrote {str_webpages}"
         if self._s3:
             if len(s3_pages_skipped) == 1:
-                msg += ", skipped upload due to same size"
+                msg += ", skipped upload as it is unchanged"
             elif len(s3_pages_skipped) > 1:
-                msg += f", skipped {len(s3_pages_skipped)} s3 uploads due to matching size"
+                msg += f", skipped {len(s3_pages_skipped)} unchanged s3 uploads"
                 logger.debug("Skipped s3 uploads: %s", s3_pages_skipped)
                 logger.debug("Uploaded s3 pages: %s", s3_pages_uploaded)
             elif len(s3_pages_uploaded) == 1:
                 msg += ", uploaded to s3"
-            else:
+            elif not failed_pages:
                 msg += ", all pages uploaded to s3"
-        logger.info(msg)
+            elif s3_pages_uploaded:
+                msg += f", uploaded {len(s3_pages_uploaded)} pages to s3"
+
+        if failed_pages:
+            msg += f", {len(failed_pages)} failed: {', '.join(failed_pages)}"
+            logger.warning(msg)
+        else:
+            logger.info(msg)
+
+    async def _write_webpage(self, webpage: Webpage, *, force_override: bool) -> PageWriteResult:
+        """Write a page to disk, then upload it to s3 if it's in s3 mode and it changed."""
+        webpage_path = Path(webpage.path)
+        page_path_local = AsyncPath(get_app_paths().web_root / webpage.path)
+        page_content_bytes = webpage.content.encode("utf-8") if isinstance(webpage.content, str) else webpage.content
+
+        logger.trace("Writing page locally: %s", page_path_local)
+        try:
+            await page_path_local.parent.mkdir(parents=True, exist_ok=True)
+            await page_path_local.write_bytes(page_content_bytes)
+        except OSError:
+            logger.exception("Unable to write the page locally: %s", page_path_local)
+            return "failed"
+
+        if not self._s3:
+            return "written"
+
+        s3_key = webpage_path.as_posix()
+        page_etag = get_s3_etag(page_content_bytes)
+        if not force_override and s3_file_cache.check_file_exists(s3_key, etag=page_etag):
+            logger.trace("Skipping upload to S3 for %s as it already exists with the same content.", s3_key)
+            return "skipped"
+
+        logger.trace("Writing page s3: %s", s3_key)
+        try:
+            await s3_put(self._app_config.s3.bucket, s3_key, page_content_bytes, webpage.mime)
+        except Exception:
+            logger.exception("Unhandled s3 error trying to upload the file: %s", s3_key)
+            return "failed"
+
+        s3_file_cache.add_file(S3File(key=s3_key, size=len(page_content_bytes), etag=page_etag))
+        logger.trace("Uploaded page to s3: %s", s3_key)
+        return "uploaded"
 
     async def _load_about_page(self) -> None:
         """Create about page if needed."""
@@ -271,38 +306,41 @@ class WebpageRenderer:
             logger.debug("About page doesn't exist")
 
     async def _check_s3_files(self) -> None:
-        """Function to list files in s3 bucket."""
+        """Function to list files in s3 bucket, deleting the objects that shouldn't be there."""
         logger.debug("Checking state of s3 bucket")
         if not self._s3:
             logger.debug("No s3 client to list files")
             return
 
         contents_list = await s3_file_cache.get_all(self._app_config.s3.bucket)
-
-        cleanup_actions = 0
-
-        def log_first_message() -> None:
-            nonlocal cleanup_actions
-            if cleanup_actions == 0:
-                logger.warning("Starting cleanup of unexpected S3 objects")
-            cleanup_actions += 1
-
-        contents_str = ""
-        if len(contents_list) > 0:
-            for obj in contents_list:
-                contents_str += obj["Key"] + "\n"
-                if obj["Size"] == 0:  # This is for application/x-directory files, but no files should be empty
-                    log_first_message()
-                    logger.warning("S3 Object is empty: %s DELETING", obj["Key"])
-                    await s3_delete(self._app_config.s3.bucket, obj["Key"])
-                if obj["Key"].startswith("/"):
-                    log_first_message()
-                    logger.warning("S3 Path starts with a /, this is not expected: %s DELETING", obj["Key"])
-                    await s3_delete(self._app_config.s3.bucket, obj["Key"])
-                if "//" in obj["Key"]:
-                    log_first_message()
-                    logger.warning("S3 Path contains a //, this is not expected: %s DELETING", obj["Key"])
-                    await s3_delete(self._app_config.s3.bucket, obj["Key"])
-            logger.trace("S3 Bucket Contents >>>\n%s", contents_str.strip())
-        else:
+        if len(contents_list) == 0:
             logger.info("No objects found in the bucket.")
+            return
+
+        if logger.isEnabledFor(TRACE_LEVEL_NUM):
+            logger.trace("S3 Bucket Contents >>>\n%s", "\n".join(obj["Key"] for obj in contents_list))
+
+        keys_to_delete: dict[str, None] = {}  # Ordered set, a key can be unexpected for more than one reason
+        for obj in contents_list:
+            if obj["Size"] == 0:  # This is for application/x-directory files, but no files should be empty
+                logger.warning("S3 Object is empty: %s DELETING", obj["Key"])
+                keys_to_delete[obj["Key"]] = None
+            if obj["Key"].startswith("/"):
+                logger.warning("S3 Path starts with a /, this is not expected: %s DELETING", obj["Key"])
+                keys_to_delete[obj["Key"]] = None
+            if "//" in obj["Key"]:
+                logger.warning("S3 Path contains a //, this is not expected: %s DELETING", obj["Key"])
+                keys_to_delete[obj["Key"]] = None
+
+        if not keys_to_delete:
+            return
+
+        logger.warning("Starting cleanup of %d unexpected S3 objects", len(keys_to_delete))
+        try:
+            deleted_keys = await s3_delete_many(self._app_config.s3.bucket, list(keys_to_delete))
+        except Exception:
+            logger.exception("Unhandled s3 error trying to clean up the bucket")
+            return
+
+        s3_file_cache.remove_files(deleted_keys)
+        logger.info("Deleted %d of %d unexpected S3 objects", len(deleted_keys), len(keys_to_delete))
@@ -36,6 +36,11 @@ class AppWebPageConfig(BaseModel):
         "Podcast archive, generated by archivepodcast, available at https://github.com/kism/archivepodcast"
     )
     contact: str = "archivepodcast@localhost"
+    # Build a waveform of each episode for the webplayer to draw, needs a decode per episode
+    waveform_peaks: bool = False
+    # Split each episode into HLS segments, which the webplayer prefers so long episodes start quickly
+    hls_playlists: bool = False
+    hls_segment_seconds: int = Field(default=10, ge=1)
 
 
 class AppS3Config(BaseModel):
@@ -47,6 +52,10 @@ class AppS3Config(BaseModel):
     region: str = ""
     access_key_id: str = ""
     secret_access_key: str = ""
+    direct_upload: bool = False  # Stream downloads straight into s3, instead of staging them on local disk
+    max_pool_connections: int = Field(default=50, ge=1)  # Connections kept open by the shared s3 client
+    # Serve /content from a local cache of up to this many MiB, filled from s3, instead of redirecting to the cdn
+    content_cache_mb: int = Field(default=0, ge=0)
 
     @field_validator("api_url", mode="before")
     def validate_api_url(cls, v: str) -> str | None:  # ruff: ignore[invalid-first-argument-name-for-method]
@@ -57,6 +66,16 @@ class AppS3Config(BaseModel):
         return v
 
 
+class AppDownloadConfig(BaseModel):
+    """App Download Config Object."""
+
+    podcast_concurrency: int = Field(default=4, ge=1)  # Episodes processed at once within a single podcast
+    global_concurrency: int = Field(default=16, ge=1)  # Asset downloads in flight across all podcasts
+    host_concurrency: int = Field(default=4, ge=1)  # Asset downloads in flight to any one host
+    ffmpeg_concurrency: int = Field(default=0, ge=0)  # ffmpeg conversions running at once, 0 for one per core
+    stream_wav_transcode: bool = False  # Pipe wav downloads straight into ffmpeg, the wav never touches disk
+
+
 class AppConfig(BaseModel):
     """App Config Object."""
 
@@ -64,6 +83,7 @@ class AppConfig(BaseModel):
     inet_path: HttpUrl = HttpUrl("http://localhost:5100/")
     storage_backend: Literal["local", "s3"] = "local"
     s3: AppS3Config = AppS3Config()
+    download: AppDownloadConfig = AppDownloadConfig()
 
 
 class PodcastConfig(BaseModel):
@@ -75,6 +95,9 @@ class PodcastConfig(BaseModel):
     description: str = ""
     live: bool = True
     contact_email: str = ""
+    # Also publish /rss/<name_one_word>-lite, with episodes transcoded to this codec at a low bitrate
+    lite_rendition: Literal["", "opus", "aac"] = ""
+    lite_bitrate_kbps: int = Field(default=48, ge=8)
 
 
 class WebappConfig(BaseModel):
@@ -83,6 +106,7 @@ class WebappConfig(BaseModel):
     # The aliases accept the uppercase keys from flask-era config files, migrated on first write_config.
     testing: bool = Field(default=False, validation_alias=AliasChoices("testing", "TESTING"))
     debug: bool = Field(default=False, validation_alias=AliasChoices("debug", "DEBUG"))
+    watch_web_root: bool = True  # Use inotify where available to skip unchanged directories when rescanning
 
 
 class ArchivePodcastConfig(BaseSettings):
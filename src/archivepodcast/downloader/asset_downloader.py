@@ -1,41 +1,83 @@
 """Actually Download Assets."""
 
+import asyncio
 import contextlib
 import time
+from collections import defaultdict
+from functools import partial
+from http import HTTPStatus
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import aiohttp
+import anyio
 from anyio import Path as AsyncPath
+from botocore.exceptions import BotoCoreError
 from botocore.exceptions import ClientError as S3ClientError
 
+from archivepodcast.instances.manifest import asset_manifest
 from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.instances.profiler import event_times
 from archivepodcast.utils.log_messages import log_aiohttp_exception
 from archivepodcast.utils.logger import get_logger
-from archivepodcast.utils.s3 import S3File, s3_head, s3_put
+from archivepodcast.utils.manifest import ManifestEntry
+from archivepodcast.utils.s3 import (
+    MULTIPART_PART_SIZE,
+    S3File,
+    S3MultipartUpload,
+    get_file_s3_etag,
+    s3_head,
+    s3_put_file,
+)
 from archivepodcast.utils.time import warn_if_too_long
 
 from .constants import CONTENT_TYPES, DOWNLOAD_RETRY_COUNT
-from .helpers import convert_to_mp3, delay_download
+from .helpers import delay_download, get_mp3_conversion
+from .partial_download import PartialDownload, discard_partial, get_part_path, get_resume_state, save_resume_state
+from .scheduler import DownloadScheduler
+from .stream import stream_to_sink
+from .transcoder import FFMPEG_STDIN, FFMPEG_STDOUT, TranscodePool
 
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Mapping
+
     from archivepodcast.config import AppConfig, PodcastConfig
 
 logger = get_logger(__name__)
 
 
-def _append_to_local_paths_cache(file_path: Path) -> None:
+def _append_to_local_paths_cache(file_path: Path, size: int | None = None) -> None:
     file_path = Path(file_path).relative_to(get_app_paths().web_root)
 
-    if not local_file_cache.check_exists(file_path):
-        local_file_cache.add_file(file_path)
+    if size is not None or not local_file_cache.check_exists(file_path):
+        local_file_cache.add_file(file_path, size)
+
+
+def _get_expected_size(headers: Mapping[str, str], resume_from: int) -> int | None:
+    """Get the size the complete file should be from the response headers, None if it can't be known."""
+    if headers.get("Content-Encoding", "identity") != "identity":  # Content-Length is of the encoded body
+        return None
+
+    content_range = headers.get("Content-Range", "")
+    if content_range:  # bytes start-end/total
+        total = content_range.rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+
+    content_length = headers.get("Content-Length", "")
+    return resume_from + int(content_length) if content_length.isdigit() else None
 
 
 def _check_local_path_exists(file_path: Path) -> bool:
-    """Check if the file exists locally."""
+    """Check if the file exists locally, and matches the size it was verified at when downloaded."""
     file_exists = file_path.is_file()
 
+    if file_exists:
+        verified_size = local_file_cache.get_size(file_path.relative_to(get_app_paths().web_root))
+        if verified_size is not None and file_path.stat().st_size != verified_size:
+            logger.warning("File: %s does not match its downloaded size, it will be downloaded again", file_path)
+            file_exists = False
+
     if file_exists:
         _append_to_local_paths_cache(file_path)
         logger.trace("File: %s exists locally", file_path)
@@ -48,26 +90,38 @@ def _check_local_path_exists(file_path: Path) -> bool:
 class AssetDownloader:
     """Asset Downloader object."""
 
-    def __init__(
+    def __init__(  # ruff: ignore[too-many-arguments]
         self,
         podcast: PodcastConfig,
         app_config: AppConfig,
         *,
         s3: bool,
         aiohttp_session: aiohttp.ClientSession,
+        download_scheduler: DownloadScheduler | None = None,
+        transcode_pool: TranscodePool | None = None,
     ) -> None:
-        """Initialise the AssetDownloader object."""
+        """Initialise the AssetDownloader object.
+
+        The download scheduler and transcode pool should be shared between podcasts, if not provided this podcast
+        gets its own.
+        """
         logger.trace("Initialising AssetDownloader for podcast: %s", podcast.name_one_word)
         self._podcast = podcast
         self._app_config = app_config
         self._s3 = s3
         self._aiohttp_session = aiohttp_session
+        self._download_scheduler = download_scheduler or DownloadScheduler.from_config(app_config.download)
+        self._transcode_pool = transcode_pool or TranscodePool.from_config(app_config.download)
         self._feed_download_healthy: bool = True
         self._rss_file_path = get_app_paths().web_root / "rss" / podcast.name_one_word
+        # Episodes are handled concurrently, feeds can list the same file twice
+        self._path_locks: defaultdict[Path, asyncio.Lock] = defaultdict(asyncio.Lock)
 
     # region Download Methods
 
-    async def _download_asset(self, url: str, title: str, extension: str = "", file_date_string: str = "") -> None:
+    async def _download_asset(
+        self, url: str, title: str, extension: str = "", file_date_string: str = "", *, episode_guid: str = ""
+    ) -> None:
         """Download asset from url with appropriate file name."""
         spacer = ""
         if file_date_string != "":
@@ -76,65 +130,155 @@ class AssetDownloader:
         content_dir = get_app_paths().web_root / "content" / self._podcast.name_one_word
         file_path = content_dir / f"{file_date_string}{spacer}{title}{extension}"
 
-        if not await self._check_path_exists(file_path):  # if the asset hasn't already been downloaded
-            await self._download_to_local(url, file_path)
-            logger.debug("Downloaded asset: %s", file_path)
+        async with self._path_locks[file_path]:
+            if not await self._check_path_exists(file_path):  # if the asset hasn't already been downloaded
+                # wav logic since this gets called in handle_wav, wavs are converted locally before upload
+                if extension != ".wav" and self._s3 and self._app_config.s3.direct_upload:
+                    await self._download_to_s3(url, file_path, extension)
+                    self._record_asset(file_path, url, episode_guid)
+                    return
 
-            # For if we are using s3 as a backend
-            # wav logic since this gets called in handle_wav
-            if extension != ".wav" and self._s3:
-                await self._upload_asset_s3(file_path, extension)
+                await self._download_to_local(url, file_path)
+                logger.debug("Downloaded asset: %s", file_path)
 
-        else:
-            logger.trace(f"Already downloaded: {title}{extension}")
+                if extension != ".wav":  # Wavs are recorded once converted
+                    # For if we are using s3 as a backend
+                    if self._s3:
+                        await self._upload_asset_s3(file_path, extension)
+                    self._record_asset(file_path, url, episode_guid)
+
+            else:
+                logger.trace(f"Already downloaded: {title}{extension}")
 
     async def _download_to_local(self, url: str, file_path: Path) -> None:
         """Download the asset from the url."""
         logger.debug("[%s] Downloading: %s", self._podcast.name_one_word, url)
 
-        async def _stream_to_file() -> None:
-            """Download the asset from the url to the file path."""
-            logger.trace("[%s] Downloading asset from URL: %s", self._podcast.name_one_word, url)
-            start_time = time.time()
-            async with self._aiohttp_session.get(url) as response:
-                response.raise_for_status()
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                with file_path.open("wb") as asset_file:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        asset_file.write(chunk)
-
-            warn_if_too_long(f"download asset: {file_path}", time.time() - start_time, large_file=True)
+        if not await self._download_with_retries(url, str(file_path), partial(self._stream_to_file, url, file_path)):
+            return
+
+        logger.debug("[%s] Success, downloaded to %s", self._podcast.name_one_word, file_path)
+
+        if not self._s3:
+            _append_to_local_paths_cache(file_path, (await AsyncPath(file_path).stat()).st_size)
+
+    async def _download_to_s3(self, url: str, file_path: Path, extension: str) -> None:
+        """Download the asset from the url straight into s3, without staging it on local disk."""
+        s3_path = file_path.relative_to(get_app_paths().web_root).as_posix()
+        logger.debug("[%s] Downloading straight to s3: %s", self._podcast.name_one_word, url)
+
+        stream = partial(self._stream_to_s3, url, s3_path, CONTENT_TYPES[extension])
+        if await self._download_with_retries(url, f"s3 {s3_path}", stream):
+            logger.debug("[%s] Success, uploaded to s3: %s", self._podcast.name_one_word, s3_path)
+
+    async def _download_with_retries(self, url: str, destination: str, stream: Callable[[], Awaitable[None]]) -> bool:
+        """Run the stream in a download slot, retrying on failure. Returns whether it succeeded."""
 
         async def _attempt_download() -> bool:
             """Attempt to download the asset."""
             try:
-                await _stream_to_file()
+                async with self._download_scheduler.slot(self._podcast.name_one_word, url):
+                    await stream()
             except aiohttp.ClientError as e:
                 self._feed_download_healthy = False
                 log_aiohttp_exception(self._podcast.name_one_word, url, e, logger)
                 return False
+            except S3ClientError, BotoCoreError:
+                self._feed_download_healthy = False
+                logger.exception("[%s] s3 error uploading %s", self._podcast.name_one_word, url)
+                return False
 
-            logger.info("[%s] Downloaded asset to: %s", self._podcast.name_one_word, file_path)
+            logger.info("[%s] Downloaded asset to: %s", self._podcast.name_one_word, destination)
 
             return True
 
-        success = False
         for n in range(DOWNLOAD_RETRY_COUNT):
-            success = await _attempt_download()
-            if success:
-                break
+            if await _attempt_download():
+                return True
             await delay_download(n)
-        if not success:
-            logger.error("[%s] Failed to download asset after multiple attempts: %s", self._podcast.name_one_word, url)
-            return
 
-        logger.debug("[%s] Success, downloaded to %s", self._podcast.name_one_word, file_path)
+        logger.error("[%s] Failed to download asset after multiple attempts: %s", self._podcast.name_one_word, url)
+        return False
 
-        if not self._s3:
-            _append_to_local_paths_cache(file_path)
+    async def _stream_to_file(self, url: str, file_path: Path) -> None:
+        """Download the asset from the url to the file path, via a part file so a failed download can resume."""
+        logger.trace("[%s] Downloading asset from URL: %s", self._podcast.name_one_word, url)
+        start_time = time.time()
+        part_path = get_part_path(file_path)
+
+        try:
+            expected_size = await self._stream_to_part_file(url, part_path)
+        except aiohttp.ClientResponseError as e:
+            if e.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:  # Start over on the next attempt
+                await discard_partial(part_path)
+            raise
+
+        # A truncated file must never land at the final path, it would be treated as archived
+        size = (await AsyncPath(part_path).stat()).st_size
+        if expected_size is not None and size != expected_size:
+            if size > expected_size:  # Not something a resume can fix
+                await discard_partial(part_path)
+            msg = f"Downloaded {size} bytes, expected {expected_size}: {url}"
+            logger.warning("[%s] %s", self._podcast.name_one_word, msg)
+            raise aiohttp.ClientPayloadError(msg)
+
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.replace(file_path)
+        await discard_partial(part_path)
+
+        warn_if_too_long(f"download asset: {file_path}", time.time() - start_time, large_file=True)
+
+    async def _stream_to_s3(self, url: str, s3_path: str, content_type: str) -> None:
+        """Pipe the response body into a multipart upload, only a couple of parts are held in memory at once."""
+        logger.trace("[%s] Streaming asset from URL to s3: %s", self._podcast.name_one_word, url)
+        start_time = time.time()
+
+        async with self._aiohttp_session.get(url) as response:
+            response.raise_for_status()
+            expected_size = _get_expected_size(response.headers, 0)
+
+            async with S3MultipartUpload(self._app_config.s3.bucket, s3_path, content_type) as upload:
+                transfer_stats = await stream_to_sink(response.content, upload.upload_part, MULTIPART_PART_SIZE)
+
+                if expected_size is not None and upload.size != expected_size:  # Raising aborts the upload
+                    msg = f"Downloaded {upload.size} bytes, expected {expected_size}: {url}"
+                    logger.warning("[%s] %s", self._podcast.name_one_word, msg)
+                    raise aiohttp.ClientPayloadError(msg)
+
+        s3_file_cache.add_file(S3File(key=s3_path, size=upload.size, etag=upload.etag))
+        logger.debug("[%s] Streamed %s to s3: %s", self._podcast.name_one_word, url, transfer_stats.get_summary())
+        warn_if_too_long(f"stream asset to s3: {s3_path}", time.time() - start_time, large_file=True)
+
+    async def _stream_to_part_file(self, url: str, part_path: Path) -> int | None:
+        """Stream the url into the part file, resuming it if the origin still has the same file.
+
+        Returns the size the complete file should be, None if the origin didn't say.
+        """
+        partial_download, resume_from = await get_resume_state(part_path, url)
+
+        headers = {}
+        if partial_download is not None and resume_from > 0:
+            logger.info("[%s] Resuming download from byte %d: %s", self._podcast.name_one_word, resume_from, url)
+            headers = {"Range": f"bytes={resume_from}-", "If-Range": partial_download.validator}
+
+        async with self._aiohttp_session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            # If-Range means a changed file is sent whole with a 200, so it's never spliced
+            resumed = response.status == HTTPStatus.PARTIAL_CONTENT
+            if not resumed:
+                await discard_partial(part_path)
+                partial_download = PartialDownload.from_headers(url, response.headers)
+
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            if partial_download is not None:  # Only worth resuming if the origin supports it
+                await save_resume_state(part_path, partial_download)
+
+            async with await anyio.open_file(part_path, "ab" if resumed else "wb") as asset_file:
+                transfer_stats = await stream_to_sink(response.content, asset_file.write)
+
+            logger.debug("[%s] Downloaded %s: %s", self._podcast.name_one_word, url, transfer_stats.get_summary())
+
+            return _get_expected_size(response.headers, resume_from if resumed else 0)
 
     async def _download_cover_art(
         self,
@@ -175,8 +319,13 @@ class AssetDownloader:
         if self._s3 and (local_file_found or not remote_file_found):
             await self._upload_asset_s3(cover_art_destination, extension, remove_original=False)
 
-    async def _handle_wav(self, url: str, title: str, extension: str = "", file_date_string: str = "") -> int:
-        """Convert podcasts that have wav episodes 😔. Returns new file length."""
+        if not remote_file_found:  # Found remotely it was recorded when it was checked, or is already
+            self._record_asset(cover_art_destination, url)
+
+    async def _handle_wav(
+        self, url: str, title: str, extension: str = "", file_date_string: str = "", *, episode_guid: str = ""
+    ) -> int | None:
+        """Convert podcasts that have wav episodes 😔. Returns new file length, None if the streamed convert failed."""
         logger.trace("[%s] Handling wav file: %s", self._podcast.name_one_word, title)
         spacer = ""  # This logic can be removed since WAVs will always have a date
         if file_date_string != "":
@@ -186,39 +335,50 @@ class AssetDownloader:
         wav_file_path: AsyncPath = AsyncPath(content_dir / f"{file_date_string}{spacer}{title}.wav")
         mp3_file_path: AsyncPath = AsyncPath(content_dir / f"{file_date_string}{spacer}{title}.mp3")
 
-        # If we need do download and convert a wav there is a small chance
-        # the user has had ffmpeg issues, remove existing files to play it safe
-        if await wav_file_path.exists():
-            with contextlib.suppress(Exception):
-                await wav_file_path.unlink()
-                await mp3_file_path.unlink()
-
-        # If the asset hasn't already been downloaded and converted
-        if not await self._check_path_exists(mp3_file_path):
-            await self._download_asset(
-                url,
-                title,
-                extension,
-                file_date_string,
-            )
+        async with self._path_locks[Path(mp3_file_path)]:
+            # If we need do download and convert a wav there is a small chance
+            # the user has had ffmpeg issues, remove existing files to play it safe
+            if await wav_file_path.exists():
+                with contextlib.suppress(Exception):
+                    await wav_file_path.unlink()
+                    await mp3_file_path.unlink()
+
+            # If the asset hasn't already been downloaded and converted
+            converted = False
+            if await self._check_path_exists(mp3_file_path):
+                logger.debug("Episode has already been converted: %s", mp3_file_path)
+            elif self._app_config.download.stream_wav_transcode:
+                if not await self._download_wav_as_mp3(url, title, Path(mp3_file_path)):
+                    return None
+                converted = True
+            else:
+                await self._download_asset(
+                    url,
+                    title,
+                    extension,
+                    file_date_string,
+                )
 
-            logger.info("♻ Converting episode %s to mp3", title)
-            logger.debug("♻ MP3 File Path: %s", mp3_file_path)
+                logger.info("♻ Converting episode %s to mp3", title)
+                logger.debug("♻ MP3 File Path: %s", mp3_file_path)
 
-            convert_to_mp3(wav_file_path, mp3_file_path)
+                duration = await self._transcode_pool.convert_to_mp3(wav_file_path, mp3_file_path)
+                event_times.set_event_time(
+                    f"grab_podcasts/Scrape/{self._podcast.name_one_word}/Convert to mp3/{mp3_file_path.stem}",
+                    duration,
+                )
 
-            logger.info("♻ Done")
+                logger.info("♻ Done, took %.1fs", duration)
 
-            # Remove wav since we are done with it
-            logger.info("♻ Removing wav version of %s", title)
-            if await wav_file_path.exists():
-                await wav_file_path.unlink()
-            logger.info("♻ Done")
+                # Remove wav since we are done with it
+                logger.info("♻ Removing wav version of %s", title)
+                if await wav_file_path.exists():
+                    await wav_file_path.unlink()
+                logger.info("♻ Done")
 
-            if self._s3:
-                await self._upload_asset_s3(mp3_file_path, extension)
-        else:
-            logger.debug("Episode has already been converted: %s", mp3_file_path)
+                if self._s3:
+                    await self._upload_asset_s3(mp3_file_path, extension)
+                converted = True
 
         if self._s3:
             # Convert mp3_file_path to a Path object and make relative to web_root
@@ -230,8 +390,7 @@ class AssetDownloader:
             msg = f"Checking length of s3 object: {s3_key}"
             logger.trace("[%s] %s", self._podcast.name_one_word, msg)
 
-            response = await s3_head(self._app_config.s3.bucket, s3_key)
-            new_length = response["ContentLength"]
+            new_length = await self._get_s3_size(s3_key)
             msg = f"Length of converted wav file {s3_key}: {new_length} bytes, stored in s3"
         else:
             new_length = (await mp3_file_path.stat()).st_size
@@ -239,8 +398,89 @@ class AssetDownloader:
 
         logger.trace("[%s] %s", self._podcast.name_one_word, msg)
 
+        if converted:
+            self._record_asset(Path(mp3_file_path), url, episode_guid, new_length)
+
         return new_length
 
+    async def _download_wav_as_mp3(self, url: str, title: str, mp3_file_path: Path) -> bool:
+        """Pipe a wav download straight through ffmpeg, so the download and the encode overlap.
+
+        Only the mp3 is written, straight into s3 with direct upload. Returns whether it succeeded.
+        """
+        logger.info("♻ Downloading episode %s and converting it to mp3 as it arrives", title)
+        start_time = time.time()
+
+        if self._s3 and self._app_config.s3.direct_upload:
+            s3_path = mp3_file_path.relative_to(get_app_paths().web_root).as_posix()
+            if not await self._download_with_retries(
+                url, f"s3 {s3_path}", partial(self._transcode_to_s3, url, s3_path)
+            ):
+                return False
+        else:
+            if not await self._download_with_retries(
+                url, str(mp3_file_path), partial(self._transcode_to_file, url, mp3_file_path)
+            ):
+                return False
+            if self._s3:
+                await self._upload_asset_s3(mp3_file_path, ".mp3")
+            else:
+                _append_to_local_paths_cache(mp3_file_path, (await AsyncPath(mp3_file_path).stat()).st_size)
+
+        duration = time.time() - start_time
+        event_times.set_event_time(
+            f"grab_podcasts/Scrape/{self._podcast.name_one_word}/Convert to mp3/{mp3_file_path.stem}", duration
+        )
+        logger.info("♻ Done, took %.1fs", duration)
+        return True
+
+    async def _transcode_to_file(self, url: str, mp3_file_path: Path) -> None:
+        """Pipe the response body through ffmpeg into the mp3, via a part file so a partial mp3 is never archived."""
+        part_path = get_part_path(mp3_file_path)
+
+        async with self._aiohttp_session.get(url) as response:
+            response.raise_for_status()
+            expected_size = _get_expected_size(response.headers, 0)
+
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                transfer_stats = await self._transcode_pool.run_piped(
+                    get_mp3_conversion(FFMPEG_STDIN, part_path), response.content
+                )
+                self._check_transcoded_size(url, transfer_stats.size, expected_size)
+            except BaseException:
+                await discard_partial(part_path)
+                raise
+
+        mp3_file_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.replace(mp3_file_path)
+        logger.debug("[%s] Transcoded %s: %s", self._podcast.name_one_word, url, transfer_stats.get_summary())
+
+    async def _transcode_to_s3(self, url: str, s3_path: str) -> None:
+        """Pipe the response body through ffmpeg into a multipart upload, neither the wav nor the mp3 touch disk."""
+        async with self._aiohttp_session.get(url) as response:
+            response.raise_for_status()
+            expected_size = _get_expected_size(response.headers, 0)
+
+            async with S3MultipartUpload(self._app_config.s3.bucket, s3_path, CONTENT_TYPES[".mp3"]) as upload:
+                transfer_stats = await self._transcode_pool.run_piped(
+                    get_mp3_conversion(FFMPEG_STDIN, FFMPEG_STDOUT),
+                    response.content,
+                    upload.upload_part,
+                    MULTIPART_PART_SIZE,
+                )
+                self._check_transcoded_size(url, transfer_stats.size, expected_size)  # Raising aborts the upload
+
+        s3_file_cache.add_file(S3File(key=s3_path, size=upload.size, etag=upload.etag))
+        logger.debug("[%s] Transcoded %s to s3: %s", self._podcast.name_one_word, url, transfer_stats.get_summary())
+
+    def _check_transcoded_size(self, url: str, size: int, expected_size: int | None) -> None:
+        """Raise if less of the wav was downloaded than the origin said, ffmpeg happily encodes a truncated wav."""
+        if expected_size is not None and size != expected_size:
+            msg = f"Downloaded {size} bytes, expected {expected_size}: {url}"
+            logger.warning("[%s] %s", self._podcast.name_one_word, msg)
+            raise aiohttp.ClientPayloadError(msg)
+
     # region S3 Upload
 
     async def _upload_asset_s3(
@@ -259,10 +499,10 @@ class AssetDownloader:
 
         if not remove_original:
             # So if we are not removing the original, we can check if we can skip the upload
-            file_size = file_path.stat().st_size
-            if s3_file_cache.check_file_exists(s3_path, file_size):
+            file_etag = await get_file_s3_etag(file_path)
+            if s3_file_cache.check_file_exists(s3_path, etag=file_etag):
                 logger.debug(
-                    "[%s] File: %s exists in s3_paths_cache and matches in size, skipping upload",
+                    "[%s] File: %s exists in s3_paths_cache and matches its ETag, skipping upload",
                     self._podcast.name_one_word,
                     s3_path,
                 )
@@ -286,11 +526,10 @@ class AssetDownloader:
         else:
             logger.debug("[%s] Uploading to s3: %s", self._podcast.name_one_word, s3_path)
 
-        body = await AsyncPath(file_path).read_bytes()
-        await s3_put(self._app_config.s3.bucket, s3_path, body, content_type, large_file=True)
+        s3_file = await s3_put_file(self._app_config.s3.bucket, s3_path, file_path, content_type, large_file=True)
         logger.trace("[%s] Uploaded asset to s3: %s", self._podcast.name_one_word, s3_path)
 
-        s3_file_cache.add_file(S3File(key=s3_path, size=len(body)))
+        s3_file_cache.add_file(s3_file)
 
         if remove_original:
             logger.info("[%s] Removing local file: %s", self._podcast.name_one_word, file_path)
@@ -302,6 +541,36 @@ class AssetDownloader:
 
     # region Helpers
 
+    async def _get_s3_size(self, s3_key: str) -> int:
+        """Get the size of an object in s3, from the cache or the manifest before asking s3."""
+        size = s3_file_cache.get_size(s3_key)
+        if size is None:
+            manifest_entry = asset_manifest.get(s3_key)
+            size = manifest_entry.size if manifest_entry is not None else None
+        if size is None:
+            response = await s3_head(self._app_config.s3.bucket, s3_key)
+            size = response["ContentLength"]
+        return size
+
+    def _record_asset(self, file_path: Path, url: str, episode_guid: str = "", size: int | None = None) -> None:
+        """Record an asset in the manifest once it has landed, nothing is recorded if it didn't.
+
+        The manifest is only kept in s3 mode, locally the file cache is built from the web root each run.
+        """
+        if not self._s3:
+            return
+
+        key = file_path.relative_to(get_app_paths().web_root).as_posix()
+        s3_file = s3_file_cache.get_file(key)
+        if s3_file is None:
+            if size is None:
+                return
+            s3_file = S3File(key=key, size=size)  # Its ETag isn't known
+        elif size is not None:
+            s3_file.size = size
+
+        asset_manifest.record(ManifestEntry.from_s3_file(s3_file, url, episode_guid))
+
     async def _check_path_exists(self, file_path: Path | AsyncPath | str) -> bool:
         """Check the path, s3 or local."""
         file_exists = False
@@ -325,7 +594,8 @@ class AssetDownloader:
                         "File: %s exists in s3 bucket",
                         s3_key,
                     )
-                    s3_file_cache.add_file(S3File(key=s3_key, size=my_object.get("ContentLength", 0)))
+                    s3_file = S3File(key=s3_key, size=my_object.get("ContentLength", 0), etag=my_object.get("ETag", ""))
+                    s3_file_cache.add_file(s3_file)
                     file_exists = True
 
                 except S3ClientError as e:
@@ -338,6 +608,8 @@ class AssetDownloader:
                         logger.exception("s3 check file exists errored out?")
                 except Exception:  # pylint: disable=broad-exception-caught
                     logger.exception("Unhandled s3 Error:")
+                else:  # So it isn't checked again every run
+                    asset_manifest.record(ManifestEntry.from_s3_file(s3_file))
 
             else:
                 logger.trace("s3 path %s exists in s3_paths_cache, skipping", s3_key)
@@ -20,8 +20,15 @@ CONTENT_TYPES = {
     ".wav": "audio/wav",
     ".m4a": "audio/mpeg",
     ".flac": "audio/flac",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
 }
 
 USER_AGENT = "Podcasts/4024.230.1 CFNetwork/1568.200.51 Darwin/24.1.0"
 
 DOWNLOAD_RETRY_COUNT = 5
+
+# Streaming downloads, reads grow from the min to the max size while the network keeps up
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 4 * 1024 * 1024
+WRITE_BEHIND_SIZE = 4 * 1024 * 1024  # Buffered before being handed to a thread to write
@@ -1,10 +1,12 @@
 """Download and process podcast feeds and media files."""
 # and return xml that can be served to download them
 
+import asyncio
 import re
 import time
 import xml.etree.ElementTree as ET
 from http import HTTPStatus
+from typing import TYPE_CHECKING
 
 import aiohttp
 
@@ -16,8 +18,15 @@ from archivepodcast.utils.time import warn_if_too_long
 
 from .asset_downloader import AssetDownloader
 from .constants import AUDIO_FORMATS, DOWNLOAD_RETRY_COUNT, IMAGE_FORMATS
+from .feed_state import FeedState, get_feed_content_hash, get_podcast_config_hash
 from .helpers import delay_download, get_file_date_string, tree_no_episodes
 
+if TYPE_CHECKING:
+    from archivepodcast.config import AppConfig, PodcastConfig
+
+    from .scheduler import DownloadScheduler
+    from .transcoder import TranscodePool
+
 logger = get_logger(__name__)
 
 
@@ -40,14 +49,53 @@ ET.register_namespace("feedburner", "http://rssnamespace.org/feedburner/ext/1.0"
 class PodcastsDownloader(AssetDownloader):
     """PodcastDownloader object."""
 
+    def __init__(  # ruff: ignore[too-many-arguments]
+        self,
+        podcast: PodcastConfig,
+        app_config: AppConfig,
+        *,
+        s3: bool,
+        aiohttp_session: aiohttp.ClientSession,
+        download_scheduler: DownloadScheduler | None = None,
+        transcode_pool: TranscodePool | None = None,
+        feed_state: FeedState | None = None,
+        config_hash: str = "",
+    ) -> None:
+        """Initialise the PodcastsDownloader object.
+
+        The feed state is used for a conditional fetch, and updated in place once a new feed is processed without any
+        asset failing to download. The config hash should be of the podcast as it was loaded, processing a feed fills
+        in details like its new name, it's hashed here if not given.
+        """
+        super().__init__(
+            podcast,
+            app_config,
+            s3=s3,
+            aiohttp_session=aiohttp_session,
+            download_scheduler=download_scheduler,
+            transcode_pool=transcode_pool,
+        )
+        self.feed_state = feed_state if feed_state is not None else FeedState()
+        self.feed_unchanged = False
+        self._fetched_feed_state = FeedState()
+        self._config_hash = config_hash or get_podcast_config_hash(podcast, app_config)
+
     async def download_podcast(
         self,
     ) -> ET.ElementTree[ET.Element] | None:
-        """Parse the rss, Download all the assets, this is main."""
+        """Parse the rss, Download all the assets, this is main.
+
+        Returns None with feed_unchanged set if the upstream feed hasn't changed since the feed state,
+        either by a 304 or by the content hash matching.
+        """
         self._feed_download_healthy = True
         feed_rss_healthy = True
         tree = await self._download_and_parse_rss()
 
+        if self.feed_unchanged:
+            health.update_podcast_status(self._podcast.name_one_word, healthy_feed=True)
+            return None
+
         if tree:
             if tree_no_episodes(tree):
                 # Log the whole damn tree
@@ -91,6 +139,10 @@ class PodcastsDownloader(AssetDownloader):
             content, status = await self._fetch_podcast_rss()
             warn_if_too_long(f"[{self._podcast.name_one_word}] download podcast rss", time.time() - start_time)
 
+            if status == HTTPStatus.NOT_MODIFIED:
+                logger.info("[%s] RSS not modified since it was last processed", self._podcast.name_one_word)
+                self.feed_unchanged = True
+                return None
             if status in {HTTPStatus.NOT_FOUND, HTTPStatus.FORBIDDEN}:
                 logger.error(
                     "[%s] RSS download attempt failed with HTTP status %s, not retrying",
@@ -115,6 +167,13 @@ class PodcastsDownloader(AssetDownloader):
 
         logger.debug("[%s] Success fetching podcast RSS", self._podcast.name_one_word)
 
+        self._fetched_feed_state.content_hash = get_feed_content_hash(content)
+        previous_content_hash = self._get_previous_feed_state().content_hash
+        if previous_content_hash and self._fetched_feed_state.content_hash == previous_content_hash:
+            logger.info("[%s] RSS content unchanged since it was last processed", self._podcast.name_one_word)
+            self.feed_unchanged = True
+            return None
+
         try:
             podcast_rss = ET.fromstring(content)
         except ET.ParseError:
@@ -132,27 +191,85 @@ class PodcastsDownloader(AssetDownloader):
         await self._process_podcast_rss(xml_first_child)
         podcast_rss[0] = xml_first_child
 
+        # Only now that it's processed can the next fetch be conditional on this one. Not if an episode or image
+        # failed to download though, the next run has to fetch and process the feed again to retry it.
+        if self._feed_download_healthy:
+            self.feed_state.etag = self._fetched_feed_state.etag
+            self.feed_state.last_modified = self._fetched_feed_state.last_modified
+            self.feed_state.content_hash = self._fetched_feed_state.content_hash
+            self.feed_state.config_hash = self._config_hash
+        else:
+            logger.info("[%s] Not all assets downloaded, the feed will be processed again", self._podcast.name_one_word)
+
         return ET.ElementTree(podcast_rss)
 
+    def _get_previous_feed_state(self) -> FeedState:
+        """Get the feed state to compare the fetch against, empty if the podcast's config changed since it was saved."""
+        if self.feed_state.config_hash != self._config_hash:
+            return FeedState()
+        return self.feed_state
+
     async def _fetch_podcast_rss(self) -> tuple[bytes | None, HTTPStatus | None]:
         """Fetch the podcast RSS feed."""
         logger.debug(
             "[%s] Starting fetch for podcast RSS: %s", self._podcast.name_one_word, self._podcast.url.encoded_string()
         )
         try:
-            async with self._aiohttp_session.get(self._podcast.url.encoded_string()) as response:
+            async with self._aiohttp_session.get(
+                self._podcast.url.encoded_string(), headers=self._get_previous_feed_state().get_conditional_headers()
+            ) as response:
+                self._fetched_feed_state = FeedState(
+                    etag=response.headers.get("ETag", ""),
+                    last_modified=response.headers.get("Last-Modified", ""),
+                )
                 return await response.read(), HTTPStatus(response.status)
 
         except aiohttp.ClientError as e:
             log_aiohttp_exception(self._podcast.name_one_word, self._podcast.url.encoded_string(), e, logger)
         return None, None
 
+    async def process_cached_feed(self, tree: ET.ElementTree[ET.Element]) -> None:
+        """Run the channel tag handlers over the previously processed feed, for when the upstream feed is unchanged.
+
+        They fill in podcast details like the new name and contact email that the webpages use. Items and images are
+        left alone, their assets were downloaded when the feed was processed.
+        """
+        channel = tree.getroot().find("channel")
+        if channel is None:
+            return
+        for channel_tag in channel:
+            if channel_tag.tag not in {"item", "image", "{http://www.itunes.com/dtds/podcast-1.0.dtd}image"}:
+                await self._process_channel_tag(channel_tag)
+
     # region RSS Hell
 
     async def _process_podcast_rss(self, xml_first_child: ET.Element) -> None:
-        """Process the podcast rss and update it with new values."""
-        for channel in xml_first_child:
-            await self._process_channel_tag(channel)
+        """Process the podcast rss and update it with new values.
+
+        Channel level tags are handled in order since some of them set podcast details used later,
+        items are fanned out as tasks, limited by the per podcast concurrency in the config.
+        An item that fails is logged on its own, so it doesn't cancel the others.
+        """
+        item_semaphore = asyncio.Semaphore(self._app_config.download.podcast_concurrency)
+
+        async def _handle_item_limited(item: ET.Element) -> None:
+            async with item_semaphore:
+                try:
+                    await self._handle_item_tag(item)
+                except Exception:
+                    self._feed_download_healthy = False
+                    logger.exception(
+                        "[%s] Unhandled error processing episode: %s",
+                        self._podcast.name_one_word,
+                        item.findtext("title", ""),
+                    )
+
+        async with asyncio.TaskGroup() as item_tasks:
+            for channel in xml_first_child:
+                if channel.tag == "item":
+                    item_tasks.create_task(_handle_item_limited(channel))
+                else:
+                    await self._process_channel_tag(channel)
 
     async def _process_channel_tag(self, channel: ET.Element) -> None:  # ruff: ignore[complex-structure] # There is no way to avoid this really, there are many tag types
         """Process individual channel tags in the podcast rss."""
@@ -278,18 +395,23 @@ class PodcastsDownloader(AssetDownloader):
         """Handle the item tag in the podcast rss."""
         file_date_string = get_file_date_string(channel)
         title = ""
+        episode_guid = ""
         for child in channel:
             if child.tag == "title":
                 title = str(child.text)
                 logger.trace("Episode title: %s", title)
+            elif child.tag == "guid":
+                episode_guid = (child.text or "").strip()
 
         for child in channel:
             if child.tag == "enclosure" or "{http://search.yahoo.com/mrss/}content" in str(child.tag):
-                await self._handle_enclosure_tag(child, title, file_date_string)
+                await self._handle_enclosure_tag(child, title, file_date_string, episode_guid)
             elif child.tag == "{http://www.itunes.com/dtds/podcast-1.0.dtd}image":
-                await self._handle_episode_image_tag(child, title, file_date_string)
+                await self._handle_episode_image_tag(child, title, file_date_string, episode_guid)
 
-    async def _handle_enclosure_tag(self, child: ET.Element, title: str, file_date_string: str) -> None:
+    async def _handle_enclosure_tag(
+        self, child: ET.Element, title: str, file_date_string: str, episode_guid: str = ""
+    ) -> None:
         """Handle the enclosure tag in the podcast rss."""
         logger.trace("Enclosure, URL: %s", child.attrib.get("url", ""))
         title = self._cleanup_file_name(title)
@@ -299,12 +421,17 @@ class PodcastsDownloader(AssetDownloader):
             new_audio_format = audio_format
             if audio_format in url:
                 if audio_format == ".wav":
-                    new_length = await self._handle_wav(url, title, audio_format, file_date_string)
+                    new_length = await self._handle_wav(
+                        url, title, audio_format, file_date_string, episode_guid=episode_guid
+                    )
+                    if new_length is None:  # Not archived, the enclosure keeps pointing at the original
+                        child.attrib["url"] = url
+                        return
                     new_audio_format = ".mp3"
                     child.attrib["type"] = "audio/mpeg"
                     child.attrib["length"] = str(new_length)
                 else:
-                    await self._download_asset(url, title, audio_format, file_date_string)
+                    await self._download_asset(url, title, audio_format, file_date_string, episode_guid=episode_guid)
                 child.attrib["url"] = (
                     self._app_config.inet_path.encoded_string()
                     + "content/"
@@ -321,13 +448,14 @@ class PodcastsDownloader(AssetDownloader):
         child: ET.Element,
         title: str,
         file_date_string: str,
+        episode_guid: str = "",
     ) -> None:
         """Handle the episode image tag in the podcast rss."""
         title = self._cleanup_file_name(title)
         url = child.attrib.get("href", "")
         for filetype in IMAGE_FORMATS:
             if filetype in url:
-                await self._download_asset(url, title, filetype, file_date_string)
+                await self._download_asset(url, title, filetype, file_date_string, episode_guid=episode_guid)
                 child.attrib["href"] = (
                     self._app_config.inet_path.encoded_string()
                     + "content/"
@@ -0,0 +1,149 @@
+"""Files derived from archived episodes, built for the episodes in a feed that don't have them yet."""
+
+import asyncio
+from abc import ABC, abstractmethod
+from pathlib import PurePosixPath
+from typing import TYPE_CHECKING
+
+from anyio import Path as AsyncPath
+from botocore.exceptions import BotoCoreError
+from botocore.exceptions import ClientError as S3ClientError
+from ffmpeg.exceptions import FFMpegExecuteError
+
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.manifest import ManifestEntry
+from archivepodcast.utils.s3 import S3File, get_s3_client
+
+from .constants import AUDIO_FORMATS
+from .transcoder import FFMPEG_STDIN
+
+if TYPE_CHECKING:
+    import xml.etree.ElementTree as ET
+    from collections.abc import Awaitable, Callable
+    from pathlib import Path
+
+    from ffmpeg.dag.nodes import OutputStream
+
+    from archivepodcast.config import AppConfig, PodcastConfig  # pragma: no cover
+
+    from .transcoder import TranscodePool
+else:
+    AppConfig = object
+    PodcastConfig = object
+
+logger = get_logger(__name__)
+
+
+class EpisodeAssetBuilder(ABC):
+    """Builds a file derived from each archived episode of a podcast, e.g. a low bitrate rendition.
+
+    Subclasses say where the derived file goes and how it's built, which episodes are missing one comes from the feed.
+    """
+
+    description = "episode asset"  # What is built, for log messages
+
+    def __init__(
+        self, podcast: PodcastConfig, app_config: AppConfig, *, s3: bool, transcode_pool: TranscodePool
+    ) -> None:
+        """Initialise the builder, the transcode pool should be shared between podcasts."""
+        self._podcast = podcast
+        self._app_config = app_config
+        self._s3 = s3
+        self._transcode_pool = transcode_pool
+
+    async def build(self, tree: ET.ElementTree[ET.Element]) -> int:
+        """Build what's missing for the episodes in the feed, a few at a time through the transcode pool.
+
+        Returns how many were built, an episode that fails is logged and tried again on the next run.
+        """
+        source_keys: list[str] = []
+        for enclosure in tree.iter("enclosure"):
+            source_key = self._get_source_key(enclosure.get("url", ""))
+            if source_key is None or await self._get_size(self._get_derived_key(source_key)) is not None:
+                continue
+            if await self._get_size(source_key) is None:  # The episode failed to download, nothing to build from
+                continue
+            source_keys.append(source_key)
+
+        if not source_keys:
+            return 0
+
+        logger.info("[%s] Building %d %ss", self._podcast.name_one_word, len(source_keys), self.description)
+        # Limited here too, so a podcast doesn't open an s3 stream for every episode while they wait for a slot
+        semaphore = asyncio.Semaphore(self._transcode_pool.max_concurrent)
+
+        async def _build_limited(source_key: str) -> bool:
+            async with semaphore:
+                return await self._build_one(source_key)
+
+        built = await asyncio.gather(*(_build_limited(source_key) for source_key in source_keys))
+        return sum(built)
+
+    async def _build_one(self, source_key: str) -> bool:
+        """Build for one episode, recording the result in the manifest in s3 mode. Returns whether it worked."""
+        derived_key = self._get_derived_key(source_key)
+        try:
+            size = await self._build(source_key, derived_key)
+        except FFMpegExecuteError, S3ClientError, BotoCoreError, OSError:
+            logger.exception("[%s] Failed to build %s: %s", self._podcast.name_one_word, self.description, derived_key)
+            return False
+
+        if self._s3:  # The ETag s3 gave the upload is in the file cache
+            s3_file = s3_file_cache.get_file(derived_key) or S3File(key=derived_key, size=size)
+            asset_manifest.record(ManifestEntry.from_s3_file(s3_file, source_key))
+        logger.debug("[%s] Built %s: %s", self._podcast.name_one_word, self.description, derived_key)
+        return True
+
+    @abstractmethod
+    def _get_derived_key(self, source_key: str) -> str:
+        """Get where the file derived from an episode goes."""
+
+    @abstractmethod
+    async def _build(self, source_key: str, derived_key: str) -> int:
+        """Build the file derived from an episode, storing it locally or in s3. Returns its size."""
+
+    def _get_source_input(self, source_key: str) -> Path | str:
+        """Get what ffmpeg reads the episode from, its stdin in s3 mode since the episode isn't on local disk."""
+        return FFMPEG_STDIN if self._s3 else get_app_paths().web_root / source_key
+
+    async def _run(
+        self, source_key: str, stream: OutputStream, write: Callable[[bytes], Awaitable[object]] | None = None
+    ) -> None:
+        """Run an ffmpeg job that reads the episode from _get_source_input, streaming its stdout to write if given."""
+        if not self._s3:
+            if write is None:
+                await self._transcode_pool.run(stream)
+            else:
+                await self._transcode_pool.run_piped(stream, None, write)
+            return
+
+        s3_client = await get_s3_client()
+        s3_object = await s3_client.get_object(Bucket=self._app_config.s3.bucket, Key=source_key)
+        body = s3_object["Body"]
+        try:
+            await self._transcode_pool.run_piped(stream, body, write)
+        finally:
+            await body.aclose()
+
+    def _get_source_key(self, url: str) -> str | None:
+        """Get the key of an archived episode from its enclosure url, None if it isn't one of ours."""
+        base_url = self._app_config.inet_path.encoded_string()
+        if not url.startswith(base_url):
+            return None
+        key = PurePosixPath(url.removeprefix(base_url))
+        # Episodes are archived directly in the podcast's content directory, derived files are never built upon
+        if key.parent != PurePosixPath("content", self._podcast.name_one_word) or key.suffix not in AUDIO_FORMATS:
+            return None
+        return key.as_posix()
+
+    async def _get_size(self, key: str) -> int | None:
+        """Get the size of an archived file, None if it isn't there."""
+        if self._s3:
+            return s3_file_cache.get_size(key)
+        file_path = AsyncPath(get_app_paths().web_root / key)
+        if not await file_path.is_file():
+            return None
+        return (await file_path.stat()).st_size
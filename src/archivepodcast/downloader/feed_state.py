@@ -0,0 +1,95 @@
+"""State of the last processed upstream feed, so unchanged feeds aren't fetched and processed again."""
+
+import hashlib
+from typing import TYPE_CHECKING
+
+from anyio import Path as AsyncPath
+from pydantic import BaseModel, ValidationError
+
+from archivepodcast.constants import JSON_INDENT
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.s3 import S3_STATE_PREFIX, s3_get, s3_put
+
+if TYPE_CHECKING:
+    from archivepodcast.config import AppConfig, PodcastConfig  # pragma: no cover
+else:
+    AppConfig = object
+    PodcastConfig = object
+
+logger = get_logger(__name__)
+
+
+class FeedState(BaseModel):
+    """Validators from the last processed upstream feed."""
+
+    etag: str = ""
+    last_modified: str = ""
+    content_hash: str = ""  # For hosts that don't do conditional requests but serve identical bytes
+    config_hash: str = ""  # The validators only hold while the podcast is configured the same way
+
+    def get_conditional_headers(self) -> dict[str, str]:
+        """Get the headers for a conditional GET of the feed."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def get_feed_content_hash(content: bytes) -> str:
+    """Hash the raw upstream feed, to tell if it has changed since it was last processed."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_podcast_config_hash(podcast: PodcastConfig, app_config: AppConfig) -> str:
+    """Hash the config that changes how a feed is processed, so a config edit isn't hidden behind an unchanged feed."""
+    podcast_config_json = podcast.model_dump_json(exclude={"live"})
+    return hashlib.sha256(f"{app_config.inet_path}\n{podcast_config_json}".encode()).hexdigest()
+
+
+def get_feed_state_s3_key(podcast_name: str) -> str:
+    """Get the s3 key of the feed state, under the state prefix so it isn't served or listed."""
+    return f"{S3_STATE_PREFIX}feed_state/{podcast_name}.json"
+
+
+def _get_feed_state_path(podcast_name: str) -> AsyncPath:
+    """Get the local path of the feed state, in the instance directory so it isn't served."""
+    return AsyncPath(get_app_paths().instance_path / "feed_state" / f"{podcast_name}.json")
+
+
+async def load_feed_state(podcast_name: str, s3_bucket: str | None = None) -> FeedState:
+    """Load the feed state from the instance directory, or s3 if it isn't there and a bucket is given."""
+    feed_state_path = _get_feed_state_path(podcast_name)
+
+    feed_state_json = b""
+    if await feed_state_path.is_file():
+        feed_state_json = await feed_state_path.read_bytes()
+    elif s3_bucket:  # Fresh container (lambda) won't have the state on disk
+        feed_state_json = await s3_get(s3_bucket, get_feed_state_s3_key(podcast_name))
+
+    if feed_state_json == b"":
+        return FeedState()
+
+    try:
+        return FeedState.model_validate_json(feed_state_json)
+    except ValidationError:
+        logger.warning("[%s] Feed state is not valid, ignoring it", podcast_name)
+        return FeedState()
+
+
+async def save_feed_state(podcast_name: str, feed_state: FeedState, s3_bucket: str | None = None) -> None:
+    """Save the feed state to the instance directory, and s3 if a bucket is given."""
+    feed_state_json = feed_state.model_dump_json(indent=JSON_INDENT)
+
+    feed_state_path = _get_feed_state_path(podcast_name)
+    await feed_state_path.parent.mkdir(parents=True, exist_ok=True)
+    await feed_state_path.write_text(feed_state_json, encoding="utf-8")
+    logger.debug("[%s] Saved feed state: %s", podcast_name, feed_state_path)
+
+    if s3_bucket:
+        try:
+            await s3_put(s3_bucket, get_feed_state_s3_key(podcast_name), feed_state_json.encode(), "application/json")
+        except Exception:
+            logger.exception("[%s] Unhandled s3 error trying to upload the feed state", podcast_name)
@@ -21,6 +21,7 @@ if TYPE_CHECKING:
     import xml.etree.ElementTree as ET
 
     from anyio import Path as AsyncPath
+    from ffmpeg.dag.nodes import OutputStream
 
 logger = get_logger(__name__)
 
@@ -49,17 +50,80 @@ def get_file_date_string(channel: ET.Element) -> str:
     return file_date_string
 
 
-def convert_to_mp3(input_path: Path | AsyncPath, output_path: Path | AsyncPath) -> None:
-    """Convert an audio file to MP3 using ffmpeg."""
-    ff_input = ffmpeg.input(filename=Path(input_path))
-    ff = ffmpeg.output(
+def get_mp3_conversion(input_path: Path | AsyncPath | str, output_path: Path | AsyncPath | str) -> OutputStream:
+    """Get the ffmpeg job that converts an audio file to MP3, either path can be an ffmpeg pipe."""
+    ff_input = ffmpeg.input(filename=str(input_path))
+    return ffmpeg.output(
         ff_input,
-        filename=Path(output_path),
+        filename=str(output_path),
+        f="mp3",  # Not taken from the extension, the output can be a pipe or a part file
         codec="libmp3lame",
         aq=4,
         extra_options={"loglevel": "warning", "hide_banner": None},
     )
-    ff.run(overwrite_output=True)
+
+
+def get_rendition_conversion(
+    input_path: Path | AsyncPath | str,
+    output_path: Path | AsyncPath | str,
+    *,
+    codec: str,
+    muxer: str,
+    bitrate_kbps: int,
+) -> OutputStream:
+    """Get the ffmpeg job that transcodes an episode to a low bitrate rendition, dropping any cover art."""
+    ff_input = ffmpeg.input(filename=str(input_path))
+    return ffmpeg.output(
+        ff_input,
+        filename=str(output_path),
+        f=muxer,  # Not taken from the extension, the output is a part file
+        codec=codec,
+        vn=True,
+        extra_options={"b:a": f"{bitrate_kbps}k", "loglevel": "warning"},
+    )
+
+
+def get_pcm_decode(
+    input_path: Path | AsyncPath | str, output_path: Path | AsyncPath | str, *, sample_rate: int
+) -> OutputStream:
+    """Get the ffmpeg job that decodes an episode to raw mono signed 16 bit little endian samples."""
+    ff_input = ffmpeg.input(filename=str(input_path))
+    return ffmpeg.output(
+        ff_input,
+        filename=str(output_path),
+        f="s16le",
+        vn=True,
+        extra_options={"ac": 1, "ar": sample_rate, "loglevel": "warning"},
+    )
+
+
+def get_hls_segmenting(
+    input_path: Path | AsyncPath | str, playlist_path: Path, *, segment_seconds: int, copy: bool
+) -> OutputStream:
+    """Get the ffmpeg job that splits an episode into HLS segments next to its playlist.
+
+    With copy the audio is only remuxed, otherwise it's encoded to AAC.
+    """
+    ff_input = ffmpeg.input(filename=str(input_path))
+    return ffmpeg.output(
+        ff_input,
+        filename=str(playlist_path),
+        f="hls",
+        codec="copy" if copy else "aac",
+        vn=True,
+        extra_options={
+            "b:a": None if copy else "128k",
+            "hls_time": segment_seconds,
+            "hls_playlist_type": "vod",
+            "hls_segment_filename": str(playlist_path.parent / "%05d.ts"),
+            "loglevel": "warning",
+        },
+    )
+
+
+def convert_to_mp3(input_path: Path | AsyncPath, output_path: Path | AsyncPath) -> None:
+    """Convert an audio file to MP3 using ffmpeg, blocking until it's done."""
+    get_mp3_conversion(input_path, output_path).run(overwrite_output=True)
 
 
 def _ffmpeg_convert_check() -> None:
@@ -0,0 +1,107 @@
+"""HLS playlists of episodes, so long episodes start playing without fetching large ranges of one big file."""
+
+import asyncio
+import shutil
+from functools import partial
+from pathlib import Path, PurePosixPath
+
+from anyio import Path as AsyncPath
+from anyio import to_thread
+
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.manifest import ManifestEntry
+from archivepodcast.utils.s3 import s3_put_file
+
+from .constants import CONTENT_TYPES
+from .episode_assets import EpisodeAssetBuilder
+from .helpers import get_hls_segmenting
+from .partial_download import get_part_path
+
+logger = get_logger(__name__)
+
+HLS_DIRECTORY_NAME = "hls"  # Under the podcast's content directory, with a directory per episode
+HLS_PLAYLIST_NAME = "index.m3u8"
+HLS_COPY_FORMATS = {".mp3", ".m4a"}  # Can go in MPEG-TS segments as they are, anything else is encoded to AAC
+HLS_UPLOAD_CONCURRENCY = 4  # Segments of an episode uploaded at once
+
+
+class HLSBuilder(EpisodeAssetBuilder):
+    """Builds the HLS playlists and segments of a podcast's episodes, which the webplayer prefers when there is one.
+
+    The playlist is what's checked for and recorded, it's put in place after its segments so it's never served
+    pointing at segments that aren't there yet.
+    """
+
+    description = "HLS playlist"
+
+    def _get_derived_key(self, source_key: str) -> str:
+        stem = PurePosixPath(source_key).stem
+        return f"content/{self._podcast.name_one_word}/{HLS_DIRECTORY_NAME}/{stem}/{HLS_PLAYLIST_NAME}"
+
+    async def _build(self, source_key: str, derived_key: str) -> int:
+        """Segment the episode into a part directory, then move it into place or upload it."""
+        playlist_directory = get_app_paths().web_root / PurePosixPath(derived_key).parent
+        part_directory = get_part_path(playlist_directory)
+        await _remove_directory(part_directory)  # From a run that was interrupted
+        await AsyncPath(part_directory).mkdir(parents=True)
+        stream = get_hls_segmenting(
+            self._get_source_input(source_key),
+            part_directory / HLS_PLAYLIST_NAME,
+            segment_seconds=self._app_config.web_page.hls_segment_seconds,
+            copy=PurePosixPath(source_key).suffix in HLS_COPY_FORMATS,
+        )
+
+        try:
+            await self._run(source_key, stream)
+            segment_paths = sorted([Path(path) async for path in AsyncPath(part_directory).glob("*.ts")])
+            if self._s3:
+                return await self._upload(source_key, derived_key, part_directory, segment_paths)
+            return await _move_into_place(derived_key, part_directory, segment_paths)
+        finally:
+            await _remove_directory(part_directory)
+
+    async def _upload(self, source_key: str, derived_key: str, part_directory: Path, segment_paths: list[Path]) -> int:
+        """Upload the segments HLS_UPLOAD_CONCURRENCY at a time, then the playlist. Returns the size of the playlist."""
+        key_prefix = derived_key.removesuffix(HLS_PLAYLIST_NAME)
+        semaphore = asyncio.Semaphore(HLS_UPLOAD_CONCURRENCY)
+
+        async def _upload_segment(segment_path: Path) -> None:
+            async with semaphore:
+                s3_file = await s3_put_file(
+                    self._app_config.s3.bucket, key_prefix + segment_path.name, segment_path, CONTENT_TYPES[".ts"]
+                )
+            s3_file_cache.add_file(s3_file)
+            asset_manifest.record(ManifestEntry.from_s3_file(s3_file, source_key))
+
+        async with asyncio.TaskGroup() as task_group:
+            for segment_path in segment_paths:
+                task_group.create_task(_upload_segment(segment_path))
+
+        s3_file = await s3_put_file(
+            self._app_config.s3.bucket, derived_key, part_directory / HLS_PLAYLIST_NAME, CONTENT_TYPES[".m3u8"]
+        )
+        s3_file_cache.add_file(s3_file)
+        return s3_file.size
+
+
+async def _move_into_place(derived_key: str, part_directory: Path, segment_paths: list[Path]) -> int:
+    """Move the segments then the playlist into the web root. Returns the size of the playlist."""
+    playlist_path = get_app_paths().web_root / derived_key
+    await AsyncPath(playlist_path.parent).mkdir(parents=True, exist_ok=True)
+    key_prefix = derived_key.removesuffix(HLS_PLAYLIST_NAME)
+    for segment_path in segment_paths:
+        size = (await AsyncPath(segment_path).stat()).st_size
+        await AsyncPath(segment_path).replace(playlist_path.parent / segment_path.name)
+        local_file_cache.add_file(Path(key_prefix + segment_path.name), size)
+
+    await AsyncPath(part_directory / HLS_PLAYLIST_NAME).replace(playlist_path)
+    size = (await AsyncPath(playlist_path).stat()).st_size
+    local_file_cache.add_file(Path(derived_key), size)
+    return size
+
+
+async def _remove_directory(path: Path) -> None:
+    await to_thread.run_sync(partial(shutil.rmtree, path, ignore_errors=True))
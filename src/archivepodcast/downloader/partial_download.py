@@ -0,0 +1,76 @@
+"""Partially downloaded assets, kept so a failed download can resume where it left off."""
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from anyio import Path as AsyncPath
+from pydantic import BaseModel, ValidationError
+
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+logger = get_logger(__name__)
+
+
+class PartialDownload(BaseModel):
+    """Where a partial download came from, so it is only ever resumed from the same file."""
+
+    url: str
+    validator: str  # Strong ETag or Last-Modified of the origin file, sent as If-Range
+
+    @classmethod
+    def from_headers(cls, url: str, headers: Mapping[str, str]) -> PartialDownload | None:
+        """Create the partial download state from the response headers, None if the origin can't resume."""
+        if headers.get("Accept-Ranges", "").lower() != "bytes":
+            return None
+
+        etag = headers.get("ETag", "")
+        validator = etag if etag and not etag.startswith("W/") else headers.get("Last-Modified", "")
+        if not validator:  # Without a validator a changed file would get spliced onto the old one
+            return None
+
+        return cls(url=url, validator=validator)
+
+
+def get_part_path(file_path: Path) -> Path:
+    """Get the path an asset is downloaded to before it's complete, in the instance directory so it isn't served."""
+    web_root = get_app_paths().web_root
+    relative_path = file_path.relative_to(web_root) if file_path.is_relative_to(web_root) else Path(file_path.name)
+    return get_app_paths().instance_path / "partial_downloads" / relative_path.parent / f"{relative_path.name}.part"
+
+
+def _get_state_path(part_path: Path) -> AsyncPath:
+    return AsyncPath(part_path.with_name(f"{part_path.name}.json"))
+
+
+async def get_resume_state(part_path: Path, url: str) -> tuple[PartialDownload | None, int]:
+    """Get the partial download state and how many bytes are already on disk, discarding anything unusable."""
+    state_path = _get_state_path(part_path)
+    async_part_path = AsyncPath(part_path)
+
+    partial_download = None
+    if await state_path.is_file():
+        try:
+            partial_download = PartialDownload.model_validate_json(await state_path.read_bytes())
+        except ValidationError:
+            logger.warning("Partial download state is not valid, ignoring it: %s", state_path)
+
+    if partial_download is None or partial_download.url != url or not await async_part_path.is_file():
+        await discard_partial(part_path)
+        return None, 0
+
+    return partial_download, (await async_part_path.stat()).st_size
+
+
+async def save_resume_state(part_path: Path, partial_download: PartialDownload) -> None:
+    """Save the partial download state next to the partial file."""
+    await _get_state_path(part_path).write_text(partial_download.model_dump_json(), encoding="utf-8")
+
+
+async def discard_partial(part_path: Path) -> None:
+    """Remove the partial file and its state."""
+    await AsyncPath(part_path).unlink(missing_ok=True)
+    await _get_state_path(part_path).unlink(missing_ok=True)
@@ -0,0 +1,128 @@
+"""Low bitrate renditions of episodes, and the lite feed that points at them."""
+
+import copy
+import xml.etree.ElementTree as ET
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING
+
+from anyio import Path as AsyncPath
+from pydantic import BaseModel
+
+from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.s3 import s3_put_file
+
+from .episode_assets import EpisodeAssetBuilder
+from .helpers import get_rendition_conversion
+from .partial_download import get_part_path
+
+if TYPE_CHECKING:
+    from archivepodcast.config import AppConfig, PodcastConfig  # pragma: no cover
+
+    from .transcoder import TranscodePool
+else:
+    AppConfig = object
+    PodcastConfig = object
+
+logger = get_logger(__name__)
+
+LITE_FEED_SUFFIX = "-lite"
+_ATOM_LINK_TAG = "{http://www.w3.org/2005/Atom}link"
+_ITUNES_NEW_FEED_URL_TAG = "{http://www.itunes.com/dtds/podcast-1.0.dtd}new-feed-url"
+RENDITION_DIRECTORY_NAME = "lite"  # Under the podcast's content directory
+
+
+class RenditionFormat(BaseModel):
+    """How a rendition is encoded and served."""
+
+    extension: str
+    content_type: str
+    codec: str
+    muxer: str
+
+
+RENDITION_FORMATS: dict[str, RenditionFormat] = {
+    "opus": RenditionFormat(extension=".opus", content_type="audio/ogg", codec="libopus", muxer="opus"),
+    "aac": RenditionFormat(extension=".m4a", content_type="audio/mp4", codec="aac", muxer="ipod"),
+}
+
+
+def get_lite_feed_name(podcast: PodcastConfig) -> str:
+    """Get the name the lite feed is served under, /rss/<name>."""
+    return podcast.name_one_word + LITE_FEED_SUFFIX
+
+
+class RenditionBuilder(EpisodeAssetBuilder):
+    """Builds the low bitrate renditions of a podcast's episodes, and its lite feed."""
+
+    description = "lite rendition"
+
+    def __init__(
+        self, podcast: PodcastConfig, app_config: AppConfig, *, s3: bool, transcode_pool: TranscodePool
+    ) -> None:
+        """Initialise the RenditionBuilder, the podcast must have a lite rendition set."""
+        super().__init__(podcast, app_config, s3=s3, transcode_pool=transcode_pool)
+        self._format = RENDITION_FORMATS[podcast.lite_rendition]
+
+    async def get_lite_feed(self, tree: ET.ElementTree[ET.Element]) -> ET.ElementTree[ET.Element]:
+        """Get a copy of the feed with its enclosures pointing at the renditions, episodes without one are unchanged."""
+        lite_root = copy.deepcopy(tree.getroot())
+        channel_title = lite_root.find("channel/title")
+        if channel_title is not None and channel_title.text:
+            channel_title.text += " (Lite)"
+
+        base_url = self._app_config.inet_path.encoded_string()
+        lite_feed_url = f"{base_url}rss/{get_lite_feed_name(self._podcast)}"
+        for atom_link in lite_root.iterfind(f"channel/{_ATOM_LINK_TAG}[@rel='self']"):
+            atom_link.set("href", lite_feed_url)
+        for new_feed_url in lite_root.iterfind(f"channel/{_ITUNES_NEW_FEED_URL_TAG}"):
+            new_feed_url.text = lite_feed_url
+
+        for enclosure in lite_root.iter("enclosure"):
+            source_key = self._get_source_key(enclosure.get("url", ""))
+            if source_key is None:
+                continue
+            rendition_key = self._get_derived_key(source_key)
+            size = await self._get_size(rendition_key)
+            if size is None:
+                continue
+            enclosure.set("url", base_url + rendition_key)
+            enclosure.set("type", self._format.content_type)
+            enclosure.set("length", str(size))
+
+        return ET.ElementTree(lite_root)
+
+    def _get_derived_key(self, source_key: str) -> str:
+        stem = PurePosixPath(source_key).stem
+        return f"content/{self._podcast.name_one_word}/{RENDITION_DIRECTORY_NAME}/{stem}{self._format.extension}"
+
+    async def _build(self, source_key: str, derived_key: str) -> int:
+        """Transcode the episode into a part file, then move it into place or upload it."""
+        rendition_path = AsyncPath(get_app_paths().web_root / derived_key)
+        part_path = get_part_path(Path(rendition_path))
+        await AsyncPath(part_path.parent).mkdir(parents=True, exist_ok=True)
+        stream = get_rendition_conversion(
+            self._get_source_input(source_key),
+            part_path,
+            codec=self._format.codec,
+            muxer=self._format.muxer,
+            bitrate_kbps=self._podcast.lite_bitrate_kbps,
+        )
+
+        try:
+            await self._run(source_key, stream)
+            if self._s3:
+                s3_file = await s3_put_file(
+                    self._app_config.s3.bucket, derived_key, part_path, self._format.content_type
+                )
+                s3_file_cache.add_file(s3_file)
+                return s3_file.size
+
+            await rendition_path.parent.mkdir(parents=True, exist_ok=True)
+            await AsyncPath(part_path).replace(rendition_path)
+            size = (await rendition_path.stat()).st_size
+            local_file_cache.add_file(Path(derived_key), size)
+            return size
+        finally:
+            await AsyncPath(part_path).unlink(missing_ok=True)
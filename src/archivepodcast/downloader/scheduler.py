@@ -0,0 +1,120 @@
+"""Schedule asset downloads across all podcasts."""
+
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Self
+from urllib.parse import urlsplit
+
+from archivepodcast.utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator
+
+    from archivepodcast.config import AppDownloadConfig  # pragma: no cover
+else:
+    AppDownloadConfig = object
+
+logger = get_logger(__name__)
+
+
+class _Waiter:
+    """A download waiting for a slot."""
+
+    def __init__(self, podcast: str, host: str) -> None:
+        """Initialise the waiter, the future is resolved when a slot is granted."""
+        self.podcast = podcast
+        self.host = host
+        self.future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+
+class DownloadScheduler:
+    """Hands out download slots with a global limit, a per host limit, and round robin between podcasts.
+
+    Each podcast has its own queue, when a slot frees up the next podcast in turn gets it,
+    so one podcast with a big backlog can't starve the others.
+    """
+
+    def __init__(self, max_concurrent: int, max_per_host: int) -> None:
+        """Initialise the DownloadScheduler object."""
+        self._max_concurrent = max_concurrent
+        self._max_per_host = max_per_host
+        self._queues: dict[str, deque[_Waiter]] = {}  # Insertion order is the round robin order
+        self._active = 0
+        self._active_per_host: Counter[str] = Counter()
+
+    @classmethod
+    def from_config(cls, download_config: AppDownloadConfig) -> Self:
+        """Create a DownloadScheduler from the download config."""
+        return cls(
+            max_concurrent=download_config.global_concurrency,
+            max_per_host=download_config.host_concurrency,
+        )
+
+    @asynccontextmanager
+    async def slot(self, podcast: str, url: str) -> AsyncGenerator[None]:
+        """Wait for a download slot for the url, held until the context exits."""
+        waiter = _Waiter(podcast=podcast, host=urlsplit(url).hostname or "")
+        self._queues.setdefault(podcast, deque()).append(waiter)
+        self._dispatch()
+
+        if not waiter.future.done():
+            logger.trace("[%s] Waiting for a download slot for host: %s", podcast, waiter.host)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():  # Granted just as we were cancelled
+                self._release(waiter.host)
+            else:
+                self._remove(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(waiter.host)
+
+    def _dispatch(self) -> None:
+        """Grant slots to waiting downloads while there is capacity."""
+        while self._active < self._max_concurrent:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+
+            self._active += 1
+            self._active_per_host[waiter.host] += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> _Waiter | None:
+        """Pop the first waiter from the next podcast in turn whose host has capacity."""
+        for podcast, queue in list(self._queues.items()):
+            for waiter in queue:
+                if self._active_per_host[waiter.host] >= self._max_per_host:
+                    continue
+
+                queue.remove(waiter)
+                del self._queues[podcast]
+                if queue:  # Back of the line
+                    self._queues[podcast] = queue
+                return waiter
+
+        return None
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Remove a waiter that gave up before being granted a slot."""
+        queue = self._queues.get(waiter.podcast)
+        if queue is None or waiter not in queue:
+            return
+
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.podcast]
+
+    def _release(self, host: str) -> None:
+        """Give back a slot and hand it to the next waiter."""
+        self._active -= 1
+        self._active_per_host[host] -= 1
+        if self._active_per_host[host] == 0:
+            del self._active_per_host[host]
+        self._dispatch()
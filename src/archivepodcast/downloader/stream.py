@@ -0,0 +1,108 @@
+"""Stream response bodies to a sink without the sink holding up the event loop."""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Protocol
+
+from pydantic import BaseModel
+
+from archivepodcast.utils.logger import get_logger
+
+from .constants import MAX_READ_SIZE, MIN_READ_SIZE, WRITE_BEHIND_SIZE
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+logger = get_logger(__name__)
+
+_BYTES_PER_MIB = 1024 * 1024
+
+
+class StreamContent(Protocol):
+    """The part of aiohttp's StreamReader that is read from, an s3 StreamingBody reads the same way."""
+
+    async def read(self, n: int = -1, /) -> bytes:
+        """Read up to n bytes."""
+        ...
+
+
+class TransferStats(BaseModel):
+    """How long a transfer spent waiting on each side, to tell which one is the bottleneck."""
+
+    size: int = 0
+    elapsed: float = 0.0
+    network_wait: float = 0.0
+    sink_wait: float = 0.0
+
+    def get_summary(self) -> str:
+        """Get the stats as a human readable string."""
+        throughput = self.size / _BYTES_PER_MIB / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            f"{self.size / _BYTES_PER_MIB:.1f} MiB at {throughput:.1f} MiB/s, "
+            f"waited {self.network_wait:.2f}s on the network and {self.sink_wait:.2f}s on the write"
+        )
+
+
+def _get_next_read_size(read_size: int, chunk_size: int) -> int:
+    """Double the read size while reads come back full, halve it while they come back mostly empty."""
+    if chunk_size >= read_size:
+        return min(read_size * 2, MAX_READ_SIZE)
+    if chunk_size < read_size // 4:
+        return max(read_size // 2, MIN_READ_SIZE)
+    return read_size
+
+
+async def stream_to_sink(
+    content: StreamContent,
+    write: Callable[[bytes], Awaitable[object]],
+    write_size: int = WRITE_BEHIND_SIZE,
+) -> TransferStats:
+    """Read the content into a buffer, writing it out in write_size blocks while the next block is read.
+
+    Reads start small and double while the network keeps filling them, so fast transfers aren't
+    bottlenecked on the number of reads. Only one write is in flight at a time.
+    """
+    stats = TransferStats()
+    start_time = time.perf_counter()
+    read_size = MIN_READ_SIZE
+    buffer = bytearray()
+    pending_write: asyncio.Future[object] | None = None
+
+    async def _wait_for_write() -> None:
+        nonlocal pending_write
+        if pending_write is None:
+            return
+        wait_start = time.perf_counter()
+        try:
+            await pending_write
+        finally:
+            pending_write = None
+            stats.sink_wait += time.perf_counter() - wait_start
+
+    try:
+        while True:
+            read_start = time.perf_counter()
+            chunk = await content.read(read_size)
+            stats.network_wait += time.perf_counter() - read_start
+            if not chunk:
+                break
+
+            stats.size += len(chunk)
+            buffer += chunk
+            read_size = _get_next_read_size(read_size, len(chunk))
+
+            while len(buffer) >= write_size:
+                await _wait_for_write()
+                pending_write = asyncio.ensure_future(write(bytes(buffer[:write_size])))
+                del buffer[:write_size]
+
+        await _wait_for_write()
+        if buffer:
+            pending_write = asyncio.ensure_future(write(bytes(buffer)))
+            await _wait_for_write()
+    finally:
+        if pending_write is not None:  # Let an in flight write finish, so the sink has everything before the error
+            await asyncio.gather(pending_write, return_exceptions=True)
+
+    stats.elapsed = time.perf_counter() - start_time
+    return stats
@@ -0,0 +1,163 @@
+"""Run ffmpeg jobs without holding up the event loop."""
+
+import asyncio
+import contextlib
+import os
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Any, Self
+from weakref import WeakKeyDictionary
+
+from ffmpeg.exceptions import FFMpegExecuteError
+
+from archivepodcast.utils.logger import get_logger
+
+from .constants import WRITE_BEHIND_SIZE
+from .helpers import get_mp3_conversion
+from .stream import TransferStats, stream_to_sink
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+    from pathlib import Path
+
+    from anyio import Path as AsyncPath
+    from ffmpeg.dag.nodes import OutputStream
+
+    from archivepodcast.config import AppDownloadConfig  # pragma: no cover
+
+    from .stream import StreamContent
+else:
+    AppDownloadConfig = object
+
+logger = get_logger(__name__)
+
+FFMPEG_STDIN = "pipe:0"
+FFMPEG_STDOUT = "pipe:1"
+
+
+class TranscodePool:
+    """Runs ffmpeg as a subprocess awaited on the event loop, with a limit on how many run at once.
+
+    ffmpeg is its own process, so a pool of them is what spreads conversions over the cores, the event loop only
+    waits on them. Should be shared between podcasts so the limit is global.
+    """
+
+    def __init__(self, max_concurrent: int) -> None:
+        """Initialise the TranscodePool object."""
+        self._max_concurrent = max_concurrent
+        # One per event loop, each grab runs on a new one
+        self._semaphores: WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = WeakKeyDictionary()
+
+    @property
+    def max_concurrent(self) -> int:
+        """How many ffmpeg jobs run at once."""
+        return self._max_concurrent
+
+    @classmethod
+    def from_config(cls, download_config: AppDownloadConfig) -> Self:
+        """Create a TranscodePool from the download config, 0 concurrency means one per core."""
+        return cls(max_concurrent=download_config.ffmpeg_concurrency or os.cpu_count() or 1)
+
+    async def convert_to_mp3(self, input_path: Path | AsyncPath, output_path: Path | AsyncPath) -> float:
+        """Convert an audio file to MP3. Returns how long the conversion took, not counting waiting for a slot."""
+        return await self.run(get_mp3_conversion(input_path, output_path))
+
+    async def run(self, stream: OutputStream) -> float:
+        """Run an ffmpeg job once a slot is free. Returns how long it ran, raises FFMpegExecuteError on failure."""
+        async with self._get_semaphore():
+            start_time = time.time()
+            process = await stream.run_async_awaitable(overwrite_output=True, pipe_stderr=True)
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+            duration = time.time() - start_time
+
+        if process.returncode != 0:
+            raise FFMpegExecuteError(
+                retcode=process.returncode,
+                cmd=stream.compile_line(overwrite_output=True),
+                stdout=b"",
+                stderr=stderr,
+            )
+
+        return duration
+
+    async def run_piped(
+        self,
+        stream: OutputStream,
+        content: StreamContent | None,
+        write: Callable[[bytes], Awaitable[object]] | None = None,
+        write_size: int = WRITE_BEHIND_SIZE,
+    ) -> TransferStats:
+        """Run an ffmpeg job that reads from FFMPEG_STDIN once a slot is free, feeding it the content.
+
+        Without content the job reads its own input, for jobs that only need their output streamed. If write is given
+        the job should output to FFMPEG_STDOUT, which is streamed to write in write_size blocks while the content is
+        still being fed in. Returns the stats of what was fed in.
+        The job is killed if feeding or writing fails, raises FFMpegExecuteError if it fails.
+        """
+        async with self._get_semaphore():
+            process = await stream.run_async_awaitable(
+                overwrite_output=True, pipe_stdin=content is not None, pipe_stdout=write is not None, pipe_stderr=True
+            )
+            stdin, stdout, stderr = process.stdin, process.stdout, process.stderr
+            if (
+                stderr is None or (content is not None and stdin is None) or (write is not None and stdout is None)
+            ):  # pragma: no cover
+                process.kill()
+                await process.wait()
+                msg = "ffmpeg was started without its pipes"
+                raise RuntimeError(msg)
+
+            stderr_task = asyncio.ensure_future(stderr.read())
+            tasks: list[asyncio.Future[Any]] = [stderr_task]
+            if write is not None and stdout is not None:
+                tasks.append(asyncio.ensure_future(stream_to_sink(stdout, write, write_size)))
+
+            try:
+                feed_stats = (
+                    await _feed_stdin(stdin, content) if stdin is not None and content is not None else TransferStats()
+                )
+                await asyncio.gather(*tasks)
+                await process.wait()
+            except BaseException:
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await process.wait()
+                raise
+
+        if process.returncode != 0 or feed_stats is None:
+            raise FFMpegExecuteError(
+                retcode=process.returncode or 0,
+                cmd=stream.compile_line(overwrite_output=True),
+                stdout=b"",
+                stderr=stderr_task.result(),
+            )
+
+        return feed_stats
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the semaphore for the running event loop."""
+        return self._semaphores.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self._max_concurrent))
+
+
+async def _feed_stdin(stdin: asyncio.StreamWriter, content: StreamContent) -> TransferStats | None:
+    """Stream the content into ffmpeg's stdin and close it. None if ffmpeg stopped reading, its exit code says why."""
+    try:
+        feed_stats = await stream_to_sink(content, partial(_write_to_stdin, stdin))
+        stdin.close()
+        await stdin.wait_closed()
+    except BrokenPipeError, ConnectionResetError:
+        return None
+    return feed_stats
+
+
+async def _write_to_stdin(stdin: asyncio.StreamWriter, data: bytes) -> None:
+    stdin.write(data)
+    await stdin.drain()
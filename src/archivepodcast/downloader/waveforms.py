@@ -0,0 +1,131 @@
+"""Waveform peaks of episodes, drawn by the webplayer so listeners can see where they are in an episode."""
+
+import math
+import sys
+from array import array
+from pathlib import Path, PurePosixPath
+
+from anyio import Path as AsyncPath
+from anyio import to_thread
+from pydantic import BaseModel
+
+from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.s3 import S3File, get_s3_etag, s3_put
+
+from .episode_assets import EpisodeAssetBuilder
+from .helpers import get_pcm_decode
+from .partial_download import get_part_path
+from .transcoder import FFMPEG_STDOUT
+
+logger = get_logger(__name__)
+
+WAVEFORM_EXTENSION = ".peaks.json"  # Replaces the episode's extension, the sidecar sits next to it
+WAVEFORM_CONTENT_TYPE = "application/json"
+WAVEFORM_SAMPLE_RATE = 8000  # Plenty to find the peaks, and keeps the decoded audio small
+WAVEFORM_WIDTH = 1000  # Roughly how many min/max pairs a waveform has, however long the episode
+WAVEFORM_BITS = 8
+
+_SAMPLE_SIZE = 2  # Bytes, ffmpeg decodes to signed 16 bit
+_SAMPLES_PER_BLOCK = 80  # 10ms, blocks are merged down to the waveform width once the episode's length is known
+
+
+class WaveformPeaks(BaseModel):
+    """Peaks of an episode, in the JSON format of the audiowaveform tool so existing players can draw them too."""
+
+    version: int = 2
+    channels: int = 1
+    sample_rate: int = WAVEFORM_SAMPLE_RATE
+    samples_per_pixel: int
+    bits: int = WAVEFORM_BITS
+    length: int  # Pixels, data has a min and a max for each
+    data: list[int]
+
+
+class PeakReducer:
+    """Reduces decoded samples to the min and max of each block as they come out of ffmpeg.
+
+    Samples are handled an array slice at a time rather than one by one, so it's the C builtins doing the work.
+    Not thread safe, but the chunks can be added from a worker thread one after the other.
+    """
+
+    def __init__(self, samples_per_block: int = _SAMPLES_PER_BLOCK) -> None:
+        """Initialise the PeakReducer object."""
+        self._samples_per_block = samples_per_block
+        self._mins = array("h")
+        self._maxs = array("h")
+        self._remainder = b""  # Bytes that don't make up a whole block yet
+
+    def add(self, data: bytes) -> None:
+        """Add a chunk of raw signed 16 bit little endian samples, chunks can end anywhere."""
+        data = self._remainder + data
+        block_size = self._samples_per_block * _SAMPLE_SIZE
+        whole_blocks_size = len(data) - len(data) % block_size
+        self._remainder = data[whole_blocks_size:]
+        self._add_samples(data[:whole_blocks_size])
+
+    def finish(self) -> None:
+        """Add the last partial block, once all the samples are in."""
+        remainder, self._remainder = self._remainder, b""
+        self._add_samples(remainder[: len(remainder) - len(remainder) % _SAMPLE_SIZE])
+
+    def get_peaks(self, width: int = WAVEFORM_WIDTH) -> WaveformPeaks:
+        """Merge the blocks down to about width min/max pairs, scaled to 8 bits."""
+        blocks_per_pixel = max(1, math.ceil(len(self._mins) / width))
+        shift = _SAMPLE_SIZE * 8 - WAVEFORM_BITS
+        data: list[int] = []
+        for start in range(0, len(self._mins), blocks_per_pixel):
+            end = start + blocks_per_pixel
+            data.extend((min(self._mins[start:end]) >> shift, max(self._maxs[start:end]) >> shift))
+
+        return WaveformPeaks(
+            samples_per_pixel=blocks_per_pixel * self._samples_per_block, length=len(data) // 2, data=data
+        )
+
+    def _add_samples(self, data: bytes) -> None:
+        samples = array("h", data)
+        if sys.byteorder == "big":  # pragma: no cover
+            samples.byteswap()
+        for start in range(0, len(samples), self._samples_per_block):
+            block = samples[start : start + self._samples_per_block]
+            self._mins.append(min(block))
+            self._maxs.append(max(block))
+
+
+class WaveformBuilder(EpisodeAssetBuilder):
+    """Builds the waveform peak sidecars of a podcast's episodes, which the webplayer fetches when one is played."""
+
+    description = "waveform"
+
+    def _get_derived_key(self, source_key: str) -> str:
+        stem = PurePosixPath(source_key).stem
+        return f"content/{self._podcast.name_one_word}/{stem}{WAVEFORM_EXTENSION}"
+
+    async def _build(self, source_key: str, derived_key: str) -> int:
+        """Decode the episode through ffmpeg, reducing the samples in a worker thread as they stream out."""
+        reducer = PeakReducer()
+
+        async def _reduce(data: bytes) -> None:
+            await to_thread.run_sync(reducer.add, data)
+
+        stream = get_pcm_decode(self._get_source_input(source_key), FFMPEG_STDOUT, sample_rate=WAVEFORM_SAMPLE_RATE)
+        await self._run(source_key, stream, _reduce)
+        reducer.finish()
+        peaks = reducer.get_peaks().model_dump_json().encode()
+
+        if self._s3:
+            await s3_put(self._app_config.s3.bucket, derived_key, peaks, WAVEFORM_CONTENT_TYPE)
+            s3_file_cache.add_file(S3File(key=derived_key, size=len(peaks), etag=get_s3_etag(peaks)))
+            return len(peaks)
+
+        waveform_path = AsyncPath(get_app_paths().web_root / derived_key)
+        part_path = AsyncPath(get_part_path(Path(waveform_path)))
+        await part_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            await part_path.write_bytes(peaks)
+            await part_path.replace(waveform_path)
+        finally:
+            await part_path.unlink(missing_ok=True)
+        local_file_cache.add_file(Path(derived_key), len(peaks))
+        return len(peaks)
@@ -0,0 +1,5 @@
+"""Content cache instance for Archivepodcast."""
+
+from archivepodcast.utils.content_cache import ContentCache
+
+content_cache = ContentCache()
@@ -0,0 +1,5 @@
+"""Asset manifest instance for Archivepodcast."""
+
+from archivepodcast.utils.manifest import AssetManifest
+
+asset_manifest = AssetManifest()
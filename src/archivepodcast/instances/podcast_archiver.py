@@ -20,6 +20,7 @@ from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.instances.profiler import event_times
 from archivepodcast.utils.log_messages import get_time_str
 from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.s3 import run_and_close_s3_client
 
 from .config import get_ap_config
 
@@ -112,7 +113,7 @@ def podcast_loop() -> None:
 
         current_datetime = datetime.datetime.now(tz=datetime.UTC)
 
-        asyncio.run(_ap.write_health_s3())
+        asyncio.run(run_and_close_s3_client(_ap.write_health_s3()))
 
         # Calculate time until next run
         seconds_until_next_run = _get_time_until_next_run(current_datetime)
@@ -1,26 +1,52 @@
 """Routes for serving archived podcast content."""
 
 from http import HTTPStatus
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING
 
-from fastapi import APIRouter, Response
-from fastapi.responses import FileResponse, RedirectResponse
+from anyio import Path as AsyncPath
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
+from archivepodcast.downloader.constants import CONTENT_TYPES
 from archivepodcast.instances.config import get_ap_config
+from archivepodcast.instances.content_cache import content_cache
+from archivepodcast.instances.path_cache import s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.instances.podcast_archiver import generate_404
 from archivepodcast.utils.logger import get_logger
+from archivepodcast.utils.s3 import S3File, get_s3_client, s3_head
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from aiobotocore.response import StreamingBody
+
+    from archivepodcast.config import AppS3Config
 
 logger = get_logger(__name__)
 router = APIRouter(include_in_schema=False)
 
+_BYTES_PER_MIB = 1024 * 1024
+_READ_SIZE = 1024 * 1024
+_WHOLE_OBJECT_RANGE = "bytes=0-"  # What players ask for to start playback, served like a request with no range
+# Served with their type set explicitly, the mimetypes guess is missing or wrong for these
+_HLS_MEDIA_TYPES = {suffix: CONTENT_TYPES[suffix] for suffix in (".m3u8", ".ts")}
+
 
 @router.get("/content/{path:path}")
-def send_content(path: str) -> Response:
+async def send_content(path: str, request: Request) -> Response:
     """Serve Content."""
     ap_conf = get_ap_config()
 
     if ap_conf.app.storage_backend == "s3":
+        if ".." in PurePosixPath(path).parts:  # Anything outside content/ in the bucket isn't served
+            return generate_404()
+        if ap_conf.app.s3.content_cache_mb > 0:
+            return await _send_content_s3_cached(ap_conf.app.s3, f"content/{path}", request)
+
         path_obj = Path(path)
         web_root = Path(get_app_paths().web_root)
         relative_path = str(path_obj).replace(str(web_root), "")  # The easiest way to get the "relative" path
@@ -29,7 +55,115 @@ def send_content(path: str) -> Response:
 
     web_dir = (get_app_paths().instance_path / "web" / "content").resolve()
     file_path = (web_dir / path).resolve()
-    if not file_path.is_relative_to(web_dir) or not file_path.is_file():
+    if not file_path.is_relative_to(web_dir) or not await AsyncPath(file_path).is_file():
         return generate_404()
 
-    return FileResponse(file_path)
+    return FileResponse(file_path, media_type=_HLS_MEDIA_TYPES.get(file_path.suffix))
+
+
+async def _send_content_s3_cached(s3_config: AppS3Config, key: str, request: Request) -> Response:
+    """Serve content from the local cache, streaming it from s3 into the cache on a miss.
+
+    A range request on a miss is passed through to s3, unless it's for the whole object, and the whole object is
+    streamed into the cache once the range has been sent.
+    """
+    s3_file = await _get_s3_file(s3_config.bucket, key)
+    if s3_file is None:
+        return generate_404()
+
+    cache_path = await content_cache.get(key, s3_file.size, s3_file.etag)
+    if cache_path is not None:
+        return FileResponse(cache_path, media_type=_HLS_MEDIA_TYPES.get(cache_path.suffix))  # Handles range requests
+
+    range_header = request.headers.get("range", "")
+    whole_object = range_header in {"", _WHOLE_OBJECT_RANGE}
+
+    s3_client = await get_s3_client()
+    try:
+        if whole_object:
+            s3_object = await s3_client.get_object(Bucket=s3_config.bucket, Key=key)
+        else:
+            s3_object = await s3_client.get_object(Bucket=s3_config.bucket, Key=key, Range=range_header)
+    except ClientError as exc:
+        error_code = exc.response.get("Error", {}).get("Code", "")
+        if error_code in {"NoSuchKey", "404"}:
+            return generate_404()
+        if error_code == "InvalidRange":
+            return Response(status_code=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        raise
+
+    size = s3_object["ContentLength"]
+    headers = {"Content-Length": str(size), "Accept-Ranges": "bytes"}
+
+    if not whole_object:
+        headers["Content-Range"] = s3_object.get("ContentRange", "")
+        return StreamingResponse(
+            _iter_body(s3_object["Body"]),
+            status_code=HTTPStatus.PARTIAL_CONTENT,
+            headers=headers,
+            media_type=s3_object.get("ContentType"),
+            background=BackgroundTask(_fill_content_cache, s3_config, s3_file),
+        )
+
+    logger.debug("Content cache miss, streaming from s3: %s", key)
+    return StreamingResponse(
+        content_cache.stream_into(
+            key,
+            _iter_body(s3_object["Body"]),
+            size,
+            s3_config.content_cache_mb * _BYTES_PER_MIB,
+            s3_object.get("ETag", ""),
+        ),
+        headers=headers,
+        media_type=s3_object.get("ContentType"),
+    )
+
+
+async def _fill_content_cache(s3_config: AppS3Config, s3_file: S3File) -> None:
+    """Stream a whole object into the cache after a range request for part of it missed.
+
+    Players start with a small range, Safari asks for bytes=0-1, so nothing they play would get cached otherwise.
+    """
+    max_size = s3_config.content_cache_mb * _BYTES_PER_MIB
+    if s3_file.size > max_size or content_cache.is_filling(s3_file.key):
+        return
+    if await content_cache.get(s3_file.key, s3_file.size, s3_file.etag) is not None:  # Cached since
+        return
+
+    s3_client = await get_s3_client()
+    try:
+        s3_object = await s3_client.get_object(Bucket=s3_config.bucket, Key=s3_file.key)
+    except ClientError:
+        logger.exception("Unable to fetch s3 content to cache it: %s", s3_file.key)
+        return
+
+    logger.debug("Content cache miss on a range request, caching the whole object from s3: %s", s3_file.key)
+    chunks = content_cache.stream_into(
+        s3_file.key, _iter_body(s3_object["Body"]), s3_object["ContentLength"], max_size, s3_object.get("ETag", "")
+    )
+    async for _ in chunks:
+        pass
+
+
+async def _iter_body(body: StreamingBody) -> AsyncIterator[bytes]:
+    """Iterate over an s3 object's body, closing it once done."""
+    try:
+        async for chunk in body.iter_chunks(_READ_SIZE):
+            yield chunk
+    finally:
+        await body.aclose()
+
+
+async def _get_s3_file(bucket: str, key: str) -> S3File | None:
+    """Get the size and ETag of an object, from the s3 file cache before asking s3. None if it isn't there."""
+    s3_file = s3_file_cache.get_file(key)
+    if s3_file is not None:
+        return s3_file
+
+    try:
+        s3_object = await s3_head(bucket, key)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code", "") in {"NoSuchKey", "404"}:
+            return None
+        raise
+    return S3File(key=key, size=s3_object["ContentLength"], etag=s3_object.get("ETag", ""))
@@ -12,6 +12,7 @@ from .instances.path_helper import get_app_paths
 from .instances.profiler import event_times
 from .utils import logger as ap_logger
 from .utils.profiler import get_event_times_str
+from .utils.s3 import run_and_close_s3_client
 
 
 def run_ap_adhoc(
@@ -42,7 +43,7 @@ def run_ap_adhoc(
     event_times.set_event_time("PodcastArchiver", time.time() - podcast_archiver_start_time)
 
     ap.grab_podcasts()
-    asyncio.run(ap.write_health_s3())
+    asyncio.run(run_and_close_s3_client(ap.write_health_s3()))
     event_times.set_event_time("/", time.time() - start_time)
 
     logger.trace(health.get_health().model_dump_json(indent=JSON_INDENT))
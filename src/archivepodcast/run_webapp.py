@@ -17,11 +17,13 @@ if TYPE_CHECKING:
 from .constants import DEFAULT_INSTANCE_PATH, PROGRAM_VERSION
 from .instances import podcast_archiver
 from .instances.config import get_ap_config
+from .instances.path_cache import local_file_cache
 from .instances.path_helper import get_app_paths
 from .instances.profiler import event_times
 from .routers import api_router, content_router, rss_router, static_router, webpages_router
 from .utils import logger as ap_logger
 from .utils.log_messages import log_intro
+from .utils.s3 import close_s3_client
 
 logger = ap_logger.get_logger(__name__)
 
@@ -57,8 +59,14 @@ def create_app(instance_path_override: str | None = None) -> FastAPI:
 
     @asynccontextmanager
     async def lifespan(_: FastAPI) -> AsyncGenerator[None]:
+        if ap_conf.webapp.watch_web_root and ap_conf.app.storage_backend == "local":
+            local_file_cache.start_watching()
         podcast_archiver.initialise_archivepodcast()
-        yield
+        try:
+            yield
+        finally:
+            local_file_cache.stop_watching()
+            await close_s3_client()  # The content routes' client, on the server's event loop
 
     app = FastAPI(title="ArchivePodcast", version=PROGRAM_VERSION, lifespan=lifespan)
 
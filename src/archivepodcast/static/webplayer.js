@@ -9,6 +9,17 @@ const placeholder_image =
 // Current podcast cover image URL, defaults to placeholder
 let current_podcast_cover_image = placeholder_image;
 
+// URL of the episode that was picked, the player's src changes if it switches to the HLS playlist
+let current_episode_url = "";
+
+// Waveform peaks of the current episode, if the page has a waveform and the episode has peaks
+let current_waveform = null;
+
+const hls_playlist_type = "application/vnd.apple.mpegurl";
+
+const waveform_played_colour = "#008080";
+const waveform_unplayed_colour = "#888";
+
 /**
  * Updates the audio player with new episode details and metadata
  * @param {string} url - Audio file URL
@@ -24,8 +35,11 @@ export function playerSetCurrentEpisode(url, type, episodeName, podcastName) {
   podcastTitle.textContent = `${podcastName}`;
   episodeTitle.textContent = `${episodeName}`;
 
+  current_episode_url = url;
   player.src = url;
   player.type = type;
+  preferHlsPlaylist(url);
+  loadWaveform(url);
 
   try {
     const cover_image_element = document.getElementById("podcast-player-cover");
@@ -48,6 +62,121 @@ export function playerSetCurrentEpisode(url, type, episodeName, podcastName) {
   }
 }
 
+/**
+ * Gets the URL of an episode's HLS playlist, which is archived in a directory of its own next to it
+ * @param {string} url - Audio file URL
+ * @returns {string} HLS playlist URL
+ */
+export function getHlsPlaylistUrl(url) {
+  return url.replace(/\/([^/]+)\.[^./]+$/, "/hls/$1/index.m3u8");
+}
+
+/**
+ * Switches the player to the episode's HLS playlist if it has one, so long episodes start quickly.
+ * Only where HLS plays natively, and not once the episode has started playing
+ * @param {string} url - Audio file URL
+ */
+export async function preferHlsPlaylist(url) {
+  const player = document.getElementById("podcast-audio-player");
+  if (!player.hasAttribute("data-hls-playlists") || !player.canPlayType(hls_playlist_type)) {
+    return;
+  }
+
+  const playlistUrl = getHlsPlaylistUrl(url);
+  try {
+    const response = await fetch(playlistUrl);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+  } catch (error) {
+    console.log("No HLS playlist for episode:", error);
+    return;
+  }
+
+  if (current_episode_url !== url || !player.paused || player.currentTime > 0) {
+    return; // Another episode was picked, or this one has started playing (it can be at 0 while it buffers)
+  }
+  console.log("Setting player src to HLS playlist:", playlistUrl);
+  player.src = playlistUrl;
+}
+
+/**
+ * Gets the URL of an episode's waveform peaks, which are archived next to it
+ * @param {string} url - Audio file URL
+ * @returns {string} Waveform peaks URL
+ */
+export function getWaveformUrl(url) {
+  return url.replace(/\.[^./]+$/, ".peaks.json");
+}
+
+/**
+ * Fetches the waveform peaks of an episode and draws them, the waveform stays hidden if it has none
+ * @param {string} url - Audio file URL
+ */
+export async function loadWaveform(url) {
+  const canvas = document.getElementById("podcast-player-waveform");
+  if (!canvas) {
+    return;
+  }
+  current_waveform = null;
+  canvas.hidden = true;
+
+  try {
+    const response = await fetch(getWaveformUrl(url));
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const waveform = await response.json();
+    if (current_episode_url !== url) {
+      return; // Another episode was picked while this one was loading
+    }
+    current_waveform = waveform;
+    canvas.hidden = false;
+    drawWaveform();
+  } catch (error) {
+    console.log("No waveform for episode:", error);
+  }
+}
+
+/**
+ * Draws the current waveform, the part that has been played in a different colour
+ */
+function drawWaveform() {
+  const canvas = document.getElementById("podcast-player-waveform");
+  const player = document.getElementById("podcast-audio-player");
+  const context = canvas?.getContext ? canvas.getContext("2d") : null;
+  if (!current_waveform || !context) {
+    return;
+  }
+
+  canvas.width = canvas.clientWidth || canvas.width;
+  const middle = canvas.height / 2;
+  const scale = middle / 2 ** (current_waveform.bits - 1);
+  const played = player.duration ? (player.currentTime / player.duration) * canvas.width : 0;
+
+  context.clearRect(0, 0, canvas.width, canvas.height);
+  for (let x = 0; x < canvas.width; x++) {
+    const pixel = Math.floor((x / canvas.width) * current_waveform.length);
+    const min = current_waveform.data[pixel * 2];
+    const max = current_waveform.data[pixel * 2 + 1];
+    context.fillStyle = x < played ? waveform_played_colour : waveform_unplayed_colour;
+    context.fillRect(x, middle - max * scale, 1, Math.max(1, (max - min) * scale));
+  }
+}
+
+/**
+ * Seeks to where the waveform was clicked
+ * @param {MouseEvent} event - Click on the waveform
+ */
+export function seekToWaveformClick(event) {
+  const player = document.getElementById("podcast-audio-player");
+  const canvas = event.currentTarget;
+  if (!player.duration || !canvas.clientWidth) {
+    return;
+  }
+  player.currentTime = (event.offsetX / canvas.clientWidth) * player.duration;
+}
+
 /**
  * Fetches and parses an XML podcast feed
  * @param {string} url - Feed URL
@@ -153,6 +282,13 @@ export function showJSDivs() {
   if (breadcrumbJSDiv) {
     breadcrumbJSDiv.style.display = "block";
   }
+
+  const waveform = document.getElementById("podcast-player-waveform");
+  const player = document.getElementById("podcast-audio-player");
+  if (waveform && player) {
+    waveform.onclick = seekToWaveformClick;
+    player.ontimeupdate = drawWaveform;
+  }
 }
 
 window.loadPodcast = loadPodcast;
@@ -0,0 +1,190 @@
+"""Read-through cache of s3 content on local disk, for serving content without a cdn in front of the bucket."""
+
+import contextlib
+from collections import OrderedDict
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+import anyio
+from anyio import Path as AsyncPath
+from pydantic import BaseModel
+
+from archivepodcast.instances.path_helper import get_app_paths
+
+from .logger import get_logger
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterable, AsyncIterator
+    from pathlib import Path
+
+logger = get_logger(__name__)
+
+CONTENT_CACHE_DIRECTORY_NAME = "content_cache"
+_PART_SUFFIX = ".part"
+_ETAG_SUFFIX = ".etag"  # Next to a cached object, the ETag of the version that was cached
+
+
+class CachedObject(BaseModel):
+    """The version of an s3 object that's in the cache."""
+
+    size: int
+    etag: str = ""  # Quoted, as s3 gives it. Empty if it's not known
+
+    def is_current(self, size: int, etag: str) -> bool:
+        """Check if this is the version of the object in s3, by its ETag if both are known, otherwise its size."""
+        if self.etag and etag:
+            return self.etag == etag
+        return self.size == size
+
+
+class ContentCache:
+    """Least recently used cache of s3 objects in the instance directory, bounded by their total size.
+
+    Objects are written to the cache while they are streamed to the first client to ask for them, and served from
+    disk after that as long as they're still the version in s3. What's in the cache survives restarts, it's picked
+    up again on first use.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the content cache, the cache directory is scanned on first use."""
+        self._entries: OrderedDict[str, CachedObject] = OrderedDict()  # Least recently used first
+        self._total_size = 0
+        self._directory: Path | None = None
+        self._filling: set[str] = set()  # Keys being written to the cache
+
+    async def get(self, key: str, size: int, etag: str = "") -> Path | None:
+        """Get the path of a cached object, marking it as recently used. None if it isn't cached.
+
+        The size and ETag are of the object in s3, a cached version that doesn't match them is dropped.
+        """
+        directory = await self._get_directory()
+        cached_object = self._entries.get(key)
+        if cached_object is None:
+            return None
+
+        if not cached_object.is_current(size, etag):
+            logger.debug("Cached s3 content has changed in s3, dropping it: %s", key)
+            await self._remove(key)
+            return None
+
+        cache_path = directory / key
+        if not await AsyncPath(cache_path).is_file():  # Removed from under us
+            await self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return cache_path
+
+    async def stream_into(
+        self, key: str, chunks: AsyncIterable[bytes], size: int, max_size: int, etag: str = ""
+    ) -> AsyncIterator[bytes]:
+        """Pass the chunks of an object through, writing them to the cache on the way.
+
+        The object is only added once every chunk has been written, an interrupted stream leaves nothing behind.
+        Objects bigger than max_size, or already being written by another stream, are passed through uncached.
+        The ETag is of the version being streamed, it's kept with the object so changes in s3 can be spotted.
+        """
+        cache_path = await self._get_cache_path(key)
+        if cache_path is None or size > max_size or key in self._filling:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        self._filling.add(key)
+        part_path = AsyncPath(cache_path.with_name(cache_path.name + _PART_SUFFIX))
+        written = 0
+        try:
+            await part_path.parent.mkdir(parents=True, exist_ok=True)
+            part_file = await anyio.open_file(part_path, "wb")
+            try:
+                async for chunk in chunks:
+                    await part_file.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+            finally:
+                await part_file.aclose()
+
+            if written != size:
+                logger.warning("Got %d bytes of %s from s3, expected %d, not caching it", written, key, size)
+                return
+
+            await self._remove(key)  # Any older version, and its ETag
+            if etag:
+                await AsyncPath(cache_path.with_name(cache_path.name + _ETAG_SUFFIX)).write_text(etag)
+            await part_path.replace(cache_path)
+            self._add(key, CachedObject(size=size, etag=etag))
+            await self._evict(max_size)
+            logger.debug("Cached s3 content: %s", key)
+        finally:
+            self._filling.discard(key)
+            with contextlib.suppress(OSError):
+                await part_path.unlink(missing_ok=True)
+
+    def is_filling(self, key: str) -> bool:
+        """Check if an object is being written to the cache by a stream."""
+        return key in self._filling
+
+    def get_total_size(self) -> int:
+        """Get the total size of the cached objects, in bytes."""
+        return self._total_size
+
+    def _add(self, key: str, cached_object: CachedObject) -> None:
+        previous = self._entries.pop(key, None)
+        self._total_size += cached_object.size - (previous.size if previous is not None else 0)
+        self._entries[key] = cached_object
+
+    async def _remove(self, key: str) -> None:
+        """Remove an object and its ETag from the cache, if it's there."""
+        cached_object = self._entries.pop(key, None)
+        if cached_object is not None:
+            self._total_size -= cached_object.size
+
+        cache_path = (await self._get_directory()) / key
+        for path in (cache_path, cache_path.with_name(cache_path.name + _ETAG_SUFFIX)):
+            with contextlib.suppress(OSError):
+                await AsyncPath(path).unlink(missing_ok=True)
+
+    async def _evict(self, max_size: int) -> None:
+        """Remove the least recently used objects until the cache fits in max_size."""
+        while self._total_size > max_size and self._entries:
+            key = next(iter(self._entries))
+            await self._remove(key)
+            logger.debug("Evicted s3 content from the cache: %s", key)
+
+    async def _get_cache_path(self, key: str) -> Path | None:
+        """Get where an object is cached, None for a key that would land outside the cache directory."""
+        directory = await self._get_directory()
+        cache_path = (directory / key).resolve()
+        if not cache_path.is_relative_to(directory) or cache_path == directory:
+            return None
+        return cache_path
+
+    async def _get_directory(self) -> Path:
+        """Get the cache directory, (re)loading what's in it if the instance directory changed."""
+        directory = (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME).resolve()
+        if directory == self._directory:
+            return directory
+
+        self._entries = OrderedDict()
+        self._total_size = 0
+        self._directory = directory
+        await AsyncPath(directory).mkdir(parents=True, exist_ok=True)
+
+        cached_files: list[tuple[float, str, CachedObject]] = []
+        async for file_path in AsyncPath(directory).rglob("*"):
+            if not await file_path.is_file() or file_path.name.endswith(_ETAG_SUFFIX):
+                continue
+            if file_path.name.endswith(_PART_SUFFIX):  # Left by an interrupted stream
+                await file_path.unlink(missing_ok=True)
+                continue
+            stat = await file_path.stat()
+            etag_path = file_path.with_name(file_path.name + _ETAG_SUFFIX)
+            etag = await etag_path.read_text() if await etag_path.is_file() else ""
+            cached_object = CachedObject(size=stat.st_size, etag=etag)
+            cached_files.append((stat.st_mtime, file_path.relative_to(directory).as_posix(), cached_object))
+
+        for _, key, cached_object in sorted(cached_files, key=itemgetter(0, 1)):  # Oldest first, roughly LRU
+            self._add(key, cached_object)
+
+        logger.debug("Loaded %d cached s3 objects from %s", len(self._entries), directory)
+        return directory
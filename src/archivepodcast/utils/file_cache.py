@@ -1,39 +1,171 @@
 """Module for local file caching functionality."""
 
-from typing import TYPE_CHECKING
+import os
+import time
+from pathlib import Path
 
-if TYPE_CHECKING:
-    from pathlib import Path
+from pydantic import BaseModel
+
+from .inotify import DirectoryWatcher
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# A directory modified this close to a scan could change again within its mtime's granularity unnoticed
+_RACY_MTIME_NS = 2 * 1_000_000_000
+
+
+class ScannedDirectory(BaseModel):
+    """A directory as it was when it was last scanned."""
+
+    mtime_ns: int  # -1 if it was modified too recently to trust
+    files: set[Path]  # Relative to the web root
+    subdirectories: list[str]
 
 
 class LocalFileCache:
-    """Class representing a local file cache."""
+    """Class representing a local file cache.
+
+    Refreshes only list the directories that changed since the last one, going by the directory mtime, or by inotify
+    events once watching has been started.
+    """
 
     def __init__(self) -> None:
         """Initialise the local file cache."""
-        self._files: list[Path] | None = None
+        self._files: set[Path] | None = None
+        self._sorted_files: list[Path] | None = None  # Sorted snapshot of _files, None when it needs rebuilding
+        self._sizes: dict[Path, int] = {}
+        self._web_root: Path | None = None
+        self._directories: dict[Path, ScannedDirectory] = {}  # Relative to the web root
+        self._watcher: DirectoryWatcher | None = None
 
     def refresh(self, web_root: Path) -> None:
-        """Refresh the local file cache."""
-        self._files = [path.relative_to(web_root) for path in web_root.rglob("*") if path.is_file()]
-        self._files.sort()
+        """Refresh the local file cache, verified sizes are kept for files that are still there."""
+        if web_root != self._web_root:
+            self.stop_watching()
+            self._web_root = web_root
+            self._directories = {}
+
+        changed_directories = self._watcher.get_changed() if self._watcher is not None else None
+        files = self._scan(web_root, changed_directories)
+
+        if files != self._files:
+            self._files = files
+            self._sorted_files = None
+        self._sizes = {file_path: self._sizes[file_path] for file_path in files if file_path in self._sizes}
+
+    def start_watching(self) -> None:
+        """Use inotify to tell which directories changed, instead of checking each one's mtime on refresh."""
+        if self._watcher is not None or self._web_root is None:
+            return
+
+        try:
+            self._watcher = DirectoryWatcher()
+        except OSError as exc:
+            logger.info("Not watching the web root for changes, falling back to scanning it: %s", exc)
+            return
+
+        self._directories = {}  # Anything could have changed before the watches were added
+        self.refresh(self._web_root)
+        logger.debug("Watching the web root for changes: %s", self._web_root)
+
+    def stop_watching(self) -> None:
+        """Stop using inotify, refreshes go back to checking each directory's mtime."""
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
 
     def get_all(self) -> list[Path]:
-        """Get all cached file paths."""
-        if self._files is None:
-            msg = "File cache is not initialized. Call refresh() first."
-            raise ValueError(msg)
-        return self._files
+        """Get all cached file paths, sorted."""
+        files = self._get_files()
+        if self._sorted_files is None:
+            self._sorted_files = sorted(files)
+        return self._sorted_files
 
     def check_exists(self, file_path: Path) -> bool:
         """Check if a file path exists in the cache."""
-        return file_path in self.get_all()
+        return file_path in self._get_files()
+
+    def get_size(self, file_path: Path) -> int | None:
+        """Get the size a file was verified at when it was downloaded, None if it wasn't."""
+        return self._sizes.get(file_path)
+
+    def add_file(self, file_path: Path, size: int | None = None) -> None:
+        """Add a new file path to the cache, with its verified size if known."""
+        files = self._get_files()
+        if file_path not in files:
+            files.add(file_path)
+            self._sorted_files = None
+        if size is not None:
+            self._sizes[file_path] = size
 
-    def add_file(self, file_path: Path) -> None:
-        """Add a new file path to the cache."""
+    def _get_files(self) -> set[Path]:
         if self._files is None:
             msg = "File cache is not initialized. Call refresh() first."
             raise ValueError(msg)
-        if file_path not in self._files:
-            self._files.append(file_path)
-            self._files.sort()
+        return self._files
+
+    def _scan(self, web_root: Path, changed_directories: set[Path] | None) -> set[Path]:
+        """Walk the web root, only listing the directories that changed since they were last scanned.
+
+        With changed_directories from a watcher the rest aren't even checked, otherwise their mtime is compared.
+        """
+        scan_start_ns = time.time_ns()
+        directories: dict[Path, ScannedDirectory] = {}
+        pending = [Path()]
+        while pending:
+            relative_directory = pending.pop()
+            directory = web_root / relative_directory
+            scanned_directory = self._directories.get(relative_directory)
+
+            unchanged = (
+                scanned_directory is not None
+                and changed_directories is not None
+                and directory not in changed_directories
+                and self._watcher is not None
+                and self._watcher.is_watched(directory)
+            )
+            if not unchanged:
+                try:
+                    mtime_ns = directory.stat().st_mtime_ns
+                except OSError:  # Removed since its parent was scanned
+                    continue
+
+                if scanned_directory is None or scanned_directory.mtime_ns != mtime_ns:
+                    if scan_start_ns - mtime_ns < _RACY_MTIME_NS:
+                        mtime_ns = -1
+                    scanned_directory = self._scan_directory(web_root, relative_directory, mtime_ns)
+
+            if scanned_directory is None:
+                continue
+            directories[relative_directory] = scanned_directory
+            pending.extend(relative_directory / name for name in scanned_directory.subdirectories)
+
+        self._directories = directories
+        files: set[Path] = set()
+        for scanned_directory in directories.values():
+            files |= scanned_directory.files
+        return files
+
+    def _scan_directory(self, web_root: Path, relative_directory: Path, mtime_ns: int) -> ScannedDirectory | None:
+        directory = web_root / relative_directory
+        if self._watcher is not None:  # Before listing it, so nothing added in between is missed
+            try:
+                self._watcher.watch(directory)
+            except OSError:
+                logger.warning("Unable to watch %s, falling back to scanning the web root", directory)
+                self.stop_watching()
+
+        files = set()
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                    elif entry.is_file():
+                        files.add(relative_directory / entry.name)
+        except OSError:
+            return None
+
+        return ScannedDirectory(mtime_ns=mtime_ns, files=files, subdirectories=subdirectories)
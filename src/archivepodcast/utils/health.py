@@ -10,6 +10,7 @@ from typing import TYPE_CHECKING, Self
 from pydantic import BaseModel
 
 from archivepodcast.constants import PROGRAM_VERSION
+from archivepodcast.instances.path_cache import s3_file_cache
 from archivepodcast.utils.logger import get_logger
 
 if TYPE_CHECKING:
@@ -143,6 +144,7 @@ class CoreHealth(BaseModel):
     currently_rendering: bool = False
     currently_loading_config: bool = False
     memory_mb: float = -0.0
+    s3_file_cache_mb: float = 0.0
     debug: bool = False
 
 
@@ -175,6 +177,7 @@ class PodcastArchiverHealth:
         with contextlib.suppress(OSError):
             resident_pages = int(Path("/proc/self/statm").read_text(encoding="utf-8").split()[1])
             self._core.memory_mb = resident_pages * os.sysconf("SC_PAGESIZE") / (1024 * 1024)
+        self._core.s3_file_cache_mb = s3_file_cache.get_memory_usage() / (1024 * 1024)
 
         return PodcastArchiverHealthAPI(
             core=self._core,
@@ -0,0 +1,109 @@
+"""Watch directories for changes with inotify, linux only."""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import TYPE_CHECKING
+
+from .logger import get_logger
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = get_logger(__name__)
+
+# From <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ONLYDIR = 0x01000000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+_WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len, then len bytes of name
+_READ_SIZE = 64 * 1024
+
+
+class DirectoryWatcher:
+    """Collects which watched directories had entries added or removed, read without blocking."""
+
+    def __init__(self) -> None:
+        """Create the inotify instance, raises OSError where inotify isn't available."""
+        libc_name = ctypes.util.find_library("c")
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            inotify_init1 = self._libc.inotify_init1
+        except (OSError, AttributeError) as exc:
+            msg = "inotify is not available on this platform"
+            raise OSError(msg) from exc
+
+        self._fd: int = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._watches: dict[int, Path] = {}
+        self._watched_paths: set[Path] = set()
+
+    def watch(self, directory: Path) -> None:
+        """Watch a directory for entries being added or removed, subdirectories need their own watch."""
+        if directory in self._watched_paths:
+            return
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+
+        self._watches[wd] = directory
+        self._watched_paths.add(directory)
+
+    def is_watched(self, directory: Path) -> bool:
+        """Check if a directory is being watched."""
+        return directory in self._watched_paths
+
+    def get_changed(self) -> set[Path] | None:
+        """Get the directories that changed since the last call, None if events were lost so anything could have."""
+        changed: set[Path] | None = set()
+        while True:
+            try:
+                events = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(events):
+                wd, mask, _, name_length = _EVENT_HEADER.unpack_from(events, offset)
+                offset += _EVENT_HEADER.size + name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed = None
+                    continue
+
+                directory = self._watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_MOVE_SELF:  # The watch would follow it, under its old path
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    self._unwatch(wd)
+                    changed = None
+                elif mask & IN_IGNORED:  # Removed, or unwatched by the kernel
+                    self._unwatch(wd)
+                elif changed is not None:
+                    changed.add(directory)
+
+        return changed
+
+    def _unwatch(self, wd: int) -> None:
+        self._watched_paths.discard(self._watches.pop(wd))
+
+    def close(self) -> None:
+        """Stop watching everything."""
+        os.close(self._fd)
+        self._watches = {}
+        self._watched_paths = set()
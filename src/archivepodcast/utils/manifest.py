@@ -0,0 +1,227 @@
+"""Manifest of archived assets, kept in SQLite so it survives restarts and lambda cold starts."""
+
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+from anyio import Path as AsyncPath
+from pydantic import BaseModel
+
+from archivepodcast.instances.path_helper import get_app_paths
+
+from .logger import get_logger
+from .s3 import S3_STATE_PREFIX, S3File, s3_get, s3_put_file
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from types_aiobotocore_s3.type_defs import ObjectTypeDef  # pragma: no cover
+else:
+    ObjectTypeDef = object
+
+logger = get_logger(__name__)
+
+MANIFEST_FILE_NAME = "manifest.sqlite3"
+MANIFEST_S3_KEY = f"{S3_STATE_PREFIX}{MANIFEST_FILE_NAME}"  # Source urls can carry private feed tokens
+RECONCILE_INTERVAL = 24 * 60 * 60  # How often a prefix in the manifest is checked against an s3 listing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL DEFAULT '',
+    source_url TEXT NOT NULL DEFAULT '',
+    episode_guid TEXT NOT NULL DEFAULT '',
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reconciliations (
+    prefix TEXT PRIMARY KEY,
+    reconciled_at INTEGER NOT NULL
+);
+"""
+
+
+class ManifestEntry(BaseModel):
+    """An archived asset."""
+
+    key: str  # Relative to the web root, the s3 key in s3 mode
+    size: int
+    content_hash: str = ""  # The ETag s3 gave the object without its quotes, multipart upload ETags end in -<parts>
+    source_url: str = ""
+    episode_guid: str = ""
+    created_at: int = 0
+    updated_at: int = 0
+
+    @classmethod
+    def from_s3_file(cls, s3_file: S3File, source_url: str = "", episode_guid: str = "") -> ManifestEntry:
+        """Get the entry for an object that landed in s3, with the ETag s3 gave it."""
+        return cls(
+            key=s3_file.key,
+            size=s3_file.size,
+            content_hash=s3_file.etag.strip('"'),
+            source_url=source_url,
+            episode_guid=episode_guid,
+        )
+
+
+class AssetManifest:
+    """Manifest of archived assets in the instance directory, synced to s3. Only kept in s3 mode."""
+
+    def __init__(self) -> None:
+        """Initialise the manifest, the database is opened on first use."""
+        self._connection: sqlite3.Connection | None = None
+        self._path: Path | None = None
+        self._changed: bool = False  # Since it was last uploaded to s3
+
+    def get(self, key: str) -> ManifestEntry | None:
+        """Get the entry for an asset, None if it isn't in the manifest."""
+        row = self._get_connection().execute("SELECT * FROM assets WHERE key = ?", (key,)).fetchone()
+        return ManifestEntry(**row) if row is not None else None
+
+    def get_prefix(self, prefix: str) -> list[ManifestEntry]:
+        """Get the entries for the assets under a prefix, e.g. content/<podcast>/."""
+        rows = self._get_connection().execute(
+            "SELECT * FROM assets WHERE key >= ? AND key < ? ORDER BY key", _get_key_range(prefix)
+        )
+        return [ManifestEntry(**row) for row in rows]
+
+    def get_prefix_objects(self, prefix: str) -> list[ObjectTypeDef]:
+        """Get the assets under a prefix as s3 listing objects, to load into the s3 file cache."""
+        s3_objects: list[ObjectTypeDef] = []
+        for entry in self.get_prefix(prefix):
+            s3_object: ObjectTypeDef = {"Key": entry.key, "Size": entry.size}
+            if entry.content_hash:
+                s3_object["ETag"] = f'"{entry.content_hash}"'
+            s3_objects.append(s3_object)
+        return s3_objects
+
+    def record(self, entry: ManifestEntry) -> None:
+        """Add or update an asset as it lands, when it was first recorded is kept."""
+        now = int(time.time())
+        connection = self._get_connection()
+        with connection:
+            connection.execute(
+                """
+                INSERT INTO assets (key, size, content_hash, source_url, episode_guid, created_at, updated_at)
+                VALUES (:key, :size, :content_hash, :source_url, :episode_guid, :now, :now)
+                ON CONFLICT (key) DO UPDATE SET
+                    size = excluded.size,
+                    content_hash = excluded.content_hash,
+                    source_url = excluded.source_url,
+                    episode_guid = excluded.episode_guid,
+                    updated_at = excluded.updated_at
+                """,
+                {**entry.model_dump(exclude={"created_at", "updated_at"}), "now": now},
+            )
+        self._changed = True
+        logger.trace("Recorded asset in manifest: %s", entry.key)
+
+    def needs_reconcile(self, prefix: str) -> bool:
+        """Check if a prefix hasn't been checked against an s3 listing within RECONCILE_INTERVAL."""
+        row = (
+            self._get_connection()
+            .execute("SELECT reconciled_at FROM reconciliations WHERE prefix = ?", (prefix,))
+            .fetchone()
+        )
+        return row is None or time.time() - row["reconciled_at"] >= RECONCILE_INTERVAL
+
+    def reconcile(self, prefix: str, s3_objects: list[ObjectTypeDef]) -> None:
+        """Make the assets under a prefix match an s3 listing of it, keeping what the listing doesn't know."""
+        now = int(time.time())
+        listed_keys = {s3_object["Key"] for s3_object in s3_objects}
+        connection = self._get_connection()
+        recorded = {entry.key: entry for entry in self.get_prefix(prefix)}
+
+        with connection:
+            connection.executemany(
+                "DELETE FROM assets WHERE key = ?", [(key,) for key in recorded.keys() - listed_keys]
+            )
+            connection.executemany(
+                """
+                INSERT INTO assets (key, size, content_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    size = excluded.size, content_hash = excluded.content_hash, updated_at = excluded.updated_at
+                """,
+                [
+                    (s3_object["Key"], s3_object["Size"], s3_object.get("ETag", "").strip('"'), now, now)
+                    for s3_object in s3_objects
+                    if _is_changed(recorded.get(s3_object["Key"]), s3_object)
+                ],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO reconciliations (prefix, reconciled_at) VALUES (?, ?)", (prefix, now)
+            )
+
+        self._changed = True
+        logger.debug("Reconciled manifest with s3 listing: %s, %d assets", prefix, len(listed_keys))
+
+    async def load_from_s3(self, bucket: str) -> None:
+        """Download the manifest from s3 if there isn't one in the instance directory, e.g. on a lambda cold start."""
+        manifest_path = AsyncPath(get_app_paths().instance_path / MANIFEST_FILE_NAME)
+        if await manifest_path.is_file():
+            return
+
+        manifest_bytes = await s3_get(bucket, MANIFEST_S3_KEY)
+        if manifest_bytes == b"":
+            logger.debug("No manifest in s3, starting a new one")
+            return
+
+        self.close()
+        await manifest_path.write_bytes(manifest_bytes)
+        try:
+            self._get_connection().execute("SELECT COUNT(*) FROM assets").fetchone()
+        except sqlite3.DatabaseError:
+            logger.warning("Manifest from s3 is not valid, starting a new one")
+            self.close()
+            await manifest_path.unlink()
+            return
+
+        logger.info("Loaded manifest from s3")
+
+    async def save_to_s3(self, bucket: str) -> None:
+        """Upload the manifest to s3 if it changed since it was last uploaded."""
+        if not self._changed or self._path is None:
+            return
+
+        try:
+            await s3_put_file(bucket, MANIFEST_S3_KEY, self._path, "application/vnd.sqlite3")
+        except Exception:
+            logger.exception("Unhandled s3 error trying to upload the manifest")
+            return
+
+        self._changed = False
+        logger.debug("Uploaded manifest to s3")
+
+    def close(self) -> None:
+        """Close the database, it's opened again on next use."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get the database connection, (re)opening it if the instance directory changed."""
+        manifest_path = get_app_paths().instance_path / MANIFEST_FILE_NAME
+        if self._connection is None or manifest_path != self._path:
+            self.close()
+            manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            # Only ever used from one thread at a time, but grabs run on their own thread
+            self._connection = sqlite3.connect(manifest_path, check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.executescript(_SCHEMA)
+            self._path = manifest_path
+            self._changed = False
+
+        return self._connection
+
+
+def _get_key_range(prefix: str) -> tuple[str, str]:
+    """Get the range of keys under a prefix, so the lookup can use the primary key index."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _is_changed(entry: ManifestEntry | None, s3_object: ObjectTypeDef) -> bool:
+    """Check if a listed object isn't recorded, or was replaced since it was."""
+    return (
+        entry is None or entry.size != s3_object["Size"] or entry.content_hash != s3_object.get("ETag", "").strip('"')
+    )
@@ -1,14 +1,24 @@
 """Helper utilities for archivepodcast."""
 
+import asyncio
+import hashlib
+import sys
 import time
+from array import array
+from contextlib import AsyncExitStack, suppress
 from datetime import UTC, datetime
-from typing import TYPE_CHECKING
+from operator import itemgetter
+from typing import TYPE_CHECKING, Self
+from weakref import WeakKeyDictionary
 
+import anyio
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
-from botocore.exceptions import ClientError
+from anyio import Path as AsyncPath
+from botocore.exceptions import BotoCoreError, ClientError
 from pydantic import BaseModel
 
-from archivepodcast.instances.config import get_ap_config_s3_client
+from archivepodcast.instances.config import get_ap_config, get_ap_config_s3_client
 
 from .logger import get_logger
 from .time import warn_if_too_long
@@ -16,12 +26,83 @@ from .time import warn_if_too_long
 logger = get_logger(__name__)
 
 if TYPE_CHECKING:
-    from types_aiobotocore_s3.type_defs import HeadObjectOutputTypeDef, ObjectTypeDef  # pragma: no cover
+    from collections.abc import Coroutine, Iterable, Sequence
+    from pathlib import Path
+    from types import TracebackType
+
+    from types_aiobotocore_s3 import S3Client  # pragma: no cover
+    from types_aiobotocore_s3.type_defs import (  # pragma: no cover
+        CompletedPartTypeDef,
+        HeadObjectOutputTypeDef,
+        ObjectTypeDef,
+    )
 else:
+    S3Client = object
+    CompletedPartTypeDef = object
     HeadObjectOutputTypeDef = object
     ObjectTypeDef = object
 
 MAX_CACHE_AGE = 120
+# The archiver's own state, e.g. the feed states, is kept under this prefix. It's never listed or served through
+# /content, keep it out of the bucket's public read policy too.
+S3_STATE_PREFIX = "state/"
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # s3 needs every part but the last to be at least 5 MiB
+MULTIPART_RETRY_COUNT = 3
+MULTIPART_THRESHOLD = 32 * 1024 * 1024  # Files bigger than this are uploaded in parts
+MULTIPART_CONCURRENCY = 4  # Parts of a file uploaded at once, also how many parts are in memory at once
+LIST_CONCURRENCY = 8  # Prefixes listed at once when refreshing the object cache
+DELETE_BATCH_SIZE = 1000  # The most keys delete_objects takes at once
+DELETE_CONCURRENCY = 4  # delete_objects batches in flight at once
+_MD5_HEX_LENGTH = 32
+_SHALLOW_PREFIXES = ("", "content/")  # Prefixes that only index their direct children, see get_s3_prefix
+
+
+# One per event loop, a client can't be used from a loop other than the one it was created on
+_pooled_clients: WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[S3Client, AsyncExitStack]] = WeakKeyDictionary()
+_pooled_client_locks: WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = WeakKeyDictionary()
+_prefix_list_locks: WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Lock]] = WeakKeyDictionary()
+
+
+async def get_s3_client() -> S3Client:
+    """Get the shared s3 client for the running event loop, it's created on first use and reused after that.
+
+    Reusing it keeps the endpoint resolution and the connection pool between operations.
+    """
+    loop = asyncio.get_running_loop()
+    pooled_client = _pooled_clients.get(loop)
+    if pooled_client is not None:
+        return pooled_client[0]
+
+    async with _pooled_client_locks.setdefault(loop, asyncio.Lock()):
+        pooled_client = _pooled_clients.get(loop)
+        if pooled_client is None:
+            s3_config = get_ap_config_s3_client()
+            client_config = AioConfig(max_pool_connections=get_ap_config().app.s3.max_pool_connections)
+            exit_stack = AsyncExitStack()
+            s3_client = await exit_stack.enter_async_context(
+                get_session().create_client("s3", config=client_config, **s3_config.model_dump())
+            )
+            pooled_client = (s3_client, exit_stack)
+            _pooled_clients[loop] = pooled_client
+            logger.trace("Created shared s3 client")
+
+    return pooled_client[0]
+
+
+async def close_s3_client() -> None:
+    """Close the shared s3 client of the running event loop, if there is one."""
+    pooled_client = _pooled_clients.pop(asyncio.get_running_loop(), None)
+    if pooled_client is not None:
+        await pooled_client[1].aclose()
+        logger.trace("Closed shared s3 client")
+
+
+async def run_and_close_s3_client[T](coroutine: Coroutine[object, object, T]) -> T:
+    """Run a coroutine then close the shared s3 client it may have used, for when it's given its own event loop."""
+    try:
+        return await coroutine
+    finally:
+        await close_s3_client()
 
 
 class S3File(BaseModel):
@@ -29,43 +110,108 @@ class S3File(BaseModel):
 
     key: str
     size: int
+    etag: str = ""  # Quoted, as s3 lists it
+
+
+def get_s3_etag(body: bytes) -> str:
+    """Get the ETag s3 gives an object uploaded in one part, the quoted md5 of its body."""
+    return f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+
+
+async def get_file_s3_etag(file_path: Path) -> str:
+    """Get the ETag s3_put_file would give the uploaded file, without uploading it."""
+    size = (await AsyncPath(file_path).stat()).st_size
+    if size <= MULTIPART_THRESHOLD:
+        return get_s3_etag(await AsyncPath(file_path).read_bytes())
+
+    part_digests = []
+    async with await anyio.open_file(file_path, "rb") as upload_file:
+        while body := await upload_file.read(MULTIPART_PART_SIZE):
+            part_digests.append(hashlib.md5(body, usedforsecurity=False).digest())
+    return _get_multipart_etag(part_digests)
 
 
 async def s3_put(bucket: str, key: str, body: bytes, content_type: str, *, large_file: bool = False) -> None:
     """Upload an object to s3."""
-    s3_config = get_ap_config_s3_client()
-    session = get_session()
     start_time = time.time()
-    async with session.create_client("s3", **s3_config.model_dump()) as s3_client:
-        await s3_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+    s3_client = await get_s3_client()
+    await s3_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+    warn_if_too_long(f"upload {key} to s3", time.time() - start_time, large_file=large_file)
+
+
+async def s3_put_file(bucket: str, key: str, file_path: Path, content_type: str, *, large_file: bool = False) -> S3File:
+    """Upload a file to s3, files over the multipart threshold are uploaded in parts. Returns what was uploaded.
+
+    Only a few parts are read into memory at once, so a big file doesn't cost its size in memory.
+    """
+    size = (await AsyncPath(file_path).stat()).st_size
+    if size <= MULTIPART_THRESHOLD:
+        body = await AsyncPath(file_path).read_bytes()
+        await s3_put(bucket, key, body, content_type, large_file=large_file)
+        return S3File(key=key, size=len(body), etag=get_s3_etag(body))
+
+    logger.debug("Uploading %s to s3 in parts: %s", file_path, key)
+    start_time = time.time()
+    part_slots = asyncio.Semaphore(MULTIPART_CONCURRENCY)
+
+    async with S3MultipartUpload(bucket, key, content_type) as upload:
+
+        async def _upload_part(body: bytes) -> None:
+            try:
+                await upload.upload_part(body)
+            finally:
+                part_slots.release()
+
+        async with await anyio.open_file(file_path, "rb") as upload_file, asyncio.TaskGroup() as part_tasks:
+            while True:
+                await part_slots.acquire()  # Wait for a slot before reading, it's what bounds the memory
+                body = await upload_file.read(MULTIPART_PART_SIZE)
+                if not body:
+                    part_slots.release()
+                    break
+                part_tasks.create_task(_upload_part(body))
+
     warn_if_too_long(f"upload {key} to s3", time.time() - start_time, large_file=large_file)
+    return S3File(key=key, size=upload.size, etag=upload.etag)
 
 
 async def s3_head(bucket: str, key: str) -> HeadObjectOutputTypeDef:
     """Head an object in s3, raises botocore ClientError if it doesn't exist."""
-    s3_config = get_ap_config_s3_client()
-    session = get_session()
-    async with session.create_client("s3", **s3_config.model_dump()) as s3_client:
-        return await s3_client.head_object(Bucket=bucket, Key=key)
+    s3_client = await get_s3_client()
+    return await s3_client.head_object(Bucket=bucket, Key=key)
+
+
+async def s3_delete_many(bucket: str, keys: Sequence[str]) -> list[str]:
+    """Delete objects from s3 in batches of up to DELETE_BATCH_SIZE keys. Returns the keys that were deleted."""
+    s3_client = await get_s3_client()
+    semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+    deleted_keys: list[str] = []
 
+    async def _delete_batch(batch: Sequence[str]) -> None:
+        async with semaphore:
+            response = await s3_client.delete_objects(
+                Bucket=bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+        failed_keys = set()
+        for error in response.get("Errors", []):
+            failed_keys.add(error.get("Key", ""))
+            logger.warning("Unable to delete s3 object %s: %s", error.get("Key", ""), error.get("Message", ""))
+        deleted_keys.extend(key for key in batch if key not in failed_keys)
 
-async def s3_delete(bucket: str, key: str) -> None:
-    """Delete an object from s3."""
-    s3_config = get_ap_config_s3_client()
-    session = get_session()
-    async with session.create_client("s3", **s3_config.model_dump()) as s3_client:
-        await s3_client.delete_object(Bucket=bucket, Key=key)
+    async with asyncio.TaskGroup() as task_group:
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            task_group.create_task(_delete_batch(keys[start : start + DELETE_BATCH_SIZE]))
+
+    return deleted_keys
 
 
 async def s3_get(bucket: str, key: str) -> bytes:
     """Download an object from s3, returns empty bytes if it doesn't exist."""
-    s3_config = get_ap_config_s3_client()
-    session = get_session()
     start_time = time.time()
+    s3_client = await get_s3_client()
     try:
-        async with session.create_client("s3", **s3_config.model_dump()) as s3_client:
-            response = await s3_client.get_object(Bucket=bucket, Key=key)
-            body = await response["Body"].read()
+        response = await s3_client.get_object(Bucket=bucket, Key=key)
+        body = await response["Body"].read()
     except ClientError:
         logger.debug("Object not found in s3: %s", key)
         return b""
@@ -73,43 +219,354 @@ async def s3_get(bucket: str, key: str) -> bytes:
     return body
 
 
+class S3MultipartUpload:
+    """A multipart upload to s3, parts are uploaded as they are given and each is retried on failure.
+
+    The upload is completed when the context exits, or aborted if it exits with an exception.
+    """
+
+    def __init__(self, bucket: str, key: str, content_type: str) -> None:
+        """Initialise the S3MultipartUpload object."""
+        self._bucket = bucket
+        self._key = key
+        self._content_type = content_type
+        self._s3_client: S3Client | None = None
+        self._upload_id = ""
+        self._next_part_number = 1
+        self._parts: list[CompletedPartTypeDef] = []
+        self._part_digests: dict[int, bytes] = {}  # Part number -> md5, for working out the ETag
+        self.size = 0
+
+    @property
+    def etag(self) -> str:
+        """The ETag s3 gives the completed upload."""
+        return _get_multipart_etag([self._part_digests[part_number] for part_number in sorted(self._part_digests)])
+
+    async def __aenter__(self) -> Self:
+        """Start the multipart upload."""
+        self._s3_client = await get_s3_client()
+        response = await self._s3_client.create_multipart_upload(
+            Bucket=self._bucket, Key=self._key, ContentType=self._content_type
+        )
+        self._upload_id = response["UploadId"]
+        logger.trace("Started multipart upload %s: %s", self._upload_id, self._key)
+        return self
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        """Complete the multipart upload, or abort it if there was an exception."""
+        if self._s3_client is None:
+            return
+
+        if exc_type is not None:
+            logger.debug("Aborting multipart upload: %s", self._key)
+            await self._s3_client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+            return
+
+        if not self._parts:  # s3 won't complete an upload without parts
+            await self.upload_part(b"")
+
+        await self._s3_client.complete_multipart_upload(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": sorted(self._parts, key=itemgetter("PartNumber"))},
+        )
+        logger.trace("Completed multipart upload of %d parts: %s", len(self._parts), self._key)
+
+    async def upload_part(self, body: bytes) -> None:
+        """Upload the next part, parts can be uploaded concurrently."""
+        if self._s3_client is None:
+            msg = "Multipart upload has not been started"
+            raise RuntimeError(msg)
+
+        part_number = self._next_part_number  # Taken before awaiting, so concurrent parts stay in order
+        self._next_part_number += 1
+
+        for attempt in range(1, MULTIPART_RETRY_COUNT + 1):
+            try:
+                response = await self._s3_client.upload_part(
+                    Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, PartNumber=part_number, Body=body
+                )
+            except ClientError, BotoCoreError:
+                if attempt == MULTIPART_RETRY_COUNT:
+                    raise
+                logger.warning(
+                    "Upload of part %d of %s failed, attempt %d/%d",
+                    part_number,
+                    self._key,
+                    attempt,
+                    MULTIPART_RETRY_COUNT,
+                )
+                await asyncio.sleep(0.5 * attempt)
+            else:
+                self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+                self._part_digests[part_number] = hashlib.md5(body, usedforsecurity=False).digest()
+                self.size += len(body)
+                return
+
+
+def get_s3_prefix(key: str) -> str:
+    """Get the prefix a key is indexed under, content is split per podcast e.g. content/<podcast>/."""
+    top_level, _, rest = key.partition("/")
+    if not rest:
+        return ""
+
+    podcast, _, file_name = rest.partition("/")
+    if top_level == "content" and file_name:
+        return f"content/{podcast}/"
+    return f"{top_level}/"
+
+
 class S3FileCache(BaseModel):
-    """Model representing a cache of S3 files."""
+    """Model representing a cache of S3 files, indexed by key and by prefix.
+
+    Only the key, size and ETag of each object are kept, in arrays indexed by slot, so a listing of a large bucket
+    doesn't hold on to every field list_objects_v2 returns. Each prefix is listed and refreshed on its own.
+    """
 
-    _last_cache_time: datetime | None = None
+    _last_cache_time: datetime | None = None  # When the bucket's prefixes were last discovered
+    _prefix_cache_times: dict[str, datetime] = {}
+    _refreshing: dict[str, set[str]] = {}  # Prefix being listed -> keys added while it was being listed
 
-    _files: list[ObjectTypeDef] = []
+    _slots: dict[str, int] = {}  # Key -> slot in the arrays below
+    _keys: list[str] = []
+    _sizes: array[int] = array("q")
+    _etags: list[bytes | str] = []
+    _prefix_index: dict[str, array[int]] = {}  # Prefix -> slots
+    _dead_slots: int = 0  # Slots of removed objects, reclaimed once they outnumber the live ones
 
     async def get_all(self, bucket: str) -> list[ObjectTypeDef]:
-        """List all objects in an S3 bucket using pagination."""
-        if self._last_cache_time:
-            age = (datetime.now(tz=UTC) - self._last_cache_time).total_seconds()
-            logger.trace("S3 Cache hit! Age: %.2f seconds", age)
-            if age < MAX_CACHE_AGE:
-                return self._files
+        """List all objects in an S3 bucket, only the prefixes with a stale listing are listed again."""
+        if _is_stale(self._last_cache_time):
+            logger.debug("Discovering prefixes in s3 bucket")
+            await self._discover_prefixes(bucket)
+        else:
+            await self.refresh_prefixes(bucket, list(self._prefix_cache_times))
 
-        logger.debug("Fetching object list from S3, no cache available")
+        return [self._get_object(slot) for slot in self._slots.values()]
 
-        s3_config = get_ap_config_s3_client()
+    async def refresh_prefixes(self, bucket: str, prefixes: Iterable[str]) -> None:
+        """List the prefixes from get_s3_prefix concurrently, skipping any listed less than MAX_CACHE_AGE ago."""
+        semaphore = asyncio.Semaphore(LIST_CONCURRENCY)
 
-        session = get_session()
-        async with session.create_client("s3", **s3_config.model_dump()) as s3_client:
+        async def _refresh_prefix(prefix: str) -> None:
+            async with semaphore:
+                await self.refresh_prefix(bucket, prefix)
+
+        async with asyncio.TaskGroup() as task_group:
+            for prefix in set(prefixes):
+                task_group.create_task(_refresh_prefix(prefix))
+
+    async def refresh_prefix(self, bucket: str, prefix: str, *, force: bool = False) -> list[str]:
+        """List a prefix from get_s3_prefix if its listing is stale, returning the prefixes found below it."""
+        async with _prefix_list_locks.setdefault(asyncio.get_running_loop(), {}).setdefault(prefix, asyncio.Lock()):
+            prefix_cache_time = self._prefix_cache_times.get(prefix)
+            if not force and not _is_stale(prefix_cache_time):
+                logger.trace("S3 Cache hit for prefix: %s", prefix)
+                return []
+
+            logger.trace("Listing s3 prefix: %s", prefix)
+            s3_client = await get_s3_client()
             paginator = s3_client.get_paginator("list_objects_v2")
-            page_iterator = paginator.paginate(Bucket=bucket)
+            page_iterator = (
+                paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+                if prefix in _SHALLOW_PREFIXES
+                else paginator.paginate(Bucket=bucket, Prefix=prefix)
+            )
 
-            all_objects: list[ObjectTypeDef] = []
-            async for page in page_iterator:
-                if "Contents" in page:
-                    all_objects.extend(page["Contents"])
+            listed_keys: set[str] = set()
+            common_prefixes: list[str] = []
+            self._refreshing[prefix] = set()
+            try:
+                async for page in page_iterator:
+                    for s3_object in page.get("Contents", []):
+                        self._add_object(s3_object["Key"], s3_object["Size"], s3_object.get("ETag", ""))
+                        listed_keys.add(s3_object["Key"])
+                    common_prefixes.extend(common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", []))
 
-        self._files = all_objects
-        self._last_cache_time = datetime.now(tz=UTC)
-        return all_objects
+                self._remove_unlisted(prefix, listed_keys | self._refreshing[prefix])
+            finally:
+                self._refreshing.pop(prefix, None)
+
+            self._prefix_cache_times[prefix] = datetime.now(tz=UTC)
+            return common_prefixes
+
+    def load_prefix(self, prefix: str, s3_objects: list[ObjectTypeDef]) -> None:
+        """Fill a prefix from somewhere other than a listing, e.g. the manifest, it counts as freshly listed."""
+        for s3_object in s3_objects:
+            self._add_object(s3_object["Key"], s3_object["Size"], s3_object.get("ETag", ""))
+        self._remove_unlisted(prefix, {s3_object["Key"] for s3_object in s3_objects})
+        self._prefix_cache_times[prefix] = datetime.now(tz=UTC)
+
+    def get_prefix(self, prefix: str) -> list[ObjectTypeDef]:
+        """Get the cached objects under a prefix from get_s3_prefix, e.g. all of a podcast's content."""
+        slots = sorted(self._prefix_index.get(prefix, ()), key=self._keys.__getitem__)
+        return [self._get_object(slot) for slot in slots]
 
     def add_file(self, s3_file: S3File) -> None:
-        """Append a new S3 file to the cache."""
-        self._files.append({"Key": s3_file.key, "Size": s3_file.size})
+        """Add a new S3 file to the cache, replacing any previous entry for the key."""
+        self._add_object(s3_file.key, s3_file.size, s3_file.etag)
+
+        keys_added_while_listing = self._refreshing.get(get_s3_prefix(s3_file.key))
+        if keys_added_while_listing is not None:  # The listing may have missed it
+            keys_added_while_listing.add(s3_file.key)
+
+    def remove_files(self, keys: Iterable[str]) -> None:
+        """Remove deleted objects from the cache, keys that aren't cached are ignored."""
+        removed_keys_by_prefix: dict[str, set[str]] = {}
+        for key in keys:
+            if key in self._slots:
+                removed_keys_by_prefix.setdefault(get_s3_prefix(key), set()).add(key)
+
+        for prefix, removed_keys in removed_keys_by_prefix.items():
+            kept_keys = {self._keys[slot] for slot in self._prefix_index.get(prefix, ())} - removed_keys
+            self._remove_unlisted(prefix, kept_keys)
+
+    def check_file_exists(self, key: str, size: int | None = None, etag: str | None = None) -> bool:
+        """Check if a file exists in the cache, optionally with a given size and ETag.
+
+        An object cached without an ETag never matches one, so it gets uploaded again rather than skipped.
+        """
+        slot = self._slots.get(key)
+        return (
+            slot is not None
+            and (size is None or self._sizes[slot] == size)
+            and (etag is None or (etag != "" and self._etags[slot] == _pack_etag(etag)))
+        )
+
+    def get_size(self, key: str) -> int | None:
+        """Get the size of a cached object, None if it isn't in the cache."""
+        slot = self._slots.get(key)
+        return self._sizes[slot] if slot is not None else None
+
+    def get_file(self, key: str) -> S3File | None:
+        """Get a cached object's size and ETag, None if it isn't in the cache."""
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return S3File(key=key, size=self._sizes[slot], etag=_unpack_etag(self._etags[slot]))
+
+    def get_memory_usage(self) -> int:
+        """Estimate how many bytes the cache holds, interned strings are counted once."""
+        return (
+            sum(sys.getsizeof(container) for container in (self._slots, self._keys, self._sizes, self._etags))
+            + sum(sys.getsizeof(key) for key in self._keys)
+            + sum(sys.getsizeof(etag) for etag in self._etags)
+            + sys.getsizeof(self._prefix_index)
+            + sum(sys.getsizeof(prefix) + sys.getsizeof(slots) for prefix, slots in self._prefix_index.items())
+        )
+
+    def clear(self) -> None:
+        """Empty the cache, the next get_all will list the bucket."""
+        self._slots = {}
+        self._keys = []
+        self._sizes = array("q")
+        self._etags = []
+        self._prefix_index = {}
+        self._dead_slots = 0
+        self._prefix_cache_times = {}
+        self._last_cache_time = None
+
+    async def _discover_prefixes(self, bucket: str) -> None:
+        """List the shallow prefixes to find every other prefix in the bucket, then list those."""
+        async with asyncio.TaskGroup() as task_group:
+            shallow_listings = [
+                task_group.create_task(self.refresh_prefix(bucket, prefix, force=True)) for prefix in _SHALLOW_PREFIXES
+            ]
+
+        prefixes = {
+            prefix
+            for shallow_listing in shallow_listings
+            for prefix in shallow_listing.result()
+            if prefix not in _SHALLOW_PREFIXES
+        }
+        for prefix in self._prefix_cache_times.keys() - prefixes - set(_SHALLOW_PREFIXES):  # Emptied since last time
+            self._remove_unlisted(prefix, set())
+            del self._prefix_cache_times[prefix]
+
+        await self.refresh_prefixes(bucket, prefixes)
+        self._last_cache_time = datetime.now(tz=UTC)
+
+    def _add_object(self, key: str, size: int, etag: str = "") -> None:
+        packed_etag = _pack_etag(etag)
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._sizes[slot] = size
+            self._etags[slot] = packed_etag
+            return
+
+        key = sys.intern(key)
+        slot = len(self._keys)
+        self._slots[key] = slot
+        self._keys.append(key)
+        self._sizes.append(size)
+        self._etags.append(packed_etag)
+        self._prefix_index.setdefault(sys.intern(get_s3_prefix(key)), array("q")).append(slot)
+
+    def _remove_unlisted(self, prefix: str, listed_keys: set[str]) -> None:
+        """Remove the cached objects under a prefix that weren't in its latest listing."""
+        kept_slots = array("q")
+        for slot in self._prefix_index.pop(prefix, ()):
+            key = self._keys[slot]
+            if key in listed_keys:
+                kept_slots.append(slot)
+                continue
+
+            del self._slots[key]
+            self._keys[slot] = ""
+            self._etags[slot] = ""
+            self._dead_slots += 1
+
+        if kept_slots:
+            self._prefix_index[prefix] = kept_slots
+        if self._dead_slots > len(self._slots):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Drop the slots of removed objects, renumbering the rest."""
+        live_slots = list(self._slots.values())
+        new_slots = {old_slot: new_slot for new_slot, old_slot in enumerate(live_slots)}
+
+        self._keys = [self._keys[slot] for slot in live_slots]
+        self._sizes = array("q", (self._sizes[slot] for slot in live_slots))
+        self._etags = [self._etags[slot] for slot in live_slots]
+        self._slots = {key: slot for slot, key in enumerate(self._keys)}
+        self._prefix_index = {
+            prefix: array("q", (new_slots[slot] for slot in slots)) for prefix, slots in self._prefix_index.items()
+        }
+        self._dead_slots = 0
+
+    def _get_object(self, slot: int) -> ObjectTypeDef:
+        s3_object: ObjectTypeDef = {"Key": self._keys[slot], "Size": self._sizes[slot]}
+        etag = _unpack_etag(self._etags[slot])
+        if etag:
+            s3_object["ETag"] = etag
+        return s3_object
+
+
+def _is_stale(cache_time: datetime | None) -> bool:
+    if cache_time is None:
+        return True
+    return (datetime.now(tz=UTC) - cache_time).total_seconds() >= MAX_CACHE_AGE
+
+
+def _pack_etag(etag: str) -> bytes | str:
+    """Pack an ETag, the quoted md5 hex digest of a single part upload packs down to its 16 byte digest."""
+    digest = etag.strip('"')
+    if len(digest) == _MD5_HEX_LENGTH:
+        with suppress(ValueError):
+            return bytes.fromhex(digest)
+    return sys.intern(etag)  # Multipart ETags and missing ones are kept as they are
+
+
+def _get_multipart_etag(part_digests: list[bytes]) -> str:
+    """Get the ETag of a multipart upload, the md5 of its parts' md5s suffixed with the number of parts."""
+    return f'"{hashlib.md5(b"".join(part_digests), usedforsecurity=False).hexdigest()}-{len(part_digests)}"'
+
 
-    def check_file_exists(self, key: str, size: int | None = None) -> bool:
-        """Check if a file exists in the cache."""
-        return any(file["Key"] == key and (size is None or file["Size"] == size) for file in self._files)
+def _unpack_etag(packed_etag: bytes | str) -> str:
+    if isinstance(packed_etag, bytes):
+        return f'"{packed_etag.hex()}"'
+    return packed_etag
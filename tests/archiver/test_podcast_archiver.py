@@ -6,12 +6,13 @@ import xml.etree.ElementTree as ET
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
+import aiohttp
 import pytest
 
 from archivepodcast.archiver.podcast_archiver import _load_cached_feed
 from archivepodcast.instances.path_helper import get_app_paths
 from tests import FakeExceptionError
-from tests.constants import DUMMY_RSS_STR
+from tests.constants import DUMMY_RSS_STR, TEST_RSS_LOCATION
 from tests.models.aiohttp import FakeSession
 
 if TYPE_CHECKING:
@@ -85,6 +86,59 @@ def test_grab_podcasts_not_live(
     assert get_rss == DUMMY_RSS_STR
 
 
+def test_grab_podcasts_lite_feed(
+    apa: PodcastArchiver,
+    mock_podcast_source_rss_wav: MockerFixture,
+) -> None:
+    """Test a podcast with a lite rendition gets a lite feed pointing at the transcoded episodes."""
+    apa.podcast_list[0].live = True
+    apa.podcast_list[0].lite_rendition = "opus"
+
+    apa.grab_podcasts()
+
+    lite_feed = ET.fromstring(apa.get_rss_feed("test-lite"))
+    enclosure = lite_feed.find(".//enclosure")
+    assert enclosure is not None
+    assert enclosure.get("url", "").startswith(f"{apa._app_config.inet_path.encoded_string()}content/test/lite/")
+    assert enclosure.get("type") == "audio/ogg"
+    assert (get_app_paths().web_root / "rss" / "test-lite").read_bytes() == apa.get_rss_feed("test-lite")
+    assert b"content/test/lite/" not in apa.get_rss_feed("test")
+
+
+def test_grab_podcasts_waveforms(
+    apa: PodcastArchiver,
+    mock_podcast_source_rss_wav: MockerFixture,
+) -> None:
+    """Test the episodes get waveforms next to them when the webplayer draws them."""
+    apa.podcast_list[0].live = True
+    apa._app_config.web_page.waveform_peaks = True
+
+    apa.grab_podcasts()
+
+    content_path = get_app_paths().web_root / "content" / "test"
+    waveforms = list(content_path.glob("*.peaks.json"))
+    assert waveforms
+    assert {waveform.name.removesuffix(".peaks.json") for waveform in waveforms} <= {
+        episode.stem for episode in content_path.glob("*.mp3")
+    }
+
+
+def test_grab_podcasts_hls(
+    apa: PodcastArchiver,
+    mock_podcast_source_rss_wav: MockerFixture,
+) -> None:
+    """Test the episodes get HLS playlists when the webplayer prefers them."""
+    apa.podcast_list[0].live = True
+    apa._app_config.web_page.hls_playlists = True
+
+    apa.grab_podcasts()
+
+    content_path = get_app_paths().web_root / "content" / "test"
+    assert {playlist.parent.name for playlist in content_path.glob("hls/*/index.m3u8")} == {
+        episode.stem for episode in content_path.glob("*.mp3")
+    }
+
+
 def test_grab_podcasts_unhandled_exception(
     apa: PodcastArchiver,
     caplog: pytest.LogCaptureFixture,
@@ -337,3 +391,71 @@ def test_archiver_webpages_header(apa: PodcastArchiver) -> None:
 
     header = apa.renderer.webpages.generate_header("index.html")
     assert "/health" not in header
+
+
+def test_grab_podcasts_live_not_modified(
+    apa: PodcastArchiver,
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test a second grab sends the saved validators, and serves the previous feed on a 304."""
+    apa.podcast_list[0].live = True
+
+    rss = (TEST_RSS_LOCATION / "test_valid.rss").read_text()
+    session = FakeSession(
+        responses={
+            "https://pytest.internal/rss/test_source": {"data": rss, "status": 200, "headers": {"ETag": '"v1"'}},
+            "https://pytest.internal/images/test.jpg": {"data": b"jpg", "status": 200},
+            "https://pytest.internal/audio/test.mp3": {"data": b"mp3", "status": 200},
+        }
+    )
+    monkeypatch.setattr(aiohttp, "ClientSession", lambda *args, **kwargs: session)
+
+    apa.grab_podcasts()
+    first_feed = apa.get_rss_feed("test")
+    assert (get_app_paths().instance_path / "feed_state" / "test.json").is_file()
+
+    with caplog.at_level(level=logging.DEBUG):
+        apa.grab_podcasts()
+
+    assert session.requested_headers["https://pytest.internal/rss/test_source"] == {"If-None-Match": '"v1"'}
+    assert "Upstream feed unchanged, using the previous feed" in caplog.text
+    assert "Downloaded rss feed, processing" not in caplog.text
+    assert "Unable to download podcast" not in caplog.text
+    assert apa.get_rss_feed("test") == first_feed
+
+
+def test_grab_podcasts_live_not_modified_owner_from_feed(
+    apa: PodcastArchiver,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test the owner is still taken from the feed on a 304, and filling it in doesn't change the config hash."""
+    podcast = apa.podcast_list[0]
+    podcast.live = True
+    podcast.new_name = ""
+    podcast.contact_email = ""
+    apa.load_config(apa._app_config, apa.podcast_list)
+
+    rss = (TEST_RSS_LOCATION / "test_valid.rss").read_text()
+    session = FakeSession(
+        responses={
+            "https://pytest.internal/rss/test_source": {"data": rss, "status": 200, "headers": {"ETag": '"v1"'}},
+            "https://pytest.internal/images/test.jpg": {"data": b"jpg", "status": 200},
+            "https://pytest.internal/audio/test.mp3": {"data": b"mp3", "status": 200},
+        }
+    )
+    monkeypatch.setattr(aiohttp, "ClientSession", lambda *args, **kwargs: session)
+
+    apa.grab_podcasts()
+    assert podcast.new_name == "ArchivePodcast Contributors"
+
+    apa.grab_podcasts()
+    assert session.requested_headers["https://pytest.internal/rss/test_source"] == {"If-None-Match": '"v1"'}
+
+    podcast.new_name = ""  # As it would be after a restart
+    podcast.contact_email = ""
+    apa.grab_podcasts()
+
+    assert session.requested_headers["https://pytest.internal/rss/test_source"] == {"If-None-Match": '"v1"'}
+    assert podcast.new_name == "ArchivePodcast Contributors"
+    assert podcast.contact_email == "info@localhost"
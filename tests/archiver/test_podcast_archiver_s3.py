@@ -9,9 +9,15 @@ from typing import TYPE_CHECKING, Any
 import pytest
 
 from archivepodcast.archiver.podcast_archiver import PodcastArchiver
+from archivepodcast.archiver.webpages import Webpage
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.utils.logger import TRACE_LEVEL_NUM
+from archivepodcast.utils.manifest import MANIFEST_S3_KEY
 from tests import FakeExceptionError
 from tests.constants import DUMMY_RSS_STR
+from tests.fixtures import aws
 from tests.fixtures.aws import S3ClientMock
 
 if TYPE_CHECKING:
@@ -82,6 +88,65 @@ async def test_render_files(
     assert "Unhandled s3 error" not in caplog.text
 
 
+@pytest.mark.asyncio
+async def test_write_webpages_same_size_change(
+    apa_aws: PodcastArchiver,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test a page edited without changing its size is uploaded, and an unchanged one isn't."""
+    await apa_aws.renderer._write_webpages([Webpage(path="test.html", mime="text/html", content="<p>Tset</p>")])
+
+    with caplog.at_level(level=logging.INFO):
+        await apa_aws.renderer._write_webpages([Webpage(path="test.html", mime="text/html", content="<p>Test</p>")])
+
+    assert "Wrote test.html to file, uploaded to s3" in caplog.text
+    assert aws._objects["test.html"]["Body"] == b"<p>Test</p>"
+
+    caplog.clear()
+    with caplog.at_level(level=logging.INFO):
+        await apa_aws.renderer._write_webpages([Webpage(path="test.html", mime="text/html", content="<p>Test</p>")])
+
+    assert "Wrote test.html to file, skipped upload as it is unchanged" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_write_webpages_concurrent_with_failures(
+    apa_aws: PodcastArchiver,
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test pages are uploaded concurrently under a bound, and failed pages are named in the summary."""
+    monkeypatch.setattr("archivepodcast.archiver.webpage_renderer.PAGE_WRITE_CONCURRENCY", 3)
+    real_put_object = S3ClientMock.put_object
+    in_flight = 0
+    max_in_flight = 0
+
+    async def tracked_put_object(self: S3ClientMock, **kwargs: Any) -> None:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        loop = asyncio.get_running_loop()
+        for _ in range(3):  # Let the other uploads get going
+            future = loop.create_future()
+            loop.call_soon(future.set_result, None)
+            await future
+        in_flight -= 1
+        if kwargs["Key"] == "page-3.html":
+            raise FakeExceptionError
+        await real_put_object(self, **kwargs)
+
+    monkeypatch.setattr(S3ClientMock, "put_object", tracked_put_object)
+    webpages = [Webpage(path=f"page-{number}.html", mime="text/html", content=f"page {number}") for number in range(8)]
+
+    with caplog.at_level(level=logging.INFO):
+        await apa_aws.renderer._write_webpages(webpages)
+
+    assert max_in_flight == 3
+    assert "Wrote 8 pages to files, uploaded 7 pages to s3, 1 failed: page-3.html" in caplog.text
+    assert "page-3.html" not in aws._objects
+    assert (get_app_paths().web_root / "page-3.html").read_text() == "page 3"
+
+
 @pytest.mark.asyncio
 async def test_check_s3_no_files(apa_aws: PodcastArchiver, caplog: pytest.LogCaptureFixture) -> None:
     """Test that s3 files are checked."""
@@ -254,6 +319,8 @@ async def test_check_s3_files_problem_files(
     assert "S3 Path starts with a /, this is not expected: /index.html DELETING" in caplog.text
     assert "S3 Path contains a //, this is not expected: content/test//episode.mp3 DELETING" in caplog.text
     assert "S3 Object is empty: content/test/empty_file.mp3 DELETING" in caplog.text
+    assert "Starting cleanup of 4 unexpected S3 objects" in caplog.text
+    assert not s3_file_cache.check_file_exists("content/test/empty_file.mp3")
 
     async with mock_get_session.create_client("s3") as s3_client:
         s3_object_list = await s3_client.list_objects_v2(Bucket=apa_aws._app_config.s3.bucket)
@@ -315,3 +382,25 @@ def test_upload_to_s3_exception(
         apa_aws.grab_podcasts()
 
     assert "Unhandled s3 error trying to upload the file:" in caplog.text
+
+
+def test_grab_podcasts_manifest(
+    apa_aws: PodcastArchiver,
+    caplog: pytest.LogCaptureFixture,
+    mock_podcast_source_rss_valid: MockerFixture,
+) -> None:
+    """Test the assets are recorded in the manifest and it's synced to s3, later runs take the content list from it."""
+    apa_aws.podcast_list[0].live = True
+
+    apa_aws.grab_podcasts()
+
+    assert asset_manifest.get("content/test/20200101-Test-Episode.mp3") is not None
+    assert MANIFEST_S3_KEY in aws._objects
+    s3_file_cache.clear()
+    caplog.clear()
+
+    with caplog.at_level(level=logging.DEBUG):
+        apa_aws.grab_podcasts()
+
+    assert "Loading content list from the manifest instead of s3" in caplog.text
+    assert "Uploading to s3: content/test/20200101-Test-Episode.mp3" not in caplog.text
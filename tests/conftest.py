@@ -12,4 +12,5 @@ pytest_plugins = [  # Magic list of fixtures to load
     "tests.fixtures.threads",
     "tests.fixtures.aiohttp",
     "tests.fixtures.paths",
+    "tests.fixtures.episode_assets",
 ]
@@ -6,11 +6,14 @@ from typing import TYPE_CHECKING
 import pytest
 
 from archivepodcast.downloader.asset_downloader import AssetDownloader
-from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.downloader.partial_download import PartialDownload, get_part_path, save_resume_state
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import local_file_cache, s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.utils.logger import TRACE_LEVEL_NUM
-from archivepodcast.utils.s3 import S3File
+from archivepodcast.utils.s3 import S3File, get_s3_etag, s3_get, s3_head
 from tests import FakeExceptionError
+from tests.constants import TEST_WAV_FILE
 from tests.models.aiohttp import FakeResponseDef, FakeSession
 
 if TYPE_CHECKING:
@@ -157,17 +160,50 @@ async def test_upload_asset_s3_remove_original_false_already_exists(
     test_file = content_dir / "test-cover.jpg"
     test_file.write_bytes(b"test cover art content")
 
-    # Add file to S3 cache with matching size
+    # Add file to S3 cache with matching ETag
     s3_path = test_file.relative_to(get_app_paths().web_root).as_posix()
-    s3_file_cache.add_file(S3File(key=s3_path, size=test_file.stat().st_size))
+    s3_file_cache.add_file(
+        S3File(key=s3_path, size=test_file.stat().st_size, etag=get_s3_etag(b"test cover art content"))
+    )
 
     with caplog.at_level(logging.DEBUG):
         await downloader._upload_asset_s3(test_file, ".jpg", remove_original=False)
 
-    assert "exists in s3_paths_cache and matches in size, skipping upload" in caplog.text
+    assert "exists in s3_paths_cache and matches its ETag, skipping upload" in caplog.text
     assert test_file.exists()  # File should still exist
 
 
+@pytest.mark.asyncio
+async def test_upload_asset_s3_same_size_changed_content(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test _upload_asset_s3 uploads a file that changed without changing size."""
+    config = get_test_config("testing_true_valid_s3.json")
+    podcast = config.podcasts[0]
+    downloader = AssetDownloader(
+        podcast=podcast,
+        app_config=config.app,
+        s3=True,
+        aiohttp_session=FakeSession(responses={}),  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+    content_dir = get_app_paths().web_root / "content" / podcast.name_one_word
+    content_dir.mkdir(parents=True, exist_ok=True)
+    test_file = content_dir / "test-cover.jpg"
+    test_file.write_bytes(b"new cover")
+    s3_path = test_file.relative_to(get_app_paths().web_root).as_posix()
+    s3_file_cache.add_file(S3File(key=s3_path, size=len(b"old cover"), etag=get_s3_etag(b"old cover")))
+
+    with caplog.at_level(logging.DEBUG):
+        await downloader._upload_asset_s3(test_file, ".jpg", remove_original=False)
+
+    assert "skipping upload" not in caplog.text
+    assert await s3_get(config.app.s3.bucket, s3_path) == b"new cover"
+    assert s3_file_cache.check_file_exists(s3_path, etag=get_s3_etag(b"new cover"))
+
+
 @pytest.mark.asyncio
 async def test_upload_asset_s3_remove_original_false_upload_and_keep(
     get_test_config: Callable[[str], ArchivePodcastConfig],
@@ -347,7 +383,7 @@ async def test_check_path_exists_s3_found_in_bucket(
         await s3_client.put_object(Bucket=config.app.s3.bucket, Key=s3_key, Body=b"x", ContentType="audio/mpeg")
 
     # Clear the cache so the check has to hit head_object
-    s3_file_cache._files = []
+    s3_file_cache.clear()
 
     with caplog.at_level(logging.DEBUG):
         exists = await downloader._check_path_exists(s3_key)
@@ -355,3 +391,350 @@ async def test_check_path_exists_s3_found_in_bucket(
     assert exists is True
     assert "exists in s3 bucket" in caplog.text
     assert s3_file_cache.check_file_exists(s3_key)
+    entry = asset_manifest.get(s3_key)
+    assert entry is not None
+    assert entry.size == 1
+
+
+def _resumable_downloader(config: ArchivePodcastConfig, data: bytes, etag: str) -> tuple[AssetDownloader, FakeSession]:
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {
+                "data": data,
+                "status": 200,
+                "headers": {"Accept-Ranges": "bytes", "ETag": etag},
+            },
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=False,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+    return downloader, aiohttp_session
+
+
+@pytest.mark.asyncio
+async def test_download_to_local_resumes_partial(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test a partial download left behind (e.g. by a restart) is resumed with a Range request."""
+    config = get_test_config("testing_true_valid.json")
+    data = b"0123456789" * 100
+    downloader, aiohttp_session = _resumable_downloader(config, data, '"v1"')
+
+    file_path = get_app_paths().web_root / "content" / "test" / "test-episode.mp3"
+    part_path = get_part_path(file_path)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path.write_bytes(data[:300])
+    await save_resume_state(part_path, PartialDownload(url="https://example.com/test.mp3", validator='"v1"'))
+
+    await downloader._download_to_local("https://example.com/test.mp3", file_path)
+
+    assert aiohttp_session.requested_headers["https://example.com/test.mp3"] == {
+        "Range": "bytes=300-",
+        "If-Range": '"v1"',
+    }
+    assert file_path.read_bytes() == data
+    assert not part_path.exists()
+    assert list(part_path.parent.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_download_to_local_changed_file_not_spliced(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test a partial download of a file that has since changed upstream is thrown away."""
+    config = get_test_config("testing_true_valid.json")
+    data = b"abcdefghij" * 100
+    downloader, _ = _resumable_downloader(config, data, '"v2"')
+
+    file_path = get_app_paths().web_root / "content" / "test" / "test-episode.mp3"
+    part_path = get_part_path(file_path)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path.write_bytes(b"0123456789" * 30)
+    await save_resume_state(part_path, PartialDownload(url="https://example.com/test.mp3", validator='"v1"'))
+
+    await downloader._download_to_local("https://example.com/test.mp3", file_path)
+
+    assert file_path.read_bytes() == data
+    assert not part_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_to_local_truncated(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test a download shorter than its Content-Length never lands at the final path."""
+    config = get_test_config("testing_true_valid.json")
+    data = b"0123456789" * 100
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {"data": data[:500], "status": 200, "headers": {"Content-Length": "1000"}},
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=False,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+    file_path = get_app_paths().web_root / "content" / "test" / "test-episode.mp3"
+
+    with caplog.at_level(logging.WARNING):
+        await downloader._download_to_local("https://example.com/test.mp3", file_path)
+
+    assert not file_path.exists()
+    assert "Downloaded 500 bytes, expected 1000" in caplog.text
+    assert "Failed to download asset after multiple attempts" in caplog.text
+    assert not downloader._feed_download_healthy
+
+
+@pytest.mark.asyncio
+async def test_download_to_local_records_verified_size(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test the verified size is cached, and a file that no longer matches it is not treated as archived."""
+    config = get_test_config("testing_true_valid.json")
+    data = b"0123456789" * 100
+    downloader, _ = _resumable_downloader(config, data, '"v1"')
+    file_path = get_app_paths().web_root / "content" / "test" / "test-episode.mp3"
+
+    await downloader._download_to_local("https://example.com/test.mp3", file_path)
+
+    assert local_file_cache.get_size(file_path.relative_to(get_app_paths().web_root)) == len(data)
+    assert await downloader._check_path_exists(file_path)
+
+    file_path.write_bytes(data[:10])
+
+    with caplog.at_level(logging.WARNING):
+        assert not await downloader._check_path_exists(file_path)
+    assert "does not match its downloaded size" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_download_asset_direct_upload(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test direct upload mode streams the asset into s3, without it touching local disk."""
+    config = get_test_config("testing_true_valid_s3.json")
+    config.app.s3.direct_upload = True
+    data = b"0123456789" * 100
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {"data": data, "status": 200, "headers": {"Content-Length": "1000"}},
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=True,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+    await downloader._download_asset("https://example.com/test.mp3", "test-episode", ".mp3")
+
+    assert await s3_get(config.app.s3.bucket, "content/test/test-episode.mp3") == data
+    assert s3_file_cache.check_file_exists("content/test/test-episode.mp3", len(data))
+    assert not (get_app_paths().web_root / "content" / "test" / "test-episode.mp3").exists()
+    assert downloader._feed_download_healthy
+
+
+@pytest.mark.asyncio
+async def test_download_asset_direct_upload_truncated(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a truncated download aborts the multipart upload, so it isn't treated as archived."""
+    config = get_test_config("testing_true_valid_s3.json")
+    config.app.s3.direct_upload = True
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {"data": b"012345", "status": 200, "headers": {"Content-Length": "1000"}},
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=True,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+    await downloader._download_asset("https://example.com/test.mp3", "test-episode", ".mp3")
+
+    assert await s3_get(config.app.s3.bucket, "content/test/test-episode.mp3") == b""
+    assert not s3_file_cache.check_file_exists("content/test/test-episode.mp3")
+    assert not downloader._feed_download_healthy
+
+
+def _wav_downloader(config: ArchivePodcastConfig, data: bytes, *, s3: bool) -> AssetDownloader:
+    config.app.download.stream_wav_transcode = True
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.wav": {
+                "data": data,
+                "status": 200,
+                "headers": {"Content-Length": str(len(TEST_WAV_FILE))},
+            },
+        }
+    )
+    return AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=s3,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+
+@pytest.mark.asyncio
+async def test_handle_wav_streamed(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test a streamed wav is converted as it's downloaded, only the mp3 is written."""
+    config = get_test_config("testing_true_valid.json")
+    downloader = _wav_downloader(config, TEST_WAV_FILE, s3=False)
+    content_dir = get_app_paths().web_root / "content" / "test"
+
+    new_length = await downloader._handle_wav("https://example.com/test.wav", "test-episode", ".wav", "20200101")
+
+    mp3_path = content_dir / "20200101-test-episode.mp3"
+    assert new_length == mp3_path.stat().st_size > 0
+    assert not (content_dir / "20200101-test-episode.wav").exists()
+    assert list(get_part_path(mp3_path).parent.glob("*.part")) == []
+    assert asset_manifest.get("content/test/20200101-test-episode.mp3") is None  # Only kept in s3 mode
+
+
+@pytest.mark.asyncio
+async def test_handle_wav_streamed_truncated(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test a truncated wav download doesn't leave a partial mp3 behind."""
+    config = get_test_config("testing_true_valid.json")
+    downloader = _wav_downloader(config, TEST_WAV_FILE[:100], s3=False)
+
+    assert await downloader._handle_wav("https://example.com/test.wav", "test-episode", ".wav", "20200101") is None
+
+    assert not (get_app_paths().web_root / "content" / "test" / "20200101-test-episode.mp3").exists()
+    assert not downloader._feed_download_healthy
+
+
+@pytest.mark.asyncio
+async def test_handle_wav_streamed_direct_upload(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a streamed wav with direct upload is converted straight into s3, nothing touches local disk."""
+    config = get_test_config("testing_true_valid_s3.json")
+    config.app.s3.direct_upload = True
+    downloader = _wav_downloader(config, TEST_WAV_FILE, s3=True)
+
+    new_length = await downloader._handle_wav("https://example.com/test.wav", "test-episode", ".wav", "20200101")
+
+    mp3 = await s3_get(config.app.s3.bucket, "content/test/20200101-test-episode.mp3")
+    assert new_length == len(mp3) > 0
+    assert s3_file_cache.check_file_exists("content/test/20200101-test-episode.mp3", len(mp3))
+    assert not (get_app_paths().web_root / "content" / "test").exists()
+    entry = asset_manifest.get("content/test/20200101-test-episode.mp3")
+    assert entry is not None
+    etag = (await s3_head(config.app.s3.bucket, "content/test/20200101-test-episode.mp3"))["ETag"]
+    assert entry.content_hash == etag.strip('"')
+    assert entry.content_hash.endswith("-1")  # A multipart upload ETag, not the md5 of the file
+
+
+@pytest.mark.asyncio
+async def test_download_asset_recorded_in_manifest(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a downloaded asset is recorded in the manifest with its size, hash, source and episode."""
+    config = get_test_config("testing_true_valid_s3.json")
+    data = b"0123456789" * 100
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {"data": data, "status": 200, "headers": {"Content-Length": "1000"}},
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=True,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+    await downloader._download_asset(
+        "https://example.com/test.mp3", "test-episode", ".mp3", "20200101", episode_guid="guid-1"
+    )
+
+    entry = asset_manifest.get("content/test/20200101-test-episode.mp3")
+    assert entry is not None
+    assert entry.size == len(data)
+    etag = (await s3_head(config.app.s3.bucket, "content/test/20200101-test-episode.mp3"))["ETag"]
+    assert entry.content_hash == etag.strip('"')
+    assert entry.source_url == "https://example.com/test.mp3"
+    assert entry.episode_guid == "guid-1"
+
+
+@pytest.mark.asyncio
+async def test_download_asset_failed_not_recorded_in_manifest(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test an asset that failed to download isn't recorded in the manifest."""
+    config = get_test_config("testing_true_valid.json")
+    aiohttp_session = FakeSession(
+        responses={
+            "https://example.com/test.mp3": {"data": b"012345", "status": 200, "headers": {"Content-Length": "1000"}},
+        }
+    )
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=False,
+        aiohttp_session=aiohttp_session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+
+    await downloader._download_asset("https://example.com/test.mp3", "test-episode", ".mp3")
+
+    assert asset_manifest.get("content/test/test-episode.mp3") is None
+
+
+@pytest.mark.asyncio
+async def test_download_asset_local_not_recorded_in_manifest(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+) -> None:
+    """Test nothing is recorded in the manifest in local mode, it's only kept in s3 mode."""
+    config = get_test_config("testing_true_valid.json")
+    downloader, _ = _resumable_downloader(config, b"0123456789" * 100, '"v1"')
+
+    await downloader._download_asset("https://example.com/test.mp3", "test-episode", ".mp3")
+
+    assert (get_app_paths().web_root / "content" / "test" / "test-episode.mp3").is_file()
+    assert asset_manifest.get("content/test/test-episode.mp3") is None
+
+
+@pytest.mark.asyncio
+async def test_download_cover_art_s3_found_locally_recorded_in_manifest(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test cover art that's already on local disk is recorded in the manifest once it's uploaded."""
+    config = get_test_config("testing_true_valid_s3.json")
+    downloader = AssetDownloader(
+        podcast=config.podcasts[0],
+        app_config=config.app,
+        s3=True,
+        aiohttp_session=FakeSession(responses={}),  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+    )
+    cover_art_path = get_app_paths().web_root / "content" / "test" / "cover.jpg"
+    cover_art_path.parent.mkdir(parents=True, exist_ok=True)
+    cover_art_path.write_bytes(b"cover")
+
+    await downloader._download_cover_art("https://example.com/cover.jpg", "cover", ".jpg")
+
+    entry = asset_manifest.get("content/test/cover.jpg")
+    assert entry is not None
+    assert entry.size == len(b"cover")
+    assert entry.source_url == "https://example.com/cover.jpg"
@@ -0,0 +1,117 @@
+"""Tests for what the episode asset builders share."""
+
+import logging
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.downloader.episode_assets import EpisodeAssetBuilder
+from archivepodcast.downloader.hls import HLSBuilder
+from archivepodcast.downloader.renditions import RenditionBuilder
+from archivepodcast.downloader.waveforms import WaveformBuilder
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from tests.fixtures.episode_assets import EPISODE_KEY, archive_episode, get_episode_asset_builder, get_episode_feed
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+_BUILDER_CLASSES = [HLSBuilder, RenditionBuilder, WaveformBuilder]
+
+
+def _get_builder(
+    builder_class: type[EpisodeAssetBuilder], config: ArchivePodcastConfig, *, s3: bool
+) -> EpisodeAssetBuilder:
+    config.podcasts[0].lite_rendition = "opus"  # Only the rendition builder needs it
+    return get_episode_asset_builder(builder_class, config, s3=s3)
+
+
+def test_builder_is_abstract(get_test_config: Callable[[str], ArchivePodcastConfig]) -> None:
+    """Test a builder has to say where the derived file goes and how it's built."""
+    with pytest.raises(TypeError, match="abstract"):
+        get_episode_asset_builder(EpisodeAssetBuilder, get_test_config("testing_true_valid.json"), s3=False)  # type: ignore[type-abstract]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("builder_class", _BUILDER_CLASSES)
+async def test_build_local(
+    builder_class: type[EpisodeAssetBuilder],
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    episode_mp3: bytes,
+) -> None:
+    """Test the derived file is built in the web root, only once, and isn't recorded in the manifest."""
+    config = get_test_config("testing_true_valid.json")
+    builder = _get_builder(builder_class, config, s3=False)
+    await archive_episode(config, episode_mp3, s3=False)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    derived_key = builder._get_derived_key(EPISODE_KEY)
+    assert (get_app_paths().web_root / derived_key).is_file()
+    assert asset_manifest.get(derived_key) is None  # The manifest is only kept in s3 mode
+    assert list((get_app_paths().instance_path / "partial_downloads").rglob("*.part")) == []
+    assert await builder.build(get_episode_feed(config)) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("builder_class", _BUILDER_CLASSES)
+async def test_build_missing_episode(
+    builder_class: type[EpisodeAssetBuilder], get_test_config: Callable[[str], ArchivePodcastConfig]
+) -> None:
+    """Test nothing is built for an episode that wasn't downloaded."""
+    config = get_test_config("testing_true_valid.json")
+    builder = _get_builder(builder_class, config, s3=False)
+
+    assert await builder.build(get_episode_feed(config)) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("builder_class", _BUILDER_CLASSES)
+async def test_build_fails(
+    builder_class: type[EpisodeAssetBuilder],
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test an episode ffmpeg can't read is logged, leaving nothing behind."""
+    config = get_test_config("testing_true_valid.json")
+    builder = _get_builder(builder_class, config, s3=False)
+    await archive_episode(config, b"not an mp3", s3=False)
+
+    with caplog.at_level(logging.ERROR):
+        assert await builder.build(get_episode_feed(config)) == 0
+
+    assert f"Failed to build {builder.description}" in caplog.text
+    assert not (get_app_paths().web_root / builder._get_derived_key(EPISODE_KEY)).exists()
+    assert list((get_app_paths().instance_path / "partial_downloads").rglob("*.part")) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("builder_class", _BUILDER_CLASSES)
+async def test_build_s3(
+    builder_class: type[EpisodeAssetBuilder],
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    episode_mp3: bytes,
+) -> None:
+    """Test in s3 mode the episode is streamed out of s3 and the derived file uploaded and recorded."""
+    config = get_test_config("testing_true_valid_s3.json")
+    builder = _get_builder(builder_class, config, s3=True)
+    await archive_episode(config, episode_mp3, s3=True)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    derived_key = builder._get_derived_key(EPISODE_KEY)
+    size = s3_file_cache.get_size(derived_key)
+    assert size is not None
+    entry = asset_manifest.get(derived_key)
+    assert entry is not None
+    assert entry.size == size
+    assert entry.source_url == EPISODE_KEY
+    assert not (get_app_paths().web_root / derived_key).exists()
+    assert await builder.build(get_episode_feed(config)) == 0
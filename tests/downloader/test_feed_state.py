@@ -0,0 +1,85 @@
+"""Tests for the feed state persistence."""
+
+import logging
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.downloader.feed_state import (
+    FeedState,
+    _get_feed_state_path,
+    get_feed_state_s3_key,
+    load_feed_state,
+    save_feed_state,
+)
+from archivepodcast.utils.s3 import S3_STATE_PREFIX
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+
+def test_conditional_headers() -> None:
+    """Test that only the validators that are set become headers."""
+    assert FeedState().get_conditional_headers() == {}
+    assert FeedState(etag='"abc"').get_conditional_headers() == {"If-None-Match": '"abc"'}
+    assert FeedState(etag='"abc"', last_modified="Wed, 01 Jan 2020 00:00:01 GMT").get_conditional_headers() == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 01 Jan 2020 00:00:01 GMT",
+    }
+
+
+@pytest.mark.asyncio
+async def test_save_and_load_local() -> None:
+    """Test the feed state round trips through the instance directory."""
+    feed_state = FeedState(etag='"abc"', last_modified="Wed, 01 Jan 2020 00:00:01 GMT")
+
+    await save_feed_state("test", feed_state)
+
+    assert await _get_feed_state_path("test").is_file()
+    assert await load_feed_state("test") == feed_state
+
+
+@pytest.mark.asyncio
+async def test_load_missing() -> None:
+    """Test that a podcast without a saved state gets an empty one."""
+    assert await load_feed_state("test") == FeedState()
+
+
+@pytest.mark.asyncio
+async def test_load_invalid(caplog: pytest.LogCaptureFixture) -> None:
+    """Test that a corrupt feed state is ignored."""
+    feed_state_path = _get_feed_state_path("test")
+    await feed_state_path.parent.mkdir(parents=True, exist_ok=True)
+    await feed_state_path.write_text("NOT JSON")
+
+    with caplog.at_level(logging.WARNING):
+        feed_state = await load_feed_state("test")
+
+    assert feed_state == FeedState()
+    assert "Feed state is not valid, ignoring it" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_save_and_load_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the feed state is uploaded under the state prefix, and loaded from s3 when it isn't on disk."""
+    config = get_test_config("testing_true_valid_s3.json")
+    bucket = config.app.s3.bucket
+    feed_state = FeedState(etag='"abc"')
+
+    await save_feed_state("test", feed_state, bucket)
+    await _get_feed_state_path("test").unlink()
+
+    async with mock_get_session.create_client("s3") as s3_client:
+        s3_object_list = await s3_client.list_objects_v2(Bucket=bucket)
+    assert get_feed_state_s3_key("test") in [obj["Key"] for obj in s3_object_list.get("Contents", [])]
+    assert get_feed_state_s3_key("test").startswith(S3_STATE_PREFIX)
+
+    assert await load_feed_state("test", bucket) == feed_state
@@ -0,0 +1,125 @@
+"""Tests for the HLS playlists."""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+from anyio import Path as AsyncPath
+
+from archivepodcast.downloader import hls
+from archivepodcast.downloader.hls import HLS_UPLOAD_CONCURRENCY, HLSBuilder
+from archivepodcast.instances.manifest import asset_manifest
+from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.s3 import S3File, get_s3_client
+from tests.constants import TEST_WAV_FILE
+from tests.fixtures.episode_assets import archive_episode, get_episode_asset_builder, get_episode_feed
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+_HLS_KEY = "content/test/hls/20200101-Test-Episode/"
+
+
+def _get_segment_names(playlist: str) -> list[str]:
+    return [line for line in playlist.splitlines() if line and not line.startswith("#")]
+
+
+@pytest.mark.asyncio
+async def test_build_local(get_test_config: Callable[[str], ArchivePodcastConfig], episode_mp3: bytes) -> None:
+    """Test the playlist is put in the episode's hls directory with the segments it lists."""
+    config = get_test_config("testing_true_valid.json")
+    builder = get_episode_asset_builder(HLSBuilder, config, s3=False)
+    await archive_episode(config, episode_mp3, s3=False)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    hls_path = get_app_paths().web_root / _HLS_KEY
+    playlist = (hls_path / "index.m3u8").read_text()
+    assert playlist.startswith("#EXTM3U")
+    assert "#EXT-X-ENDLIST" in playlist
+    segment_names = _get_segment_names(playlist)
+    assert segment_names
+    for segment_name in segment_names:
+        assert (hls_path / segment_name).is_file()
+
+
+@pytest.mark.asyncio
+async def test_build_reencodes(get_test_config: Callable[[str], ArchivePodcastConfig]) -> None:
+    """Test an episode that can't be remuxed into segments as it is gets encoded."""
+    config = get_test_config("testing_true_valid.json")
+    builder = get_episode_asset_builder(HLSBuilder, config, s3=False)
+    episode_key = "content/test/20200101-Test-Episode.wav"
+    await archive_episode(config, TEST_WAV_FILE, s3=False, episode_key=episode_key)
+
+    assert await builder.build(get_episode_feed(config, episode_key)) == 1
+
+    assert (get_app_paths().web_root / _HLS_KEY / "index.m3u8").is_file()
+
+
+@pytest.mark.asyncio
+async def test_build_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    episode_mp3: bytes,
+) -> None:
+    """Test in s3 mode the segments are uploaded and recorded with the playlist, each with its own type."""
+    config = get_test_config("testing_true_valid_s3.json")
+    builder = get_episode_asset_builder(HLSBuilder, config, s3=True)
+    await archive_episode(config, episode_mp3, s3=True)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    s3_client = await get_s3_client()
+    playlist_object = await s3_client.get_object(Bucket=config.app.s3.bucket, Key=_HLS_KEY + "index.m3u8")
+    assert playlist_object["ContentType"] == "application/vnd.apple.mpegurl"
+    segment_name = _get_segment_names((await playlist_object["Body"].read()).decode())[0]
+    segment_object = await s3_client.get_object(Bucket=config.app.s3.bucket, Key=_HLS_KEY + segment_name)
+    assert segment_object["ContentType"] == "video/mp2t"
+    assert s3_file_cache.get_size(_HLS_KEY + segment_name) is not None
+    assert asset_manifest.get(_HLS_KEY + segment_name) is not None
+
+
+@pytest.mark.asyncio
+async def test_upload_concurrency(
+    get_test_config: Callable[[str], ArchivePodcastConfig], tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test the segments are uploaded a few at a time, and the playlist only once they all have been."""
+    config = get_test_config("testing_true_valid_s3.json")
+    builder = get_episode_asset_builder(HLSBuilder, config, s3=True)
+    segment_paths = [tmp_path / f"{n:05}.ts" for n in range(HLS_UPLOAD_CONCURRENCY * 3)]
+    for segment_path in segment_paths:
+        segment_path.write_bytes(b"segment")
+    (tmp_path / "index.m3u8").write_text("#EXTM3U\n")
+
+    uploaded_keys: list[str] = []
+    in_flight = 0
+    max_in_flight = 0
+    all_in_flight = asyncio.Event()  # Held until as many as can be are uploading at once
+
+    async def _fake_s3_put_file(bucket: str, key: str, file_path: Path, content_type: str) -> S3File:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        if in_flight == HLS_UPLOAD_CONCURRENCY:
+            all_in_flight.set()
+        await asyncio.wait_for(all_in_flight.wait(), timeout=5)
+        in_flight -= 1
+        uploaded_keys.append(key)
+        return S3File(key=key, size=(await AsyncPath(file_path).stat()).st_size)
+
+    monkeypatch.setattr(hls, "s3_put_file", _fake_s3_put_file)
+
+    assert await builder._upload(
+        "content/test/20200101-Test-Episode.mp3", _HLS_KEY + "index.m3u8", tmp_path, segment_paths
+    ) == len("#EXTM3U\n")
+
+    assert max_in_flight == HLS_UPLOAD_CONCURRENCY
+    assert sorted(uploaded_keys[:-1]) == [_HLS_KEY + segment_path.name for segment_path in segment_paths]
+    assert uploaded_keys[-1] == _HLS_KEY + "index.m3u8"
@@ -0,0 +1,73 @@
+"""Tests for the partial download state."""
+
+import pytest
+
+from archivepodcast.downloader.partial_download import (
+    PartialDownload,
+    get_part_path,
+    get_resume_state,
+    save_resume_state,
+)
+from archivepodcast.instances.path_helper import get_app_paths
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected_validator"),
+    [
+        ({"Accept-Ranges": "bytes", "ETag": '"abc"'}, '"abc"'),
+        (
+            {"Accept-Ranges": "bytes", "ETag": 'W/"abc"', "Last-Modified": "Wed, 01 Jan 2020 00:00:01 GMT"},
+            "Wed, 01 Jan 2020 00:00:01 GMT",
+        ),
+        ({"Accept-Ranges": "bytes", "ETag": 'W/"abc"'}, None),
+        ({"Accept-Ranges": "none", "ETag": '"abc"'}, None),
+        ({"ETag": '"abc"'}, None),
+    ],
+)
+def test_from_headers(headers: dict[str, str], expected_validator: str | None) -> None:
+    """Test that only origins with byte ranges and a strong validator are resumable."""
+    partial_download = PartialDownload.from_headers("https://example.com/test.mp3", headers)
+
+    if expected_validator is None:
+        assert partial_download is None
+    else:
+        assert partial_download is not None
+        assert partial_download.validator == expected_validator
+
+
+def test_get_part_path() -> None:
+    """Test that partial downloads are kept out of the web root."""
+    file_path = get_app_paths().web_root / "content" / "test" / "test-episode.mp3"
+
+    part_path = get_part_path(file_path)
+
+    assert (
+        part_path == get_app_paths().instance_path / "partial_downloads" / "content" / "test" / "test-episode.mp3.part"
+    )
+    assert not part_path.is_relative_to(get_app_paths().web_root)
+
+
+@pytest.mark.asyncio
+async def test_get_resume_state() -> None:
+    """Test the resume state is only used for the same url, and is discarded otherwise."""
+    part_path = get_part_path(get_app_paths().web_root / "content" / "test" / "test-episode.mp3")
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path.write_bytes(b"012345")
+    partial_download = PartialDownload(url="https://example.com/test.mp3", validator='"abc"')
+    await save_resume_state(part_path, partial_download)
+
+    assert await get_resume_state(part_path, "https://example.com/test.mp3") == (partial_download, 6)
+
+    assert await get_resume_state(part_path, "https://example.com/other.mp3") == (None, 0)
+    assert not part_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_get_resume_state_no_state() -> None:
+    """Test a part file without state can't be resumed."""
+    part_path = get_part_path(get_app_paths().web_root / "content" / "test" / "test-episode.mp3")
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path.write_bytes(b"012345")
+
+    assert await get_resume_state(part_path, "https://example.com/test.mp3") == (None, 0)
+    assert not part_path.exists()
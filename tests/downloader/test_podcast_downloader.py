@@ -1,5 +1,6 @@
 """Tests for PodcastsDownloader functionality."""
 
+import asyncio
 import logging
 import xml.etree.ElementTree as ET
 from http import HTTPStatus
@@ -12,10 +13,13 @@ import pytest
 from anyio import Path as AsyncPath
 
 from archivepodcast.downloader.downloader import PodcastsDownloader
+from archivepodcast.downloader.feed_state import FeedState, get_feed_content_hash, get_podcast_config_hash
 from archivepodcast.downloader.helpers import _ffmpeg_convert_check, check_ffmpeg
+from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.utils.logger import TRACE_LEVEL_NUM
-from tests.constants import TEST_WAV_FILE
-from tests.models.aiohttp import FakeSession
+from tests import FakeExceptionError
+from tests.constants import TEST_RSS_LOCATION, TEST_WAV_FILE
+from tests.models.aiohttp import FakeResponseDef, FakeSession
 
 if TYPE_CHECKING:
     from collections.abc import Callable
@@ -27,6 +31,11 @@ if TYPE_CHECKING:
 else:
     MockerFixture = object
 
+_ASSET_RESPONSES: dict[str, FakeResponseDef] = {
+    "https://pytest.internal/images/test.jpg": {"data": b"jpg", "status": 200},
+    "https://pytest.internal/audio/test.mp3": {"data": b"mp3", "status": 200},
+}
+
 
 @pytest.mark.asyncio
 async def test_init(
@@ -289,7 +298,7 @@ async def test_fetch_podcast_rss_client_error(apd: PodcastsDownloader) -> None:
     """Test that an aiohttp client error during fetch returns None, None."""
 
     class RaisingSession:
-        def get(self, url: str) -> None:
+        def get(self, url: str, **kwargs: Any) -> None:
             raise aiohttp.ClientError
 
     apd._aiohttp_session = RaisingSession()  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
@@ -338,3 +347,250 @@ def test_handle_itunes_owner_tag_defaults(apd: PodcastsDownloader) -> None:
 def test_filename_cleanup(apd: PodcastsDownloader, file_name: str, expected_slug: str) -> None:
     """Test filename cleanup."""
     assert apd._cleanup_file_name(file_name) == expected_slug
+
+
+@pytest.mark.asyncio
+async def test_process_podcast_rss_item_concurrency_limited(
+    apd: PodcastsDownloader, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that items are handled concurrently, but never more than the configured limit at once."""
+    apd._app_config.download.podcast_concurrency = 2
+
+    in_flight = 0
+    max_in_flight = 0
+    handled: list[str] = []
+
+    async def mock_handle_item_tag(self: PodcastsDownloader, channel: ET.Element) -> None:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        for _ in range(3):  # asyncio.sleep is patched out in tests, so yield to the loop manually
+            future = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().call_soon(future.set_result, None)
+            await future
+        handled.append(str(channel.findtext("title")))
+        in_flight -= 1
+
+    monkeypatch.setattr(PodcastsDownloader, "_handle_item_tag", mock_handle_item_tag)
+
+    channel = ET.Element("channel")
+    ET.SubElement(channel, "title").text = "Podcast"
+    for n in range(5):
+        ET.SubElement(ET.SubElement(channel, "item"), "title").text = f"Episode {n}"
+
+    await apd._process_podcast_rss(channel)
+
+    assert max_in_flight == 2
+    assert sorted(handled) == [f"Episode {n}" for n in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_process_podcast_rss_rewrites_each_item(apd: PodcastsDownloader) -> None:
+    """Test that every item gets its own enclosure rewritten when handled concurrently."""
+    apd._aiohttp_session = FakeSession(  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+        responses={f"https://pytest.internal/audio/{n}.mp3": {"data": b"mp3", "status": 200} for n in range(3)}
+    )
+
+    channel = ET.Element("channel")
+    for n in range(3):
+        item = ET.SubElement(channel, "item")
+        ET.SubElement(item, "title").text = f"Part {n}"
+        ET.SubElement(item, "pubDate").text = "Mon, 01 Jan 2020 00:00:01 +0000"
+        ET.SubElement(item, "enclosure", url=f"https://pytest.internal/audio/{n}.mp3", type="audio/mpeg")
+
+    await apd._process_podcast_rss(channel)
+
+    enclosure_urls = [enclosure.attrib["url"] for enclosure in channel.iter("enclosure")]
+    assert enclosure_urls == [f"http://localhost:5100/content/test/20200101-Part-{n}.mp3" for n in range(3)]
+    for n in range(3):
+        assert (get_app_paths().web_root / "content" / "test" / f"20200101-Part-{n}.mp3").is_file()
+
+
+@pytest.mark.asyncio
+async def test_download_podcast_conditional_fetch(apd: PodcastsDownloader, caplog: pytest.LogCaptureFixture) -> None:
+    """Test the validators are captured once the feed is processed, and a matching fetch is not modified."""
+    rss = (Path(TEST_RSS_LOCATION) / "test_valid.rss").read_bytes()
+    session = FakeSession(
+        responses={
+            **_ASSET_RESPONSES,
+            "https://pytest.internal/rss/test_source": {
+                "data": rss,
+                "status": 200,
+                "headers": {"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2020 00:00:01 GMT"},
+            },
+        }
+    )
+    apd._aiohttp_session = session  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+
+    tree = await apd.download_podcast()
+
+    assert tree is not None
+    assert not apd.feed_unchanged
+    assert apd.feed_state == FeedState(
+        etag='"v1"',
+        last_modified="Wed, 01 Jan 2020 00:00:01 GMT",
+        content_hash=get_feed_content_hash(rss),
+        config_hash=get_podcast_config_hash(apd._podcast, apd._app_config),
+    )
+
+    apd_again = PodcastsDownloader(
+        app_config=apd._app_config,
+        s3=False,
+        podcast=apd._podcast,
+        aiohttp_session=session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+        feed_state=apd.feed_state,
+    )
+
+    with caplog.at_level(level=logging.INFO, logger="archivepodcast.downloader"):
+        tree = await apd_again.download_podcast()
+
+    assert tree is None
+    assert apd_again.feed_unchanged
+    assert session.requested_headers["https://pytest.internal/rss/test_source"]["If-None-Match"] == '"v1"'
+    assert "RSS not modified since it was last processed" in caplog.text
+    assert "Unable to download podcast" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_download_podcast_content_unchanged(apd: PodcastsDownloader, caplog: pytest.LogCaptureFixture) -> None:
+    """Test a host without validators serving identical bytes is caught by the content hash."""
+    rss = (Path(TEST_RSS_LOCATION) / "test_valid.rss").read_bytes()
+    session = FakeSession(
+        responses={**_ASSET_RESPONSES, "https://pytest.internal/rss/test_source": {"data": rss, "status": 200}}
+    )
+    apd._aiohttp_session = session  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+
+    tree = await apd.download_podcast()
+
+    assert tree is not None
+    assert apd.feed_state.content_hash == get_feed_content_hash(rss)
+
+    apd_again = PodcastsDownloader(
+        app_config=apd._app_config,
+        s3=False,
+        podcast=apd._podcast,
+        aiohttp_session=session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+        feed_state=apd.feed_state,
+    )
+
+    with caplog.at_level(level=logging.DEBUG, logger="archivepodcast.downloader"):
+        tree = await apd_again.download_podcast()
+
+    assert tree is None
+    assert apd_again.feed_unchanged
+    assert session.requested_headers["https://pytest.internal/rss/test_source"] == {}
+    assert "RSS content unchanged since it was last processed" in caplog.text
+    assert "Downloaded rss feed, processing" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_process_cached_feed(apd: PodcastsDownloader) -> None:
+    """Test the podcast details are filled in from a previously processed feed, without touching its episodes."""
+    apd._podcast.new_name = ""
+    apd._podcast.contact_email = ""
+    tree: ET.ElementTree[ET.Element] = ET.ElementTree(
+        ET.fromstring((Path(TEST_RSS_LOCATION) / "test_valid.rss").read_bytes())
+    )
+    enclosure_urls = [enclosure.attrib["url"] for enclosure in tree.iter("enclosure")]
+
+    await apd.process_cached_feed(tree)
+
+    assert apd._podcast.new_name == "ArchivePodcast Contributors"
+    assert apd._podcast.contact_email == "info@localhost"
+    assert [enclosure.attrib["url"] for enclosure in tree.iter("enclosure")] == enclosure_urls
+
+
+@pytest.mark.asyncio
+async def test_download_podcast_asset_failed(apd: PodcastsDownloader) -> None:
+    """Test the validators aren't kept when an asset fails, so the next run fetches the feed again to retry it."""
+    rss = (Path(TEST_RSS_LOCATION) / "test_valid.rss").read_bytes()
+    apd._aiohttp_session = FakeSession(  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+        responses={"https://pytest.internal/rss/test_source": {"data": rss, "status": 200, "headers": {"ETag": '"v1"'}}}
+    )
+
+    tree = await apd.download_podcast()
+
+    assert tree is not None
+    assert apd.feed_state == FeedState()
+
+
+@pytest.mark.asyncio
+async def test_download_podcast_config_changed(apd: PodcastsDownloader) -> None:
+    """Test the feed is fetched and processed again when the podcast's config changed since the feed state."""
+    rss = (Path(TEST_RSS_LOCATION) / "test_valid.rss").read_bytes()
+    session = FakeSession(
+        responses={
+            **_ASSET_RESPONSES,
+            "https://pytest.internal/rss/test_source": {"data": rss, "status": 200, "headers": {"ETag": '"v1"'}},
+        }
+    )
+    apd._aiohttp_session = session  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+    await apd.download_podcast()
+    assert apd.feed_state.config_hash
+
+    apd_again = PodcastsDownloader(
+        app_config=apd._app_config,
+        s3=False,
+        podcast=apd._podcast.model_copy(update={"new_name": "Renamed"}),
+        aiohttp_session=session,  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+        feed_state=apd.feed_state.model_copy(),
+    )
+    tree = await apd_again.download_podcast()
+
+    assert tree is not None
+    assert not apd_again.feed_unchanged
+    assert session.requested_headers["https://pytest.internal/rss/test_source"] == {}
+    assert apd_again.feed_state.config_hash != apd.feed_state.config_hash
+
+
+@pytest.mark.asyncio
+async def test_handle_enclosure_tag_streamed_wav_failed(apd: PodcastsDownloader) -> None:
+    """Test a wav that fails to stream through ffmpeg keeps its original enclosure, rather than a missing mp3."""
+    apd._app_config.download.stream_wav_transcode = True
+    apd._aiohttp_session = FakeSession(  # type: ignore[assignment]  # ty:ignore[invalid-assignment]
+        responses={
+            "https://example.com/test.wav": {
+                "data": TEST_WAV_FILE[:100],
+                "status": 200,
+                "headers": {"Content-Length": str(len(TEST_WAV_FILE))},
+            },
+        }
+    )
+    enclosure = ET.Element(
+        "enclosure", {"url": "https://example.com/test.wav", "type": "audio/wav", "length": str(len(TEST_WAV_FILE))}
+    )
+
+    await apd._handle_enclosure_tag(enclosure, "Test Episode", "20200101")
+
+    assert enclosure.attrib == {
+        "url": "https://example.com/test.wav",
+        "type": "audio/wav",
+        "length": str(len(TEST_WAV_FILE)),
+    }
+    assert not apd._feed_download_healthy
+
+
+@pytest.mark.asyncio
+async def test_process_podcast_rss_item_fails(
+    apd: PodcastsDownloader, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Test an episode that fails unexpectedly is logged on its own, the other episodes are still processed."""
+    handled: list[str] = []
+
+    async def mock_handle_item_tag(item: ET.Element) -> None:
+        title = item.findtext("title", "")
+        if title == "Bad Episode":
+            raise FakeExceptionError
+        handled.append(title)
+
+    monkeypatch.setattr(apd, "_handle_item_tag", mock_handle_item_tag)
+    channel = ET.fromstring(
+        "<channel><item><title>Bad Episode</title></item><item><title>Good Episode</title></item></channel>"
+    )
+
+    with caplog.at_level(logging.ERROR):
+        await apd._process_podcast_rss(channel)
+
+    assert handled == ["Good Episode"]
+    assert "Unhandled error processing episode: Bad Episode" in caplog.text
+    assert not apd._feed_download_healthy
@@ -0,0 +1,85 @@
+"""Tests for the lite renditions and feed."""
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.downloader.renditions import RenditionBuilder, get_lite_feed_name
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.s3 import s3_get
+from tests.fixtures.episode_assets import EPISODE_KEY, archive_episode, get_episode_asset_builder, get_episode_feed
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+_RENDITION_KEY = "content/test/lite/20200101-Test-Episode.opus"
+_ATOM_LINK_PATH = "channel/{http://www.w3.org/2005/Atom}link"
+_ITUNES_NEW_FEED_URL_PATH = "channel/{http://www.itunes.com/dtds/podcast-1.0.dtd}new-feed-url"
+
+
+def _get_builder(config: ArchivePodcastConfig, *, s3: bool) -> RenditionBuilder:
+    config.podcasts[0].lite_rendition = "opus"
+    return get_episode_asset_builder(RenditionBuilder, config, s3=s3)
+
+
+def test_get_lite_feed_name(get_test_config: Callable[[str], ArchivePodcastConfig]) -> None:
+    """Test the lite feed is served next to the podcast's feed."""
+    assert get_lite_feed_name(get_test_config("testing_true_valid.json").podcasts[0]) == "test-lite"
+
+
+@pytest.mark.asyncio
+async def test_lite_feed_local(get_test_config: Callable[[str], ArchivePodcastConfig], episode_mp3: bytes) -> None:
+    """Test the lite feed only points at a rendition once it exists."""
+    config = get_test_config("testing_true_valid.json")
+    builder = _get_builder(config, s3=False)
+    await archive_episode(config, episode_mp3, s3=False)
+    feed = get_episode_feed(config)
+
+    lite_feed = await builder.get_lite_feed(feed)
+    enclosure = lite_feed.find(".//enclosure")
+    assert enclosure is not None
+    assert enclosure.get("url", "").endswith(EPISODE_KEY)
+    assert lite_feed.findtext("channel/title") == "Test (Lite)"
+    lite_feed_url = f"{config.app.inet_path.encoded_string()}rss/test-lite"
+    atom_link = lite_feed.find(_ATOM_LINK_PATH)
+    assert atom_link is not None
+    assert atom_link.get("href") == lite_feed_url
+    assert lite_feed.findtext(_ITUNES_NEW_FEED_URL_PATH) == lite_feed_url
+
+    assert await builder.build(feed) == 1
+
+    rendition_path = get_app_paths().web_root / _RENDITION_KEY
+    lite_feed = await builder.get_lite_feed(feed)
+    enclosures = lite_feed.findall(".//enclosure")
+    assert enclosures[0].get("url") == f"{config.app.inet_path.encoded_string()}{_RENDITION_KEY}"
+    assert enclosures[0].get("type") == "audio/ogg"
+    assert enclosures[0].get("length") == str(rendition_path.stat().st_size)
+    assert enclosures[1].get("url") == "https://example.com/elsewhere.mp3"
+    assert feed.findtext("channel/title") == "Test"  # The original isn't touched
+    assert feed.findtext(_ITUNES_NEW_FEED_URL_PATH) == f"{config.app.inet_path.encoded_string()}rss/test"
+
+
+@pytest.mark.asyncio
+async def test_lite_feed_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    episode_mp3: bytes,
+) -> None:
+    """Test in s3 mode the lite feed points at the uploaded rendition."""
+    config = get_test_config("testing_true_valid_s3.json")
+    builder = _get_builder(config, s3=True)
+    await archive_episode(config, episode_mp3, s3=True)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    rendition = await s3_get(config.app.s3.bucket, _RENDITION_KEY)
+    lite_feed = await builder.get_lite_feed(get_episode_feed(config))
+    enclosure = lite_feed.find(".//enclosure")
+    assert enclosure is not None
+    assert enclosure.get("url", "").endswith(_RENDITION_KEY)
+    assert enclosure.get("length") == str(len(rendition))
@@ -0,0 +1,117 @@
+"""Tests for the DownloadScheduler."""
+
+import asyncio
+
+import pytest
+
+from archivepodcast.config import AppDownloadConfig
+from archivepodcast.downloader.scheduler import DownloadScheduler
+
+
+async def _yield_to_loop(times: int = 3) -> None:
+    """asyncio.sleep is patched out in tests, so yield to the loop manually."""
+    loop = asyncio.get_running_loop()
+    for _ in range(times):
+        future = loop.create_future()
+        loop.call_soon(future.set_result, None)
+        await future
+
+
+def test_from_config() -> None:
+    """Test that the limits come from the download config."""
+    scheduler = DownloadScheduler.from_config(AppDownloadConfig(global_concurrency=3, host_concurrency=2))
+
+    assert scheduler._max_concurrent == 3
+    assert scheduler._max_per_host == 2
+
+
+@pytest.mark.asyncio
+async def test_global_limit() -> None:
+    """Test that no more than the global limit of downloads run at once."""
+    scheduler = DownloadScheduler(max_concurrent=2, max_per_host=10)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def download(n: int) -> None:
+        nonlocal in_flight, max_in_flight
+        async with scheduler.slot("test", f"https://host{n}.internal/audio.mp3"):
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await _yield_to_loop()
+            in_flight -= 1
+
+    await asyncio.gather(*(download(n) for n in range(6)))
+
+    assert max_in_flight == 2
+    assert scheduler._active == 0
+    assert not scheduler._queues
+
+
+@pytest.mark.asyncio
+async def test_per_host_limit_does_not_block_other_hosts() -> None:
+    """Test that a busy host is capped, while other hosts still get slots."""
+    scheduler = DownloadScheduler(max_concurrent=10, max_per_host=1)
+    in_flight: dict[str, int] = {"busy.internal": 0, "quiet.internal": 0}
+    max_in_flight: dict[str, int] = {"busy.internal": 0, "quiet.internal": 0}
+    order: list[str] = []
+
+    async def download(host: str) -> None:
+        async with scheduler.slot("test", f"https://{host}/audio.mp3"):
+            in_flight[host] += 1
+            max_in_flight[host] = max(max_in_flight[host], in_flight[host])
+            order.append(host)
+            await _yield_to_loop()
+            in_flight[host] -= 1
+
+    await asyncio.gather(download("busy.internal"), download("busy.internal"), download("quiet.internal"))
+
+    assert max_in_flight == {"busy.internal": 1, "quiet.internal": 1}
+    assert order == ["busy.internal", "quiet.internal", "busy.internal"]
+
+
+@pytest.mark.asyncio
+async def test_round_robin_between_podcasts() -> None:
+    """Test that a podcast with a big backlog doesn't starve a podcast that queued later."""
+    scheduler = DownloadScheduler(max_concurrent=1, max_per_host=1)
+    order: list[str] = []
+
+    async def download(podcast: str) -> None:
+        async with scheduler.slot(podcast, "https://cdn.internal/audio.mp3"):
+            order.append(podcast)
+            await _yield_to_loop()
+
+    tasks = [asyncio.create_task(download("big")) for _ in range(4)]
+    await _yield_to_loop(1)  # The big backlog queues first
+    tasks += [asyncio.create_task(download("small")) for _ in range(2)]
+    await asyncio.gather(*tasks)
+
+    assert order == ["big", "big", "small", "big", "small", "big"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_gives_up_its_place() -> None:
+    """Test that cancelling a queued download removes it, and a running one releases its slot."""
+    scheduler = DownloadScheduler(max_concurrent=1, max_per_host=1)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with scheduler.slot("test", "https://cdn.internal/audio.mp3"):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    waiter = asyncio.create_task(hold())
+    await _yield_to_loop()
+
+    assert scheduler._active == 1
+    assert len(scheduler._queues["test"]) == 1
+
+    waiter.cancel()
+    await _yield_to_loop()
+
+    assert not scheduler._queues
+
+    holder.cancel()
+    await _yield_to_loop()
+
+    assert scheduler._active == 0
+    assert not scheduler._active_per_host
@@ -0,0 +1,86 @@
+"""Tests for streaming response bodies to a sink."""
+
+import pytest
+
+from archivepodcast.downloader.constants import MAX_READ_SIZE, MIN_READ_SIZE
+from archivepodcast.downloader.stream import TransferStats, stream_to_sink
+
+
+class RecordingContent:
+    """Content that serves at most chunk_limit bytes per read, and records the requested sizes."""
+
+    def __init__(self, data: bytes, chunk_limit: int | None = None, fail_after: int | None = None) -> None:
+        self._data = data
+        self._position = 0
+        self._chunk_limit = chunk_limit
+        self._fail_after = fail_after
+        self.requested_sizes: list[int] = []
+
+    async def read(self, n: int = -1) -> bytes:
+        self.requested_sizes.append(n)
+        if self._fail_after is not None and self._position >= self._fail_after:
+            msg = "Connection dropped"
+            raise ConnectionError(msg)
+        size = min(n, self._chunk_limit) if self._chunk_limit is not None else n
+        result = self._data[self._position : self._position + size]
+        self._position += len(result)
+        return result
+
+
+@pytest.mark.asyncio
+async def test_stream_to_sink_writes_in_blocks() -> None:
+    """Test the content is written whole, in write_size blocks with the remainder last."""
+    data = bytes(range(256)) * 4096  # 1 MiB
+    written: list[bytes] = []
+
+    async def write(block: bytes) -> None:
+        written.append(block)
+
+    stats = await stream_to_sink(RecordingContent(data), write, write_size=300_000)
+
+    assert b"".join(written) == data
+    assert [len(block) for block in written] == [300_000, 300_000, 300_000, len(data) - 900_000]
+    assert stats.size == len(data)
+
+
+@pytest.mark.asyncio
+async def test_stream_to_sink_adaptive_read_size() -> None:
+    """Test reads grow while they are filled, and shrink back when the network can't keep up."""
+    fast_content = RecordingContent(b"x" * (MAX_READ_SIZE * 3))
+
+    async def write(_: bytes) -> None:
+        pass
+
+    await stream_to_sink(fast_content, write)
+
+    assert fast_content.requested_sizes[0] == MIN_READ_SIZE
+    assert fast_content.requested_sizes[1] == MIN_READ_SIZE * 2
+    assert max(fast_content.requested_sizes) == MAX_READ_SIZE
+
+    slow_content = RecordingContent(b"x" * MIN_READ_SIZE * 4, chunk_limit=1024)
+    await stream_to_sink(slow_content, write)
+
+    assert set(slow_content.requested_sizes) == {MIN_READ_SIZE}
+
+
+@pytest.mark.asyncio
+async def test_stream_to_sink_error_keeps_written_blocks() -> None:
+    """Test an error mid stream still lets the in flight write land, so a resume has everything before it."""
+    data = b"y" * (MIN_READ_SIZE * 8)
+    written: list[bytes] = []
+
+    async def write(block: bytes) -> None:
+        written.append(block)
+
+    with pytest.raises(ConnectionError):
+        await stream_to_sink(RecordingContent(data, fail_after=MIN_READ_SIZE * 3), write, write_size=MIN_READ_SIZE)
+
+    assert len(b"".join(written)) == MIN_READ_SIZE * 3
+
+
+def test_transfer_stats_summary() -> None:
+    """Test the summary shows the throughput and where the time went."""
+    stats = TransferStats(size=10 * 1024 * 1024, elapsed=2.0, network_wait=1.5, sink_wait=0.25)
+
+    assert stats.get_summary() == "10.0 MiB at 5.0 MiB/s, waited 1.50s on the network and 0.25s on the write"
+    assert "0.0 MiB/s" in TransferStats().get_summary()
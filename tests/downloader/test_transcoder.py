@@ -0,0 +1,123 @@
+"""Tests for the TranscodePool."""
+
+import asyncio
+import os
+from typing import TYPE_CHECKING
+
+import pytest
+from ffmpeg.exceptions import FFMpegExecuteError
+
+from archivepodcast.config import AppDownloadConfig
+from archivepodcast.downloader.helpers import get_mp3_conversion
+from archivepodcast.downloader.transcoder import FFMPEG_STDIN, FFMPEG_STDOUT, TranscodePool
+from tests.constants import TEST_WAV_FILE
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from pytest_mock import MockerFixture  # pragma: no cover
+else:
+    MockerFixture = object
+
+
+def _get_content(data: bytes) -> asyncio.StreamReader:
+    content = asyncio.StreamReader()
+    content.feed_data(data)
+    content.feed_eof()
+    return content
+
+
+def test_from_config() -> None:
+    """Test that the limit comes from the download config, with 0 meaning one per core."""
+    assert TranscodePool.from_config(AppDownloadConfig(ffmpeg_concurrency=3))._max_concurrent == 3
+    assert TranscodePool.from_config(AppDownloadConfig())._max_concurrent == (os.cpu_count() or 1)
+
+
+@pytest.mark.asyncio
+async def test_convert_to_mp3(tmp_path: Path) -> None:
+    """Test that a wav is converted to mp3 and the time it took is returned."""
+    wav_path = tmp_path / "test.wav"
+    mp3_path = tmp_path / "test.mp3"
+    wav_path.write_bytes(TEST_WAV_FILE)
+
+    duration = await TranscodePool(max_concurrent=1).convert_to_mp3(wav_path, mp3_path)
+
+    assert mp3_path.stat().st_size > 0
+    assert duration >= 0
+
+
+@pytest.mark.asyncio
+async def test_convert_to_mp3_fails(tmp_path: Path) -> None:
+    """Test that a failed conversion raises with ffmpeg's output."""
+    wav_path = tmp_path / "test.wav"
+    wav_path.write_bytes(b"not a wav file")
+
+    with pytest.raises(FFMpegExecuteError) as exc_info:
+        await TranscodePool(max_concurrent=1).convert_to_mp3(wav_path, tmp_path / "test.mp3")
+
+    assert exc_info.value.retcode != 0
+    assert exc_info.value.stderr
+
+
+@pytest.mark.asyncio
+async def test_run_piped() -> None:
+    """Test that content is fed through ffmpeg's stdin and its stdout is streamed to the writer."""
+    output = bytearray()
+
+    async def write(data: bytes) -> None:
+        output.extend(data)
+
+    stats = await TranscodePool(max_concurrent=1).run_piped(
+        get_mp3_conversion(FFMPEG_STDIN, FFMPEG_STDOUT), _get_content(TEST_WAV_FILE), write, write_size=1024
+    )
+
+    assert stats.size == len(TEST_WAV_FILE)
+    assert output
+
+
+@pytest.mark.asyncio
+async def test_run_piped_fails() -> None:
+    """Test that content ffmpeg can't decode raises with ffmpeg's output."""
+
+    async def write(_data: bytes) -> None:
+        pass
+
+    with pytest.raises(FFMpegExecuteError) as exc_info:
+        await TranscodePool(max_concurrent=1).run_piped(
+            get_mp3_conversion(FFMPEG_STDIN, FFMPEG_STDOUT), _get_content(b"not a wav file"), write
+        )
+
+    assert exc_info.value.stderr
+
+
+@pytest.mark.asyncio
+async def test_limit(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test that no more than the limit of ffmpeg jobs run at once."""
+    pool = TranscodePool(max_concurrent=2)
+    in_flight = 0
+    max_in_flight = 0
+
+    class FakeProcess:
+        returncode = 0
+
+        async def communicate(self) -> tuple[bytes, bytes]:
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            loop = asyncio.get_running_loop()
+            for _ in range(3):  # asyncio.sleep is patched out in tests, so yield to the loop manually
+                future = loop.create_future()
+                loop.call_soon(future.set_result, None)
+                await future
+            in_flight -= 1
+            return b"", b""
+
+    async def fake_run_async_awaitable(*_args: object, **_kwargs: object) -> FakeProcess:
+        return FakeProcess()
+
+    streams = [get_mp3_conversion(tmp_path / f"{n}.wav", tmp_path / f"{n}.mp3") for n in range(5)]
+    mocker.patch.object(type(streams[0]), "run_async_awaitable", fake_run_async_awaitable)  # The streams are frozen
+
+    await asyncio.gather(*(pool.run(stream) for stream in streams))
+
+    assert max_in_flight == 2
@@ -0,0 +1,87 @@
+"""Tests for the waveform peak sidecars."""
+
+import json
+from array import array
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.downloader.waveforms import WAVEFORM_CONTENT_TYPE, PeakReducer, WaveformBuilder
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.s3 import get_s3_client
+from tests.fixtures.episode_assets import archive_episode, get_episode_asset_builder, get_episode_feed
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+_WAVEFORM_KEY = "content/test/20200101-Test-Episode.peaks.json"
+
+
+def test_peak_reducer() -> None:
+    """Test the min and max of each block are found however the samples are chunked, and scaled to 8 bits."""
+    samples = array("h", [0, 256, -512, 1024, 32767, -32768, 0]).tobytes()
+
+    whole = PeakReducer(samples_per_block=2)
+    whole.add(samples)
+    whole.finish()
+    chunked = PeakReducer(samples_per_block=2)
+    for start in range(0, len(samples), 3):  # Chunks that split samples and blocks
+        chunked.add(samples[start : start + 3])
+    chunked.finish()
+
+    peaks = whole.get_peaks(width=10)
+    assert peaks.data == [0, 1, -2, 4, -128, 127, 0, 0]
+    assert peaks.length == 4
+    assert peaks.samples_per_pixel == 2
+    assert chunked.get_peaks(width=10) == peaks
+
+
+def test_peak_reducer_width() -> None:
+    """Test blocks are merged down so the waveform is no wider than asked."""
+    reducer = PeakReducer(samples_per_block=1)
+    reducer.add(array("h", [-256, 256, 0, 512, -512]).tobytes())
+
+    peaks = reducer.get_peaks(width=2)
+
+    assert peaks.data == [-1, 1, -2, 2]
+    assert peaks.length == 2
+    assert peaks.samples_per_pixel == 3
+
+
+@pytest.mark.asyncio
+async def test_build_local(get_test_config: Callable[[str], ArchivePodcastConfig], episode_mp3: bytes) -> None:
+    """Test the waveform is written next to the episode in the audiowaveform format."""
+    config = get_test_config("testing_true_valid.json")
+    builder = get_episode_asset_builder(WaveformBuilder, config, s3=False)
+    await archive_episode(config, episode_mp3, s3=False)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    waveform = json.loads((get_app_paths().web_root / _WAVEFORM_KEY).read_bytes())
+    assert waveform["bits"] == 8
+    assert waveform["length"] > 0
+    assert len(waveform["data"]) == waveform["length"] * 2
+
+
+@pytest.mark.asyncio
+async def test_build_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    episode_mp3: bytes,
+) -> None:
+    """Test in s3 mode the waveform is uploaded as JSON."""
+    config = get_test_config("testing_true_valid_s3.json")
+    builder = get_episode_asset_builder(WaveformBuilder, config, s3=True)
+    await archive_episode(config, episode_mp3, s3=True)
+
+    assert await builder.build(get_episode_feed(config)) == 1
+
+    s3_client = await get_s3_client()
+    s3_object = await s3_client.get_object(Bucket=config.app.s3.bucket, Key=_WAVEFORM_KEY)
+    assert json.loads(await s3_object["Body"].read())["length"] > 0
+    assert s3_object["ContentType"] == WAVEFORM_CONTENT_TYPE
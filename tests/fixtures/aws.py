@@ -1,11 +1,14 @@
+import hashlib
 import os
 from contextlib import asynccontextmanager
 from logging import getLogger
-from typing import TYPE_CHECKING, Self
+from typing import TYPE_CHECKING, Any, Self, TypedDict
 
 import pytest
 from botocore.exceptions import ClientError as S3ClientError
 from types_aiobotocore_s3.type_defs import (
+    CommonPrefixTypeDef,
+    DeleteTypeDef,
     HeadObjectOutputTypeDef,
     ListObjectsV2OutputTypeDef,
     ObjectTypeDef,
@@ -40,22 +43,43 @@ def aws_credentials() -> None:
 
 
 _objects: dict[str, PutObjectRequestBucketPutObjectTypeDef] = {}
+_multipart_uploads: dict[str, MultipartUploadMock] = {}
+_multipart_etags: dict[str, str] = {}  # Key -> ETag, for objects that were uploaded in parts
+
+
+class MultipartUploadMock(TypedDict):
+    Key: str
+    ContentType: str
+    Parts: dict[int, bytes]
 
 
 class PaginatorMock:
     def __init__(self, objects: dict[str, PutObjectRequestBucketPutObjectTypeDef]) -> None:
         self._objects = objects
 
-    def paginate(self, **kwargs: object) -> AsyncGenerator[ListObjectsV2OutputTypeDef]:
+    def paginate(
+        self, Prefix: str = "", Delimiter: str = "", **kwargs: object
+    ) -> AsyncGenerator[ListObjectsV2OutputTypeDef]:
         async def generator() -> AsyncGenerator[ListObjectsV2OutputTypeDef]:
             contents: list[ObjectTypeDef] = []
-            for key, obj in list(self._objects.items()):
+            common_prefixes: list[CommonPrefixTypeDef] = []
+            for key, obj in sorted(self._objects.items()):
+                if not key.startswith(Prefix):
+                    continue
+
+                if Delimiter and Delimiter in key.removeprefix(Prefix):
+                    common_prefix = Prefix + key.removeprefix(Prefix).split(Delimiter)[0] + Delimiter
+                    if {"Prefix": common_prefix} not in common_prefixes:
+                        common_prefixes.append({"Prefix": common_prefix})
+                    continue
+
                 body = obj.get("Body", b"")
                 size = len(body) if isinstance(body, (bytes, str)) else 0
 
                 new_obj: ObjectTypeDef = {
                     "Key": key,
                     "Size": size,
+                    "ETag": _get_object_etag(key, body),
                 }
                 contents.append(new_obj)
 
@@ -79,6 +103,7 @@ class PaginatorMock:
                     "HTTPHeaders": {},
                 },
                 "Contents": contents,
+                "CommonPrefixes": common_prefixes,
             }
 
             yield output
@@ -86,12 +111,33 @@ class PaginatorMock:
         return generator()
 
 
+def _get_etag(body: object) -> str:
+    if isinstance(body, str):
+        body = body.encode()
+    return f'"{hashlib.md5(body if isinstance(body, bytes) else b"", usedforsecurity=False).hexdigest()}"'
+
+
+def _get_object_etag(key: str, body: object) -> str:
+    return _multipart_etags.get(key) or _get_etag(body)
+
+
 class StreamingBodyMock:
     def __init__(self, data: bytes) -> None:
         self._data = data
+        self._position = 0
+
+    async def read(self, amt: int | None = None) -> bytes:
+        end = len(self._data) if amt is None else min(self._position + amt, len(self._data))
+        chunk = self._data[self._position : end]
+        self._position = end
+        return chunk
 
-    async def read(self) -> bytes:
-        return self._data
+    async def iter_chunks(self, chunk_size: int = 1024) -> AsyncGenerator[bytes]:
+        for start in range(0, len(self._data), chunk_size):
+            yield self._data[start : start + chunk_size]
+
+    async def aclose(self) -> None:
+        pass
 
 
 class S3ClientMock:
@@ -111,6 +157,7 @@ class S3ClientMock:
             new_obj: ObjectTypeDef = {
                 "Key": key,
                 "Size": size,
+                "ETag": _get_object_etag(key, body),
             }
             contents.append(new_obj)
 
@@ -140,15 +187,51 @@ class S3ClientMock:
 
     async def put_object(self, Bucket: str, Key: str, Body: str | bytes, ContentType: str = "") -> None:
         _objects[Key] = PutObjectRequestBucketPutObjectTypeDef(Key=Key, Body=Body, ContentType=ContentType)
+        _multipart_etags.pop(Key, None)
 
         # Update the s3_file_cache with the new file
         size = len(Body) if hasattr(Body, "__len__") else 0
-        s3_file_cache.add_file(S3File(key=Key, size=size))  # This is to make tests pass, might be a hack
+        s3_file_cache.add_file(
+            S3File(key=Key, size=size, etag=_get_etag(Body))
+        )  # This is to make tests pass, might be a hack
+
+    async def create_multipart_upload(self, Bucket: str, Key: str, ContentType: str = "") -> dict[str, str]:
+        upload_id = f"upload-{len(_multipart_uploads)}"
+        _multipart_uploads[upload_id] = MultipartUploadMock(Key=Key, ContentType=ContentType, Parts={})
+        return {"UploadId": upload_id}
+
+    async def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> dict[str, str]:
+        _multipart_uploads[UploadId]["Parts"][PartNumber] = Body
+        return {"ETag": _get_etag(Body)}
+
+    async def complete_multipart_upload(
+        self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict[str, list[dict[str, Any]]]
+    ) -> dict[str, str]:
+        upload = _multipart_uploads.pop(UploadId)
+        parts = [upload["Parts"][part["PartNumber"]] for part in MultipartUpload["Parts"]]
+        await self.put_object(Bucket=Bucket, Key=Key, Body=b"".join(parts), ContentType=upload["ContentType"])
+
+        # What s3 does, the md5 of the parts' md5s suffixed with the number of parts
+        part_digests = b"".join(hashlib.md5(part, usedforsecurity=False).digest() for part in parts)
+        etag = f'"{hashlib.md5(part_digests, usedforsecurity=False).hexdigest()}-{len(parts)}"'
+        _multipart_etags[Key] = etag
+        s3_file_cache.add_file(S3File(key=Key, size=sum(len(part) for part in parts), etag=etag))
+        return {"ETag": etag}
+
+    async def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str) -> None:
+        _multipart_uploads.pop(UploadId, None)
 
     async def delete_object(self, Bucket: str, Key: str) -> None:
         _objects.pop(Key, None)
+        _multipart_etags.pop(Key, None)
+
+    async def delete_objects(self, Bucket: str, Delete: DeleteTypeDef) -> dict[str, list[dict[str, str]]]:
+        for obj in Delete["Objects"]:
+            _objects.pop(obj["Key"], None)
+            _multipart_etags.pop(obj["Key"], None)
+        return {"Deleted": [{"Key": obj["Key"]} for obj in Delete["Objects"]]}
 
-    async def get_object(self, Bucket: str, Key: str) -> dict[str, StreamingBodyMock]:
+    async def get_object(self, Bucket: str, Key: str, Range: str = "") -> dict[str, Any]:
         wip = _objects.get(Key)
         if wip is None:
             raise S3ClientError(
@@ -157,7 +240,21 @@ class S3ClientMock:
         body = wip.get("Body", b"")
         if isinstance(body, str):
             body = body.encode()
-        return {"Body": StreamingBodyMock(body if isinstance(body, bytes) else b"")}
+        body = body if isinstance(body, bytes) else b""
+        response: dict[str, Any] = {"ContentType": wip.get("ContentType", ""), "ETag": _get_object_etag(Key, body)}
+
+        if Range:  # Only bytes=<start>-<end> and bytes=<start>-
+            start_str, _, end_str = Range.removeprefix("bytes=").partition("-")
+            start, end = int(start_str), min(int(end_str or len(body) - 1), len(body) - 1)
+            if start >= len(body):
+                raise S3ClientError(
+                    operation_name="GetObject",
+                    error_response={"Error": {"Code": "InvalidRange", "Message": "Range Not Satisfiable"}},
+                )
+            response["ContentRange"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start : end + 1]
+
+        return {**response, "Body": StreamingBodyMock(body), "ContentLength": len(body)}
 
     async def head_object(self, Bucket: str, Key: str) -> HeadObjectOutputTypeDef:
         wip = _objects.get(Key)
@@ -168,6 +265,7 @@ class S3ClientMock:
             result: HeadObjectOutputTypeDef = {  # type: ignore[typeddict-item] # ty:ignore[missing-typed-dict-key]
                 "ContentLength": size,
                 "ContentType": content_type,
+                "ETag": _get_object_etag(Key, body),
             }
             return result
 
@@ -214,12 +312,13 @@ class AIOHTTPSessionMock:
 @pytest.fixture
 def mock_get_session(monkeypatch: pytest.MonkeyPatch) -> AWSAioSessionMock:
     """Mock aiobotocore session.get_session to return a mock session. Also returns the session, why not."""
-    global _objects  # ruff: ignore[global-statement]
+    global _objects, _multipart_uploads, _multipart_etags  # ruff: ignore[global-statement]
     _objects = {}
+    _multipart_uploads = {}
+    _multipart_etags = {}
 
     # Also clear the s3_file_cache to ensure tests start fresh
-    s3_file_cache._files = []
-    s3_file_cache._last_cache_time = None
+    s3_file_cache.clear()
 
     mocked_session = AWSAioSessionMock()
 
@@ -0,0 +1,66 @@
+import xml.etree.ElementTree as ET
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.downloader.helpers import convert_to_mp3
+from archivepodcast.downloader.transcoder import TranscodePool
+from archivepodcast.instances.path_cache import s3_file_cache
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.s3 import S3File, s3_put
+from tests.constants import TEST_WAV_FILE
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from archivepodcast.downloader.episode_assets import EpisodeAssetBuilder
+
+EPISODE_KEY = "content/test/20200101-Test-Episode.mp3"
+
+
+@pytest.fixture
+def episode_mp3(tmp_path: Path) -> bytes:
+    """Return an mp3 episode, converted from the test wav."""
+    wav_path = tmp_path / "episode.wav"
+    wav_path.write_bytes(TEST_WAV_FILE)
+    convert_to_mp3(wav_path, tmp_path / "episode.mp3")
+    return (tmp_path / "episode.mp3").read_bytes()
+
+
+def get_episode_feed(config: ArchivePodcastConfig, episode_key: str = EPISODE_KEY) -> ET.ElementTree[ET.Element]:
+    """Get a feed, as the archiver serves it, with an archived episode and one that's hosted elsewhere."""
+    url = f"{config.app.inet_path.encoded_string()}{episode_key}"
+    feed_url = f"{config.app.inet_path.encoded_string()}rss/{config.podcasts[0].name_one_word}"
+    return ET.ElementTree(
+        ET.fromstring(
+            '<rss xmlns:atom="http://www.w3.org/2005/Atom" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+            "<channel><title>Test</title>"
+            f'<atom:link href="{feed_url}" rel="self" type="application/rss+xml" />'
+            f"<itunes:new-feed-url>{feed_url}</itunes:new-feed-url>"
+            f'<item><enclosure url="{url}" type="audio/mpeg" length="1" /></item>'
+            '<item><enclosure url="https://example.com/elsewhere.mp3" type="audio/mpeg" length="1" /></item>'
+            "</channel></rss>"
+        )
+    )
+
+
+async def archive_episode(
+    config: ArchivePodcastConfig, data: bytes, *, s3: bool, episode_key: str = EPISODE_KEY
+) -> None:
+    """Put an episode where the archiver would have, in the web root or the bucket."""
+    if s3:
+        await s3_put(config.app.s3.bucket, episode_key, data, "audio/mpeg")
+        s3_file_cache.add_file(S3File(key=episode_key, size=len(data)))
+        return
+
+    episode_path = get_app_paths().web_root / episode_key
+    episode_path.parent.mkdir(parents=True, exist_ok=True)
+    episode_path.write_bytes(data)
+
+
+def get_episode_asset_builder[T: EpisodeAssetBuilder](
+    builder_class: type[T], config: ArchivePodcastConfig, *, s3: bool
+) -> T:
+    """Get a builder for the first podcast in the config."""
+    return builder_class(config.podcasts[0], config.app, s3=s3, transcode_pool=TranscodePool(max_concurrent=2))
@@ -1,5 +1,5 @@
 from http import HTTPStatus
-from typing import TYPE_CHECKING, Any, Self, TypedDict
+from typing import TYPE_CHECKING, Any, NotRequired, Self, TypedDict
 
 import aiohttp
 
@@ -14,6 +14,7 @@ else:
 class FakeResponseDef(TypedDict):
     status: int
     data: bytes | str
+    headers: NotRequired[dict[str, str]]
 
 
 class FakeContent:
@@ -32,12 +33,13 @@ class FakeContent:
 
 
 class FakeResponse:
-    def __init__(self, data: str | bytes, status: int = 200):
+    def __init__(self, data: str | bytes, status: int = 200, headers: dict[str, str] | None = None):
         if isinstance(data, str):
             self._data = data.encode()
         else:
             self._data = data
         self.status = status
+        self.headers = headers or {}
         self.content = FakeContent(self._data)
 
     def raise_for_status(self) -> None:
@@ -70,14 +72,32 @@ class FakeResponse:
 class FakeSession:
     def __init__(self, responses: dict[str, FakeResponseDef]):
         self.responses = responses
+        self.requested_headers: dict[str, dict[str, str]] = {}
         self.closed = False
 
-    def get(self, url: str, **kwargs: Any) -> FakeResponse:
+    def get(self, url: str, headers: dict[str, str] | None = None, **kwargs: Any) -> FakeResponse:
+        self.requested_headers[url] = headers or {}
         response_def = self.responses.get(url)
         if response_def is None:
             return FakeResponse(data=b"", status=404)
 
-        return FakeResponse(data=response_def["data"], status=response_def["status"])
+        headers = headers or {}
+        response_headers = response_def.get("headers", {})
+        etag = response_headers.get("ETag")
+        if etag is not None and headers.get("If-None-Match") == etag:
+            return FakeResponse(data=b"", status=304, headers=response_headers)
+
+        range_header = headers.get("Range")
+        if range_header and response_headers.get("Accept-Ranges") == "bytes" and headers.get("If-Range") == etag:
+            data = response_def["data"]
+            data = data.encode() if isinstance(data, str) else data
+            start = int(range_header.removeprefix("bytes=").removesuffix("-"))
+            content_range = f"bytes {start}-{len(data) - 1}/{len(data)}"
+            return FakeResponse(
+                data=data[start:], status=206, headers={**response_headers, "Content-Range": content_range}
+            )
+
+        return FakeResponse(data=response_def["data"], status=response_def["status"], headers=response_headers)
 
     async def request(self, method: str, url: str, **kwargs: Any) -> FakeResponse:
         response_def = self.responses.get(url)
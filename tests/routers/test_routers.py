@@ -13,10 +13,15 @@ from fastapi.testclient import TestClient
 
 from archivepodcast.archiver.webpages import Webpages
 from archivepodcast.instances import podcast_archiver
+from archivepodcast.instances.config import get_ap_config
+from archivepodcast.instances.path_cache import s3_file_cache
 from archivepodcast.instances.path_helper import get_app_paths
 from archivepodcast.instances.podcast_archiver import _get_time_until_next_run
+from archivepodcast.utils.content_cache import CONTENT_CACHE_DIRECTORY_NAME
 from archivepodcast.utils.health import PodcastArchiverHealth
+from archivepodcast.utils.s3 import S3_STATE_PREFIX, S3File, get_s3_etag
 from tests.constants import DUMMY_RSS_STR
+from tests.fixtures import aws
 
 if TYPE_CHECKING:
     from collections.abc import Callable
@@ -32,6 +37,8 @@ else:
 
 from tests import FakeExceptionError
 
+_HLS_SEGMENT_KEY = "content/test/hls/20200101-Test-Episode/00000.ts"
+
 
 def test_app_paths(
     apa: PodcastArchiver,
@@ -250,6 +257,171 @@ def test_content_s3(
     response = client_live.get("/content/test/20200101-Test-Episode.mp3")
     assert response.status_code == HTTPStatus.TEMPORARY_REDIRECT
 
+    response = client_live.get("/content/%2E%2E/state/manifest.sqlite3")  # Encoded so the client doesn't resolve it
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_content_s3_cached(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test content is streamed from s3 into the local cache on first request, and served from disk after."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/20200101-Test-Episode.mp3"
+    aws._objects[key] = {"Key": key, "Body": b"0123456789", "ContentType": "audio/mpeg"}
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    response = client_live.get("/content/test/20200101-Test-Episode.mp3", headers={"Range": "bytes=0-"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"0123456789"
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / key).read_bytes() == b"0123456789"
+
+    s3_file_cache.add_file(S3File(key=key, size=10, etag=get_s3_etag(b"0123456789")))
+    del aws._objects[key]  # From here on it has to come from the cache, the s3 file cache says it's unchanged
+
+    response = client_live.get("/content/test/20200101-Test-Episode.mp3", headers={"Range": "bytes=2-5"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.content == b"2345"
+
+    response = client_live.get("/content/test/missing.mp3")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_content_s3_cached_changed(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test cached content is fetched again once the object in s3 has changed."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/20200101-Test-Episode.mp3"
+    aws._objects[key] = {"Key": key, "Body": b"0123456789", "ContentType": "audio/mpeg"}
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    assert client_live.get(f"/{key}").content == b"0123456789"
+
+    aws._objects[key] = {"Key": key, "Body": b"9876543210", "ContentType": "audio/mpeg"}  # Same size, new ETag
+
+    assert client_live.get(f"/{key}").content == b"9876543210"
+    assert (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / key).read_bytes() == b"9876543210"
+
+
+def test_content_s3_cached_range_miss(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a range request for part of an object that isn't cached is passed through to s3, then it's cached."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/20200101-Test-Episode.mp3"
+    aws._objects[key] = {"Key": key, "Body": b"0123456789", "ContentType": "audio/mpeg"}
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    response = client_live.get("/content/test/20200101-Test-Episode.mp3", headers={"Range": "bytes=6-"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.content == b"6789"
+    assert response.headers["content-range"] == "bytes 6-9/10"
+    assert (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / key).read_bytes() == b"0123456789"
+
+    response = client_live.get("/content/test/20200101-Test-Episode.mp3", headers={"Range": "bytes=20-"})
+    assert response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+def test_content_s3_cached_first_range(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the bytes=0-1 a player like Safari starts with gets the object cached, so it's served from disk after."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/20200101-Test-Episode.mp3"
+    aws._objects[key] = {"Key": key, "Body": b"0123456789", "ContentType": "audio/mpeg"}
+    s3_file_cache.add_file(S3File(key=key, size=10, etag=get_s3_etag(b"0123456789")))
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    response = client_live.get(f"/{key}", headers={"Range": "bytes=0-1"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.content == b"01"
+
+    del aws._objects[key]  # From here on it has to come from the cache
+
+    response = client_live.get(f"/{key}")
+    assert response.status_code == HTTPStatus.OK
+    assert response.content == b"0123456789"
+    response = client_live.get(f"/{key}", headers={"Range": "bytes=4-7"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.content == b"4567"
+
+
+def test_content_s3_cached_range_miss_too_big(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a range request for part of an object too big for the cache doesn't fetch the whole object."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/20200101-Test-Episode.mp3"
+    aws._objects[key] = {"Key": key, "Body": b"0" * (1024 * 1024 + 1), "ContentType": "audio/mpeg"}
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    response = client_live.get(f"/{key}", headers={"Range": "bytes=0-1"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.content == b"00"
+    assert not (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / key).exists()
+
+
+def test_content_hls(client_live: TestClient) -> None:
+    """Test HLS playlists and segments are served with their own types, which aren't guessed right."""
+    hls_path = get_app_paths().web_root / "content" / "test" / "hls" / "20200101-Test-Episode"
+    hls_path.mkdir(parents=True)
+    (hls_path / "index.m3u8").write_text("#EXTM3U\n00000.ts\n")
+    (hls_path / "00000.ts").write_bytes(b"segment")
+
+    response = client_live.get("/content/test/hls/20200101-Test-Episode/index.m3u8")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("application/vnd.apple.mpegurl")
+
+    response = client_live.get("/content/test/hls/20200101-Test-Episode/00000.ts")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "video/mp2t"
+    assert response.content == b"segment"
+
+
+def test_content_s3_cached_hls(
+    apa_aws: PodcastArchiver,
+    app_live_s3: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test an HLS segment keeps its type when it's served from the local cache."""
+    monkeypatch.setattr(podcast_archiver, "_ap", apa_aws)
+    monkeypatch.setattr(get_ap_config().app.s3, "content_cache_mb", 1)
+    key = "content/test/hls/20200101-Test-Episode/00000.ts"
+    aws._objects[key] = {"Key": key, "Body": b"segment", "ContentType": "video/mp2t"}
+    client_live = TestClient(app_live_s3, follow_redirects=False)
+
+    response = client_live.get(f"/{key}")
+    assert response.headers["content-type"] == "video/mp2t"
+
+    s3_file_cache.add_file(S3File(key=key, size=len(b"segment"), etag=get_s3_etag(b"segment")))
+    del aws._objects[key]  # From here on it has to come from the cache
+
+    response = client_live.get(f"/{key}")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "video/mp2t"
+
 
 def test_reload_config(
     app: FastAPI,
@@ -351,6 +523,8 @@ async def test_file_list_s3(
 
     async with mock_get_session.create_client("s3") as s3_client:
         await s3_client.put_object(Bucket=apa_aws._app_config.s3.bucket, Key=content_s3_path, Body=b"test")
+        await s3_client.put_object(Bucket=apa_aws._app_config.s3.bucket, Key=f"{S3_STATE_PREFIX}test", Body=b"test")
+        await s3_client.put_object(Bucket=apa_aws._app_config.s3.bucket, Key=_HLS_SEGMENT_KEY, Body=b"test")
 
     # Check that the file is in the cache
     await apa_aws.update_file_cache()
@@ -361,6 +535,8 @@ async def test_file_list_s3(
     file_list = await apa_aws.get_file_list()
     file_cache = file_list.files
     assert content_s3_path in file_cache
+    assert f"{S3_STATE_PREFIX}test" not in file_cache  # The archiver's own state isn't listed
+    assert _HLS_SEGMENT_KEY not in file_cache  # Nor are the HLS segments of episodes
 
     # Check that the file is in filelist.html
     with caplog.at_level(logging.DEBUG):
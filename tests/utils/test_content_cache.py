@@ -0,0 +1,131 @@
+"""Tests for the local content cache."""
+
+import os
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.content_cache import CONTENT_CACHE_DIRECTORY_NAME, ContentCache
+from tests import FakeExceptionError
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+
+async def _chunks(data: bytes, chunk_size: int = 4) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start : start + chunk_size]
+
+
+async def _fill(cache: ContentCache, key: str, data: bytes, max_size: int = 100, etag: str = "") -> bytes:
+    return b"".join([chunk async for chunk in cache.stream_into(key, _chunks(data), len(data), max_size, etag)])
+
+
+@pytest.mark.asyncio
+async def test_stream_into_and_get() -> None:
+    """Test an object is passed through while it's written to the cache, and served from disk after."""
+    cache = ContentCache()
+
+    assert await cache.get("content/test/episode.mp3", len(b"episode data")) is None
+    assert await _fill(cache, "content/test/episode.mp3", b"episode data") == b"episode data"
+
+    cache_path = await cache.get("content/test/episode.mp3", len(b"episode data"))
+    assert cache_path == get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / "content/test/episode.mp3"
+    assert cache_path.read_bytes() == b"episode data"
+    assert cache.get_total_size() == len(b"episode data")
+
+
+@pytest.mark.asyncio
+async def test_evicts_least_recently_used() -> None:
+    """Test the least recently used objects are evicted once the total size goes over the limit."""
+    cache = ContentCache()
+    await _fill(cache, "content/test/1.mp3", b"1" * 40)
+    await _fill(cache, "content/test/2.mp3", b"2" * 40)
+    await cache.get("content/test/1.mp3", 40)  # Now 2 is the least recently used
+
+    await _fill(cache, "content/test/3.mp3", b"3" * 40)
+
+    assert await cache.get("content/test/2.mp3", 40) is None
+    assert await cache.get("content/test/1.mp3", 40) is not None
+    assert await cache.get("content/test/3.mp3", 40) is not None
+    assert cache.get_total_size() == 80
+    assert not (get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / "content/test/2.mp3").exists()
+
+
+@pytest.mark.asyncio
+async def test_not_cached() -> None:
+    """Test objects too big for the cache, or with keys outside it, are passed through without being cached."""
+    cache = ContentCache()
+
+    assert await _fill(cache, "content/test/big.mp3", b"b" * 101) == b"b" * 101
+    assert await _fill(cache, "content/../../escape.mp3", b"escape") == b"escape"
+
+    assert await cache.get("content/test/big.mp3", 101) is None
+    assert cache.get_total_size() == 0
+    assert not (get_app_paths().instance_path.parent / "escape.mp3").exists()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_stream() -> None:
+    """Test a stream that fails part way leaves nothing in the cache."""
+    cache = ContentCache()
+
+    async def _failing_chunks() -> AsyncIterator[bytes]:
+        yield b"part"
+        raise FakeExceptionError
+
+    with pytest.raises(FakeExceptionError):
+        async for _ in cache.stream_into("content/test/episode.mp3", _failing_chunks(), 10, 100):
+            pass
+
+    assert await cache.get("content/test/episode.mp3", 10) is None
+    assert list((get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME).rglob("*.mp3*")) == []
+
+
+@pytest.mark.asyncio
+async def test_loads_existing_cache() -> None:
+    """Test what's already in the cache directory is picked up, oldest first, and partial files are removed."""
+    cache_directory = get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME / "content" / "test"
+    cache_directory.mkdir(parents=True)
+    for number, mtime in ((1, 200), (2, 100)):
+        cache_path = cache_directory / f"{number}.mp3"
+        cache_path.write_bytes(b"x" * 40)
+        os.utime(cache_path, (mtime, mtime))
+    (cache_directory / "3.mp3.part").write_bytes(b"partial")
+    cache = ContentCache()
+
+    await _fill(cache, "content/test/4.mp3", b"4" * 40)
+
+    assert await cache.get("content/test/2.mp3", 40) is None  # The oldest
+    assert await cache.get("content/test/1.mp3", 40) is not None
+    assert not (cache_directory / "3.mp3.part").exists()
+
+
+@pytest.mark.asyncio
+async def test_changed_in_s3() -> None:
+    """Test a cached object is dropped once the object in s3 has a different ETag, or size when there isn't one."""
+    cache = ContentCache()
+    await _fill(cache, "content/test/1.mp3", b"1" * 40, etag='"v1"')
+    await _fill(cache, "content/test/2.mp3", b"2" * 40)
+
+    assert await cache.get("content/test/1.mp3", 40, '"v1"') is not None
+    assert await cache.get("content/test/1.mp3", 40) is not None  # Without an ETag to compare, the size matches
+    assert await cache.get("content/test/1.mp3", 40, '"v2"') is None
+    assert await cache.get("content/test/1.mp3", 40, '"v1"') is None  # Gone for good
+    assert await cache.get("content/test/2.mp3", 40, '"v1"') is not None
+    assert await cache.get("content/test/2.mp3", 41, '"v1"') is None
+
+    assert cache.get_total_size() == 0
+    assert list((get_app_paths().instance_path / CONTENT_CACHE_DIRECTORY_NAME).rglob("*.mp3*")) == []
+
+
+@pytest.mark.asyncio
+async def test_etag_survives_restart() -> None:
+    """Test the ETag of a cached object is picked up again with it."""
+    await _fill(ContentCache(), "content/test/episode.mp3", b"episode data", etag='"v1"')
+    cache = ContentCache()
+
+    assert await cache.get("content/test/episode.mp3", len(b"episode data"), '"v1"') is not None
+    assert cache.get_total_size() == len(b"episode data")  # The ETag isn't counted as an object
+    assert await cache.get("content/test/episode.mp3", len(b"episode data"), '"v2"') is None
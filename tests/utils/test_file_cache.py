@@ -1,8 +1,16 @@
+import os
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import pytest
 
+from archivepodcast.utils import file_cache
 from archivepodcast.utils.file_cache import LocalFileCache
+from archivepodcast.utils.inotify import DirectoryWatcher
+
+if TYPE_CHECKING:
+    from pytest_mock import MockerFixture
 
 
 def test_local_file_cache_init() -> None:
@@ -116,3 +124,153 @@ def test_relative_paths_are_used(tmp_path: Path) -> None:
     # Ensure paths are relative, not absolute
     assert all(not f.is_absolute() for f in files)
     assert Path("file.txt") in files
+
+
+def test_verified_sizes(tmp_path: Path) -> None:
+    """Test that verified sizes are recorded, and survive a refresh only while the file is still there."""
+    web_root = tmp_path / "web_root"
+    web_root.mkdir()
+    (web_root / "kept.txt").write_text("kept")
+    (web_root / "removed.txt").write_text("removed")
+
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+    assert cache.get_size(Path("kept.txt")) is None
+
+    cache.add_file(Path("kept.txt"), 4)
+    cache.add_file(Path("removed.txt"), 7)
+    assert cache.get_size(Path("kept.txt")) == 4
+    assert len(cache.get_all()) == 2
+
+    (web_root / "removed.txt").unlink()
+    cache.refresh(web_root)
+
+    assert cache.get_size(Path("kept.txt")) == 4
+    assert cache.get_size(Path("removed.txt")) is None
+
+
+def test_add_file_doesnt_sort(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test adding new files to a large archive doesn't cost a sort of the whole cache each, only get_all sorts."""
+    web_root = tmp_path / "web_root"
+    web_root.mkdir()
+
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+    for number in range(1000):
+        cache.add_file(Path("content") / "test" / f"{number:05}-episode.mp3")
+    cache.get_all()
+
+    sort_sizes: list[int] = []
+
+    def counting_sorted(files: set[Path]) -> list[Path]:
+        sort_sizes.append(len(files))
+        return sorted(files)
+
+    monkeypatch.setattr(file_cache, "sorted", counting_sorted, raising=False)
+
+    for number in range(100):
+        new_file = Path("content") / "test" / f"new-{number:04}-episode.mp3"
+        assert not cache.check_exists(new_file)
+        cache.add_file(new_file, number)
+        assert cache.check_exists(new_file)
+    assert sort_sizes == []
+
+    files = cache.get_all()
+    assert cache.get_all() is files  # Sorted once, until the next change
+    assert sort_sizes == [1100]
+    assert files == sorted(files)
+
+
+def _make_tree(web_root: Path) -> None:
+    """Create a web root with nested directories, all last modified an hour ago."""
+    for file in (web_root / "index.html", web_root / "content" / "test" / "episode.mp3", web_root / "rss" / "test"):
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.touch()
+
+    an_hour_ago = time.time() - 3600
+    for directory in (web_root, web_root / "content", web_root / "content" / "test", web_root / "rss"):
+        os.utime(directory, (an_hour_ago, an_hour_ago))
+
+
+def test_refresh_matches_rglob(tmp_path: Path) -> None:
+    """Test the scan finds the same files rglob does, not following symlinked directories."""
+    web_root = tmp_path / "web_root"
+    _make_tree(web_root)
+    (web_root / "linked_file.html").symlink_to(web_root / "index.html")
+    (web_root / "linked_directory").symlink_to(web_root / "content")
+
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+
+    expected_files = sorted(path.relative_to(web_root) for path in web_root.rglob("*") if path.is_file())
+    assert cache.get_all() == expected_files
+    assert Path("linked_file.html") in expected_files
+
+
+def test_refresh_skips_unchanged_directories(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test only the directories modified since the last refresh are listed again."""
+    web_root = tmp_path / "web_root"
+    _make_tree(web_root)
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+    scandir_spy = mocker.spy(os, "scandir")
+
+    cache.refresh(web_root)
+
+    assert scandir_spy.call_count == 0
+
+    (web_root / "content" / "test" / "new.mp3").touch()
+    (web_root / "rss" / "test").unlink()
+    cache.refresh(web_root)
+
+    assert sorted(call.args[0] for call in scandir_spy.call_args_list) == [
+        web_root / "content" / "test",
+        web_root / "rss",
+    ]
+    assert cache.get_all() == [Path("content/test/episode.mp3"), Path("content/test/new.mp3"), Path("index.html")]
+
+
+def test_refresh_rescans_recently_modified_directories(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test a directory modified right before a scan is listed again, in case it changed within the same mtime."""
+    web_root = tmp_path / "web_root"
+    web_root.mkdir()
+    (web_root / "index.html").touch()
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+    scandir_spy = mocker.spy(os, "scandir")
+
+    cache.refresh(web_root)
+
+    assert scandir_spy.call_count == 1
+
+
+def test_refresh_watching(tmp_path: Path, mocker: MockerFixture) -> None:
+    """Test that with inotify, directories without events aren't checked at all."""
+    web_root = tmp_path / "web_root"
+    _make_tree(web_root)
+    cache = LocalFileCache()
+    cache.refresh(web_root)
+    try:
+        DirectoryWatcher().close()
+    except OSError:
+        pytest.skip("inotify is not available")
+
+    cache.start_watching()
+    stat_spy = mocker.spy(Path, "stat")
+    scandir_spy = mocker.spy(os, "scandir")
+
+    cache.refresh(web_root)
+
+    assert stat_spy.call_count == 0
+    assert scandir_spy.call_count == 0
+
+    (web_root / "content" / "other").mkdir()
+    (web_root / "content" / "other" / "episode.mp3").touch()
+    cache.refresh(web_root)
+
+    assert Path("content/other/episode.mp3") in cache.get_all()
+
+    cache.stop_watching()
+    cache.refresh(web_root)
+
+    assert Path("content/other/episode.mp3") in cache.get_all()
@@ -9,7 +9,9 @@ from typing import TYPE_CHECKING
 import pytest
 
 from archivepodcast.instances import podcast_archiver
+from archivepodcast.instances.path_cache import s3_file_cache
 from archivepodcast.utils.health import PodcastArchiverHealth
+from archivepodcast.utils.s3 import S3File
 from tests.constants import DUMMY_RSS_STR, TEST_RSS_LOCATION
 
 if TYPE_CHECKING:
@@ -91,3 +93,10 @@ def test_podcast_health_date_formats(caplog: pytest.LogCaptureFixture, date: str
         ap_health.update_podcast_episode_info("test", tree)
 
     assert "Unable to parse pubDate: INVALID" not in caplog.text
+
+
+def test_health_s3_file_cache_memory() -> None:
+    """Test the s3 file cache memory usage is reported."""
+    s3_file_cache.add_file(S3File(key="content/test/episode.mp3", size=1))
+
+    assert PodcastArchiverHealth().get_health().core.s3_file_cache_mb > 0
@@ -0,0 +1,162 @@
+"""Tests for the asset manifest."""
+
+import logging
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from archivepodcast.instances.path_helper import get_app_paths
+from archivepodcast.utils.manifest import (
+    MANIFEST_FILE_NAME,
+    MANIFEST_S3_KEY,
+    RECONCILE_INTERVAL,
+    AssetManifest,
+    ManifestEntry,
+)
+from archivepodcast.utils.s3 import s3_put
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+
+def test_record_and_get() -> None:
+    """Test an entry round trips, and updating it keeps when it was first recorded."""
+    manifest = AssetManifest()
+
+    manifest.record(ManifestEntry(key="content/test/episode.mp3", size=10, source_url="https://example.com/1.mp3"))
+    created_at = manifest.get("content/test/episode.mp3")
+
+    assert created_at is not None
+    assert created_at.source_url == "https://example.com/1.mp3"
+    assert created_at.created_at == created_at.updated_at
+
+    manifest.record(ManifestEntry(key="content/test/episode.mp3", size=20, episode_guid="guid-1"))
+    updated = manifest.get("content/test/episode.mp3")
+
+    assert updated is not None
+    assert updated.size == 20
+    assert updated.episode_guid == "guid-1"
+    assert updated.created_at == created_at.created_at
+    assert manifest.get("content/test/other.mp3") is None
+
+    manifest.close()
+
+
+def test_get_prefix() -> None:
+    """Test only the assets under the prefix are returned, not ones under a prefix starting the same way."""
+    manifest = AssetManifest()
+    for key in ("content/test/b.mp3", "content/test/a.mp3", "content/test2/a.mp3", "content/tesu.mp3"):
+        manifest.record(ManifestEntry(key=key, size=1, content_hash="5d41402abc4b2a76b9719d911017c592"))
+
+    assert [entry.key for entry in manifest.get_prefix("content/test/")] == ["content/test/a.mp3", "content/test/b.mp3"]
+    assert manifest.get_prefix_objects("content/test2/") == [
+        {"Key": "content/test2/a.mp3", "Size": 1, "ETag": '"5d41402abc4b2a76b9719d911017c592"'}
+    ]
+
+    manifest.close()
+
+
+def test_reconcile() -> None:
+    """Test reconciling makes the prefix match the listing, keeping what a listing lacks for unchanged assets."""
+    manifest = AssetManifest()
+    manifest.record(ManifestEntry(key="content/test/kept.mp3", size=4, source_url="https://example.com/kept.mp3"))
+    manifest.record(ManifestEntry(key="content/test/gone.mp3", size=4))
+    manifest.record(ManifestEntry(key="content/test/replaced.mp3", size=3, content_hash="stale"))
+    manifest.record(ManifestEntry(key="content/other/untouched.mp3", size=4))
+    assert manifest.needs_reconcile("content/test/")
+
+    manifest.reconcile(
+        "content/test/",
+        [
+            {"Key": "content/test/kept.mp3", "Size": 4},
+            {"Key": "content/test/new.mp3", "Size": 3, "ETag": '"5d41402abc4b2a76b9719d911017c592"'},
+            {"Key": "content/test/multipart.mp3", "Size": 3, "ETag": '"5d41402abc4b2a76b9719d911017c592-2"'},
+            {"Key": "content/test/replaced.mp3", "Size": 3, "ETag": '"5d41402abc4b2a76b9719d911017c592"'},
+        ],
+    )
+
+    assert [entry.key for entry in manifest.get_prefix("content/test/")] == [
+        "content/test/kept.mp3",
+        "content/test/multipart.mp3",
+        "content/test/new.mp3",
+        "content/test/replaced.mp3",
+    ]
+    kept = manifest.get("content/test/kept.mp3")
+    assert kept is not None
+    assert kept.source_url == "https://example.com/kept.mp3"
+    new = manifest.get("content/test/new.mp3")
+    assert new is not None
+    assert new.content_hash == "5d41402abc4b2a76b9719d911017c592"
+    multipart = manifest.get("content/test/multipart.mp3")
+    assert multipart is not None
+    assert multipart.content_hash == "5d41402abc4b2a76b9719d911017c592-2"
+    replaced = manifest.get("content/test/replaced.mp3")  # Same size, but the ETag changed
+    assert replaced is not None
+    assert replaced.content_hash == "5d41402abc4b2a76b9719d911017c592"
+    assert manifest.get("content/other/untouched.mp3") is not None
+    assert not manifest.needs_reconcile("content/test/")
+    assert manifest.needs_reconcile("content/other/")
+
+    manifest.close()
+
+
+def test_needs_reconcile_after_interval(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a prefix is due a reconciliation again once the interval has passed."""
+    manifest = AssetManifest()
+    manifest.reconcile("content/test/", [])
+
+    reconciled_time = time.time()
+    monkeypatch.setattr(time, "time", lambda: reconciled_time + RECONCILE_INTERVAL)
+
+    assert manifest.needs_reconcile("content/test/")
+
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_save_and_load_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the manifest is uploaded when it changed, and downloaded when the instance directory doesn't have it."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    manifest = AssetManifest()
+    manifest.record(ManifestEntry(key="content/test/episode.mp3", size=10))
+
+    await manifest.save_to_s3(bucket)
+    manifest.close()
+    (get_app_paths().instance_path / MANIFEST_FILE_NAME).unlink()
+
+    await manifest.load_from_s3(bucket)
+
+    entry = manifest.get("content/test/episode.mp3")
+    assert entry is not None
+    assert entry.size == 10
+
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_load_invalid_s3(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """Test a corrupt manifest in s3 is ignored."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    await s3_put(bucket, MANIFEST_S3_KEY, b"NOT SQLITE" * 100, "application/vnd.sqlite3")
+    manifest = AssetManifest()
+
+    with caplog.at_level(logging.WARNING):
+        await manifest.load_from_s3(bucket)
+
+    assert "Manifest from s3 is not valid" in caplog.text
+    assert manifest.get("content/test/episode.mp3") is None
+
+    manifest.close()
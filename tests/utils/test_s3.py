@@ -0,0 +1,500 @@
+"""Tests for the s3 helpers."""
+
+import asyncio
+import hashlib
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from botocore.exceptions import ClientError
+
+from archivepodcast.utils.s3 import (
+    MAX_CACHE_AGE,
+    MULTIPART_RETRY_COUNT,
+    S3File,
+    S3FileCache,
+    S3MultipartUpload,
+    close_s3_client,
+    get_file_s3_etag,
+    get_s3_client,
+    get_s3_etag,
+    get_s3_prefix,
+    run_and_close_s3_client,
+    s3_delete_many,
+    s3_get,
+    s3_put,
+    s3_put_file,
+)
+from tests import FakeExceptionError
+from tests.fixtures import aws
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from archivepodcast.config import ArchivePodcastConfig
+    from tests.fixtures.aws import AWSAioSessionMock
+else:
+    AWSAioSessionMock = object
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the parts are put together in order, even when uploaded concurrently."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+
+    async with S3MultipartUpload(bucket, "content/test/episode.mp3", "audio/mpeg") as upload:
+        await asyncio.gather(
+            upload.upload_part(b"first,"), upload.upload_part(b"second,"), upload.upload_part(b"third")
+        )
+
+    assert upload.size == len(b"first,second,third")
+    assert await s3_get(bucket, "content/test/episode.mp3") == b"first,second,third"
+    assert aws._objects["content/test/episode.mp3"]["ContentType"] == "audio/mpeg"
+    assert not aws._multipart_uploads
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload_empty(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test an upload without any parts still completes, as an empty object."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+
+    async with S3MultipartUpload(bucket, "content/test/empty.mp3", "audio/mpeg"):
+        pass
+
+    assert "content/test/empty.mp3" in aws._objects
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload_aborted(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test an exception in the context aborts the upload, so no partial object is created."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+
+    async def upload_then_fail() -> None:
+        async with S3MultipartUpload(bucket, "content/test/episode.mp3", "audio/mpeg") as upload:
+            await upload.upload_part(b"first,")
+            raise FakeExceptionError
+
+    with pytest.raises(FakeExceptionError):
+        await upload_then_fail()
+
+    assert "content/test/episode.mp3" not in aws._objects
+    assert not aws._multipart_uploads
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload_part_retried(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test a failed part is retried, and the upload fails once the retries run out."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    real_upload_part = aws.S3ClientMock.upload_part
+    attempts = 0
+
+    async def flaky_upload_part(self: aws.S3ClientMock, **kwargs: object) -> dict[str, str]:
+        nonlocal attempts
+        attempts += 1
+        if attempts < MULTIPART_RETRY_COUNT:
+            raise ClientError(operation_name="UploadPart", error_response={"Error": {"Code": "500"}})
+        return await real_upload_part(self, **kwargs)  # type: ignore[arg-type]  # ty:ignore[invalid-argument-type]
+
+    monkeypatch.setattr(aws.S3ClientMock, "upload_part", flaky_upload_part)
+
+    async with S3MultipartUpload(bucket, "content/test/episode.mp3", "audio/mpeg") as upload:
+        await upload.upload_part(b"data")
+
+    assert attempts == MULTIPART_RETRY_COUNT
+    assert await s3_get(bucket, "content/test/episode.mp3") == b"data"
+
+    attempts = -MULTIPART_RETRY_COUNT  # Fails every attempt
+
+    async def upload() -> None:
+        async with S3MultipartUpload(bucket, "content/test/other.mp3", "audio/mpeg") as multipart_upload:
+            await multipart_upload.upload_part(b"data")
+
+    with pytest.raises(ClientError):
+        await upload()
+
+    assert "content/test/other.mp3" not in aws._objects
+
+
+@pytest.mark.asyncio
+async def test_s3_put_file_small(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    tmp_path: Path,
+) -> None:
+    """Test a file under the threshold is uploaded in one go."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    file_path = tmp_path / "episode.mp3"
+    file_path.write_bytes(b"small episode")
+
+    s3_file = await s3_put_file(bucket, "content/test/episode.mp3", file_path, "audio/mpeg")
+
+    assert s3_file.size == len(b"small episode")
+    assert s3_file.etag == get_s3_etag(b"small episode")
+    assert s3_file.etag == await get_file_s3_etag(file_path)
+    assert await s3_get(bucket, "content/test/episode.mp3") == b"small episode"
+
+
+@pytest.mark.asyncio
+async def test_s3_put_file_multipart(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    """Test a file over the threshold is uploaded in parts, with a limited number of parts in flight."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    monkeypatch.setattr("archivepodcast.utils.s3.MULTIPART_THRESHOLD", 100)
+    monkeypatch.setattr("archivepodcast.utils.s3.MULTIPART_PART_SIZE", 100)
+    monkeypatch.setattr("archivepodcast.utils.s3.MULTIPART_CONCURRENCY", 2)
+    data = bytes(range(256)) * 4
+    file_path = tmp_path / "episode.mp3"
+    file_path.write_bytes(data)
+
+    real_upload_part = aws.S3ClientMock.upload_part
+    in_flight = 0
+    max_in_flight = 0
+    part_sizes: list[int] = []
+
+    async def tracked_upload_part(self: aws.S3ClientMock, **kwargs: Any) -> dict[str, str]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        part_sizes.append(len(kwargs["Body"]))
+        loop = asyncio.get_running_loop()
+        for _ in range(3):  # Let the other parts get going
+            future = loop.create_future()
+            loop.call_soon(future.set_result, None)
+            await future
+        in_flight -= 1
+        return await real_upload_part(self, **kwargs)
+
+    monkeypatch.setattr(aws.S3ClientMock, "upload_part", tracked_upload_part)
+
+    s3_file = await s3_put_file(bucket, "content/test/episode.mp3", file_path, "audio/mpeg")
+
+    assert s3_file.size == len(data)
+    assert s3_file.etag.endswith('-11"')
+    assert s3_file.etag == await get_file_s3_etag(file_path)
+    assert await s3_get(bucket, "content/test/episode.mp3") == data
+    assert part_sizes == [100] * 10 + [24]
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_s3_delete_many(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test keys are deleted in batches, with a limited number of batches in flight."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    monkeypatch.setattr("archivepodcast.utils.s3.DELETE_BATCH_SIZE", 2)
+    monkeypatch.setattr("archivepodcast.utils.s3.DELETE_CONCURRENCY", 2)
+    keys = [f"content/test/{number}.mp3" for number in range(5)]
+    for key in [*keys, "content/test/kept.mp3"]:
+        aws._objects[key] = {"Key": key, "Body": b"body"}
+
+    real_delete_objects = aws.S3ClientMock.delete_objects
+    in_flight = 0
+    max_in_flight = 0
+    batch_sizes: list[int] = []
+
+    async def tracked_delete_objects(self: aws.S3ClientMock, **kwargs: Any) -> dict[str, list[dict[str, str]]]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        batch_sizes.append(len(kwargs["Delete"]["Objects"]))
+        loop = asyncio.get_running_loop()
+        for _ in range(3):  # Let the other batches get going
+            future = loop.create_future()
+            loop.call_soon(future.set_result, None)
+            await future
+        in_flight -= 1
+        response = await real_delete_objects(self, **kwargs)
+        if {"Key": keys[0]} in kwargs["Delete"]["Objects"]:  # s3 reports per key failures rather than raising
+            return {"Errors": [{"Key": keys[0], "Code": "AccessDenied", "Message": "Access Denied"}]}
+        return response
+
+    monkeypatch.setattr(aws.S3ClientMock, "delete_objects", tracked_delete_objects)
+
+    deleted_keys = await s3_delete_many(bucket, keys)
+
+    assert sorted(deleted_keys) == keys[1:]
+    assert sorted(batch_sizes) == [1, 2, 2]
+    assert max_in_flight == 2
+    assert list(aws._objects) == ["content/test/kept.mp3"]
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_remove_files(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test deleted objects are removed from the cache, leaving the rest of their prefix."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    for key in ("content/test/episode.mp3", "content/test/empty.mp3", "rss/test"):
+        aws._objects[key] = {"Key": key, "Body": b"body"}
+    cache = S3FileCache()
+    await cache.get_all(bucket)
+
+    cache.remove_files(["content/test/empty.mp3", "content/test/missing.mp3"])
+
+    assert [s3_object["Key"] for s3_object in cache.get_prefix("content/test/")] == ["content/test/episode.mp3"]
+    assert not cache.check_file_exists("content/test/empty.mp3")
+    assert cache.check_file_exists("rss/test")
+
+
+@pytest.mark.asyncio
+async def test_shared_s3_client(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test the s3 client is created once per event loop with the configured pool size, and can be closed."""
+    config = get_test_config("testing_true_valid_s3.json")
+    bucket = config.app.s3.bucket
+    created_configs: list[object] = []
+    real_create_client = mock_get_session.create_client
+
+    def recording_create_client(service_name: str, **kwargs: object) -> Any:
+        created_configs.append(kwargs["config"])
+        return real_create_client(service_name, **kwargs)
+
+    monkeypatch.setattr(mock_get_session, "create_client", recording_create_client)
+
+    s3_client = await get_s3_client()
+    await s3_put(bucket, "test.txt", b"test", "text/plain")
+    assert await s3_get(bucket, "test.txt") == b"test"
+    await s3_delete_many(bucket, ["test.txt"])
+
+    assert await get_s3_client() is s3_client
+    assert len(created_configs) == 1
+    assert created_configs[0].max_pool_connections == config.app.s3.max_pool_connections  # type: ignore[attr-defined]  # ty:ignore[unresolved-attribute]
+
+    await close_s3_client()
+    await close_s3_client()  # Closing again is fine
+
+    assert await get_s3_client() is not s3_client
+    assert len(created_configs) == 2
+
+
+@pytest.mark.asyncio
+async def test_run_and_close_s3_client(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the shared s3 client is closed once the coroutine is done, even if it raised."""
+    config = get_test_config("testing_true_valid_s3.json")
+    bucket = config.app.s3.bucket
+
+    async def _get_client() -> object:
+        await s3_put(bucket, "test.txt", b"test", "text/plain")
+        return await get_s3_client()
+
+    s3_client = await run_and_close_s3_client(_get_client())
+    assert await get_s3_client() is not s3_client
+
+    async def _raise() -> None:
+        await get_s3_client()
+        raise FakeExceptionError
+
+    s3_client = await get_s3_client()
+    with pytest.raises(FakeExceptionError):
+        await run_and_close_s3_client(_raise())
+    assert await get_s3_client() is not s3_client
+
+
+@pytest.mark.parametrize(
+    ("key", "expected_prefix"),
+    [
+        ("content/test/20200101-Episode.mp3", "content/test/"),
+        ("content/test/sub/cover.jpg", "content/test/"),
+        ("content/stray.mp3", "content/"),
+        ("rss/test", "rss/"),
+        ("static/fonts/font.woff2", "static/"),
+        ("index.html", ""),
+    ],
+)
+def test_get_s3_prefix(key: str, expected_prefix: str) -> None:
+    """Test keys are indexed per podcast under content, and per top level directory otherwise."""
+    assert get_s3_prefix(key) == expected_prefix
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_index(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test the key and prefix indexes stay consistent through refreshes and additions."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    await s3_put(bucket, "content/test/episode.mp3", b"episode", "audio/mpeg")
+    await s3_put(bucket, "rss/test", b"rss", "application/rss+xml")
+    cache = S3FileCache()
+
+    assert len(await cache.get_all(bucket)) == 2
+    assert cache.check_file_exists("content/test/episode.mp3", len(b"episode"))
+    assert not cache.check_file_exists("content/test/episode.mp3", 1)
+    assert not cache.check_file_exists("content/test/other.mp3")
+
+    cache.add_file(S3File(key="content/test/cover.jpg", size=3))
+    cache.add_file(S3File(key="content/test/episode.mp3", size=10))  # Replaces, doesn't duplicate
+
+    assert [s3_object["Key"] for s3_object in cache.get_prefix("content/test/")] == [
+        "content/test/cover.jpg",
+        "content/test/episode.mp3",
+    ]
+    assert cache.check_file_exists("content/test/episode.mp3", 10)
+    assert len(await cache.get_all(bucket)) == 3
+
+    cache.clear()
+
+    assert len(await cache.get_all(bucket)) == 2  # Listed again
+    assert not cache.check_file_exists("content/test/cover.jpg")
+    assert cache.get_prefix("content/test/")[0]["Size"] == len(b"episode")
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_compact(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test only the key, size and ETag are kept from the listing, and the memory usage grows with the cache."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    await s3_put(bucket, "content/test/episode.mp3", b"episode", "audio/mpeg")
+    cache = S3FileCache()
+    empty_memory_usage = cache.get_memory_usage()
+
+    s3_objects = await cache.get_all(bucket)
+
+    assert s3_objects == [
+        {
+            "Key": "content/test/episode.mp3",
+            "Size": len(b"episode"),
+            "ETag": f'"{hashlib.md5(b"episode", usedforsecurity=False).hexdigest()}"',
+        }
+    ]
+    assert cache.get_memory_usage() > empty_memory_usage
+
+    cache.add_file(S3File(key="content/test/cover.jpg", size=3))
+
+    assert cache.get_prefix("content/test/")[0] == {"Key": "content/test/cover.jpg", "Size": 3}
+
+
+@pytest.mark.parametrize(
+    "etag",
+    [
+        '"5d41402abc4b2a76b9719d911017c592"',
+        '"5d41402abc4b2a76b9719d911017c592-3"',  # Multipart
+        '"not-an-md5-but-thirty-two-chars"',
+        "",
+    ],
+)
+def test_s3_file_cache_etag(etag: str) -> None:
+    """Test ETags come back out of the cache as they went in."""
+    cache = S3FileCache()
+
+    cache._add_object("rss/test", 1, etag)
+
+    assert cache.get_prefix("rss/")[0].get("ETag", "") == etag
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_check_etag(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test an object only matches the ETag of the same content, even when the size matches."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    aws._objects["rss/test"] = {"Key": "rss/test", "Body": b"<title>Tset</title>"}
+    cache = S3FileCache()
+    await cache.get_all(bucket)
+
+    assert cache.check_file_exists("rss/test", etag=get_s3_etag(b"<title>Tset</title>"))
+    assert not cache.check_file_exists("rss/test", etag=get_s3_etag(b"<title>Test</title>"))
+
+    cache.add_file(S3File(key="rss/other", size=1))  # No ETag, so it can't be told apart from a change
+
+    assert not cache.check_file_exists("rss/other", etag=get_s3_etag(b"a"))
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_refresh_per_prefix(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test each prefix is listed on its own, and only the stale ones are listed again."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    for key in ("index.html", "content/stray.mp3", "content/test/episode.mp3", "content/other/episode.mp3", "rss/test"):
+        aws._objects[key] = {"Key": key, "Body": b"body"}
+    cache = S3FileCache()
+
+    assert len(await cache.get_all(bucket)) == 5
+    assert [s3_object["Key"] for s3_object in cache.get_prefix("")] == ["index.html"]
+    assert [s3_object["Key"] for s3_object in cache.get_prefix("content/")] == ["content/stray.mp3"]
+
+    aws._objects["content/test/new.mp3"] = {"Key": "content/test/new.mp3", "Body": b"new"}
+    aws._objects["content/other/new.mp3"] = {"Key": "content/other/new.mp3", "Body": b"new"}
+    del aws._objects["rss/test"]
+    cache._prefix_cache_times["content/test/"] = datetime.now(tz=UTC) - timedelta(seconds=MAX_CACHE_AGE)
+    cache._prefix_cache_times["rss/"] = datetime.now(tz=UTC) - timedelta(seconds=MAX_CACHE_AGE)
+
+    await cache.get_all(bucket)
+
+    assert cache.check_file_exists("content/test/new.mp3", len(b"new"))
+    assert not cache.check_file_exists("content/other/new.mp3")  # Still fresh, not listed again
+    assert not cache.check_file_exists("rss/test")
+    assert cache.get_prefix("rss/") == []
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_refresh_prefixes(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test a podcast can list just its own prefix, without the rest of the bucket."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    for key in ("content/test/episode.mp3", "content/other/episode.mp3"):
+        aws._objects[key] = {"Key": key, "Body": b"body"}
+    cache = S3FileCache()
+
+    await cache.refresh_prefixes(bucket, ["content/test/"])
+
+    assert cache.check_file_exists("content/test/episode.mp3")
+    assert not cache.check_file_exists("content/other/episode.mp3")
+
+
+@pytest.mark.asyncio
+async def test_s3_file_cache_compacts(
+    get_test_config: Callable[[str], ArchivePodcastConfig],
+    mock_get_session: AWSAioSessionMock,
+) -> None:
+    """Test removed objects are dropped from the arrays once they outnumber the rest, keeping the indexes intact."""
+    bucket = get_test_config("testing_true_valid_s3.json").app.s3.bucket
+    keys = [f"content/test/{number}.mp3" for number in range(10)]
+    for key in [*keys, "rss/test"]:
+        aws._objects[key] = {"Key": key, "Body": key.encode()}
+    cache = S3FileCache()
+    await cache.get_all(bucket)
+
+    for key in keys[:8]:
+        del aws._objects[key]
+    await cache.refresh_prefix(bucket, "content/test/", force=True)
+
+    assert len(cache._keys) == 3
+    assert [s3_object["Key"] for s3_object in cache.get_prefix("content/test/")] == keys[8:]
+    assert cache.check_file_exists("rss/test", len(b"rss/test"))
+    assert not cache.check_file_exists(keys[0])
@@ -1,7 +1,14 @@
 // @vitest-environment happy-dom
 import { describe, expect, test, vi } from "vitest";
 
-import { loadPodcast, playerSetCurrentEpisode, showJSDivs } from "../src/archivepodcast/static/webplayer";
+import {
+  getHlsPlaylistUrl,
+  getWaveformUrl,
+  loadPodcast,
+  loadWaveform,
+  playerSetCurrentEpisode,
+  showJSDivs,
+} from "../src/archivepodcast/static/webplayer";
 
 // region: media mock
 class MockMediaMetadata {
@@ -246,6 +253,130 @@ describe("loadPodcast", () => {
   });
 });
 
+describe("loadWaveform", () => {
+  test("gets the waveform url next to the episode", () => {
+    expect(getWaveformUrl("http://example.com/content/test/episode.mp3")).toBe(
+      "http://example.com/content/test/episode.peaks.json",
+    );
+  });
+
+  test("fetches the waveform and shows it", async () => {
+    document.body.innerHTML = `
+      <p id="podcast_player_podcast_name"></p>
+      <p id="podcast_player_episode_name"></p>
+      <canvas id="podcast-player-waveform" hidden></canvas>
+      <audio id="podcast-audio-player"></audio>
+    `;
+
+    global.fetch = vi.fn().mockResolvedValue({
+      ok: true,
+      json: () => ({ version: 2, channels: 1, bits: 8, length: 2, data: [-10, 10, -20, 20] }),
+    });
+
+    playerSetCurrentEpisode("http://example.com/test.mp3", "audio/mpeg", "Test Episode", "Test Podcast");
+
+    const canvas = await vi.waitUntil(() => document.querySelector("#podcast-player-waveform:not([hidden])"));
+    expect(global.fetch).toHaveBeenCalledWith("http://example.com/test.peaks.json");
+    expect(canvas).not.toBeNull();
+  });
+
+  test("keeps the waveform hidden when the episode has none", async () => {
+    document.body.innerHTML = `
+      <canvas id="podcast-player-waveform"></canvas>
+      <audio id="podcast-audio-player"></audio>
+    `;
+    const player = document.getElementById("podcast-audio-player");
+    player.src = "http://example.com/test.mp3";
+
+    global.fetch = vi.fn().mockResolvedValue({
+      ok: false,
+      status: 404,
+    });
+
+    await loadWaveform("http://example.com/test.mp3");
+
+    expect(document.getElementById("podcast-player-waveform").hidden).toBe(true);
+  });
+
+  test("does nothing without a waveform on the page", async () => {
+    document.body.innerHTML = `<audio id="podcast-audio-player"></audio>`;
+    global.fetch = vi.fn();
+
+    await loadWaveform("http://example.com/test.mp3");
+
+    expect(global.fetch).not.toHaveBeenCalled();
+  });
+});
+
+describe("preferHlsPlaylist", () => {
+  const episodePlayer = `
+    <p id="podcast_player_podcast_name"></p>
+    <p id="podcast_player_episode_name"></p>
+    <audio id="podcast-audio-player" data-hls-playlists></audio>
+  `;
+
+  test("gets the playlist url in the episode's hls directory", () => {
+    expect(getHlsPlaylistUrl("http://example.com/content/test/episode.mp3")).toBe(
+      "http://example.com/content/test/hls/episode/index.m3u8",
+    );
+  });
+
+  test("switches to the playlist when the episode has one", async () => {
+    document.body.innerHTML = episodePlayer;
+    const player = document.getElementById("podcast-audio-player");
+    player.canPlayType = () => "maybe";
+
+    global.fetch = vi.fn().mockResolvedValue({ ok: true });
+
+    playerSetCurrentEpisode("http://example.com/test.mp3", "audio/mpeg", "Test Episode", "Test Podcast");
+
+    await vi.waitUntil(() => player.src.endsWith("index.m3u8"));
+    expect(global.fetch).toHaveBeenCalledWith("http://example.com/hls/test/index.m3u8");
+    expect(player.src).toBe("http://example.com/hls/test/index.m3u8");
+  });
+
+  test("keeps the file once the episode has started playing", async () => {
+    document.body.innerHTML = episodePlayer;
+    const player = document.getElementById("podcast-audio-player");
+    player.canPlayType = () => "maybe";
+    Object.defineProperty(player, "paused", { value: false }); // Still at 0 while it buffers
+
+    global.fetch = vi.fn().mockResolvedValue({ ok: true });
+
+    playerSetCurrentEpisode("http://example.com/test.mp3", "audio/mpeg", "Test Episode", "Test Podcast");
+
+    await vi.waitUntil(() => global.fetch.mock.calls.length > 0);
+    await new Promise((resolve) => setTimeout(resolve, 0));
+    expect(player.src).toBe("http://example.com/test.mp3");
+  });
+
+  test("keeps the file when the episode has no playlist", async () => {
+    document.body.innerHTML = episodePlayer;
+    const player = document.getElementById("podcast-audio-player");
+    player.canPlayType = () => "maybe";
+
+    global.fetch = vi.fn().mockResolvedValue({ ok: false, status: 404 });
+
+    playerSetCurrentEpisode("http://example.com/test.mp3", "audio/mpeg", "Test Episode", "Test Podcast");
+
+    await vi.waitUntil(() => global.fetch.mock.calls.length > 0);
+    expect(player.src).toBe("http://example.com/test.mp3");
+  });
+
+  test("keeps the file when the browser can't play HLS", () => {
+    document.body.innerHTML = episodePlayer;
+    const player = document.getElementById("podcast-audio-player");
+    player.canPlayType = () => "";
+
+    global.fetch = vi.fn();
+
+    playerSetCurrentEpisode("http://example.com/test.mp3", "audio/mpeg", "Test Episode", "Test Podcast");
+
+    expect(global.fetch).not.toHaveBeenCalled();
+    expect(player.src).toBe("http://example.com/test.mp3");
+  });
+});
+
 describe("showJSDivs", () => {
   test("shows podcast select and cover image elements", () => {
     document.body.innerHTML = `